@@ -0,0 +1,127 @@
+"""
+Limitador de banda dos downloads (token bucket).
+
+Um balde global é compartilhado por todos os downloads e, opcionalmente, cada
+download tem o seu próprio balde. Os pedidos de cada balde são atendidos em
+ordem de chegada (FIFO), então os downloads ativos dividem o limite de forma
+equilibrada. O limite global pode variar por horário (BANDWIDTH_SCHEDULE).
+
+Sem nenhum limite configurado, `enabled` é False e o laço de download não
+chama o limitador.
+"""
+import time
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from settings import BANDWIDTH_LIMIT, BANDWIDTH_LIMIT_PER_TASK, BANDWIDTH_SCHEDULE, CHUNK_SIZE
+
+MIN_READ_SIZE = 64 * 1024  # menor leitura por chunk quando há limite
+READS_PER_SECOND = 10  # com limite, cada chunk tem ~1/10 s de tráfego, para o balde não liberar rajadas grandes
+SCHEDULE_CHECK_INTERVAL = 30  # segundos entre consultas à agenda de horários
+
+
+def parse_time(text: str) -> int:
+    """ "HH:MM" -> minutos desde a meia-noite."""
+    hours, minutes = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class TokenBucket:
+    """Balde de tokens em bytes: taxa em bytes/s e capacidade de 1 s de tráfego."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = 0.0  # começa vazio: sem rajada inicial acima do limite
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None  # criado dentro do event loop
+
+    def _refill(self, now: float):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate: float):
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.tokens = min(self.tokens, rate)
+
+    async def consume(self, num_bytes: int):
+        """
+        Debita num_bytes e aguarda até o saldo voltar a zero. O saldo pode ficar
+        negativo (chunk maior que o balde); a espera é proporcional à dívida.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= num_bytes
+            # mesmo com saldo, cede a vez para os outros downloads entrarem na fila
+            await asyncio.sleep(-self.tokens / self.rate if self.tokens < 0 else 0)
+
+
+class BandwidthLimiter:
+    def __init__(self, limit: Optional[float] = BANDWIDTH_LIMIT, per_task: Optional[float] = BANDWIDTH_LIMIT_PER_TASK,
+                 schedule: Sequence[Tuple[str, str, Optional[float]]] = BANDWIDTH_SCHEDULE):
+        self.configure(limit, per_task, schedule)
+
+    def configure(self, limit: Optional[float] = None, per_task: Optional[float] = None,
+                  schedule: Sequence[Tuple[str, str, Optional[float]]] = ()):
+        """
+        limit: limite global em bytes/s fora das janelas da agenda (None = sem limite).
+        per_task: limite de cada download em bytes/s (None = sem limite).
+        schedule: janelas ("HH:MM", "HH:MM", bytes/s ou None); a primeira que
+        contém o horário atual define o limite global. Janelas podem cruzar a meia-noite.
+        """
+        self.limit = limit
+        self.per_task = per_task
+        self.schedule: List[Tuple[int, int, Optional[float]]] = [
+            (parse_time(start), parse_time(end), rate) for start, end, rate in schedule
+        ]
+        self.enabled = bool(limit or per_task or any(rate for _, _, rate in self.schedule))
+        self._bucket: Optional[TokenBucket] = None
+        self._next_check = 0.0
+
+    def current_limit(self, now: Optional[datetime] = None) -> Optional[float]:
+        """Limite global em vigor (bytes/s), considerando a agenda de horários."""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate
+        return self.limit
+
+    def _global_bucket(self) -> Optional[TokenBucket]:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + SCHEDULE_CHECK_INTERVAL
+            rate = self.current_limit()
+            if not rate:
+                self._bucket = None
+            elif self._bucket is None:
+                self._bucket = TokenBucket(rate)
+            elif self._bucket.rate != rate:
+                self._bucket.set_rate(rate)
+        return self._bucket
+
+    def _task_bucket(self, task) -> Optional[TokenBucket]:
+        if not self.per_task:
+            return None
+        if task.bucket is None or task.bucket.rate != self.per_task:
+            task.bucket = TokenBucket(self.per_task)
+        return task.bucket
+
+    def read_size(self, task) -> int:
+        """Tamanho da próxima leitura: menor com limite, para a banda ser liberada aos poucos."""
+        rates = [bucket.rate for bucket in (self._global_bucket(), self._task_bucket(task)) if bucket]
+        if not rates:
+            return CHUNK_SIZE
+        return max(MIN_READ_SIZE, min(CHUNK_SIZE, int(min(rates) / READS_PER_SECOND)))
+
+    async def throttle(self, task, num_bytes: int):
+        """Aguarda a vez do chunk recebido nos baldes do download e global."""
+        task_bucket = self._task_bucket(task)
+        if task_bucket:
+            await task_bucket.consume(num_bytes)
+        bucket = self._global_bucket()
+        if bucket:
+            await bucket.consume(num_bytes)
@@ -0,0 +1,246 @@
+"""
+Benchmark do caminho de download contra a RFB local (benchmarks/fake_rfb.py).
+
+Mede a varredura das listagens (get_cnpj_zip_files, com e sem cache) e os
+downloads (DownloadManager): vazão, tempo de CPU, pico de memória (RSS) e a
+integridade dos arquivos (SHA-256 igual ao do servidor). Com --interromper, os
+downloads são cancelados após N segundos e retomados por um novo
+DownloadManager a partir da fila salva, conferindo a retomada.
+
+Todo o estado (settings, catálogo, fila, índice e eventos) fica numa pasta
+temporária; os arquivos do usuário não são alterados.
+
+Uso:
+    python benchmarks/bench_download.py --tamanho 128 --meses 2025-04
+    python benchmarks/bench_download.py --reset 0.3 --travar 0.1 --travar-segundos 20 --timeout 5
+    python benchmarks/bench_download.py --banda 50 --latencia 0.05 --interromper 3
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+import aiohttp
+
+try:
+    import resource  # indisponível no Windows
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings  # noqa: E402
+from fake_rfb import FakeRFB, add_fault_arguments, faults_from_args, sha256_file  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CRAWL_ATTEMPTS = 20  # varreduras até uma completa, com falhas injetadas nas listagens e HEADs
+
+
+def isolate_state(work_dir: str):
+    """Aponta todos os arquivos de estado do app para work_dir (antes de importar o downloader)."""
+    settings.settings_store.path = os.path.join(work_dir, 'settings.json')
+    settings.catalog_store.path = os.path.join(work_dir, 'rfb_catalog.json')
+    settings.listing_cache_store.path = os.path.join(work_dir, 'rfb_listing_cache.json')
+    settings.queue_store.path = os.path.join(work_dir, 'download_queue.json')
+
+    import manifest
+    import metrics
+    manifest.manifest.db_path = os.path.join(work_dir, 'manifest.db')
+    metrics.events.path = os.path.join(work_dir, 'events.jsonl')
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # macOS informa bytes; Linux, KB
+
+
+def cpu_seconds() -> float:
+    if resource is None:
+        return time.process_time()
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+class Stopwatch:
+    def __enter__(self):
+        self.wall, self.cpu = time.perf_counter(), cpu_seconds()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = cpu_seconds() - self.cpu
+
+
+async def crawl_until_complete(session):
+    """
+    Repete a varredura até ela vir completa. Com --erro5xx, o servidor também
+    responde 503 a listagens e HEADs, que o app não repete (a varredura seguinte
+    refaz o que faltou).
+    """
+    from data_rfb import get_cnpj_zip_files
+
+    for attempt in range(1, CRAWL_ATTEMPTS + 1):
+        try:
+            found = await get_cnpj_zip_files(session)
+        except aiohttp.ClientResponseError as e:
+            if e.status < 500:
+                raise
+            continue
+        if all(f['size'] and f['last_modified'] for files in found.values() for f in files):
+            return found, attempt
+    raise RuntimeError(f"varredura incompleta após {CRAWL_ATTEMPTS} tentativas")
+
+
+async def crawl(session) -> dict:
+    from data_rfb import update_latest_rfb_available
+
+    results = {}
+    for label in ('crawl', 'crawl_cache'):
+        with Stopwatch() as watch:
+            found, attempts = await crawl_until_complete(session)
+        if label == 'crawl':
+            update_latest_rfb_available(found)
+        results[label] = {'wall_s': round(watch.wall, 3), 'cpu_s': round(watch.cpu, 3),
+                          'files': sum(len(files) for files in found.values()), 'attempts': attempts}
+    return results
+
+
+async def download(args, server: FakeRFB) -> dict:
+    import data_download
+    from data_download import DownloadManager
+
+    if args.timeout:
+        data_download.CHUNK_TIMEOUT = args.timeout  # travamentos curtos viram timeout sem esperar o padrão
+
+    manager = DownloadManager()
+    catalog = settings.load_catalog().get('rfb_available', {})
+    tasks = [manager.add_task(f['download_link'], month, f['name'], int(f['size']), last_modified=f.get('last_modified'))
+             for month in args.meses for f in catalog.get(month, [])]
+    total = sum(task.file_size for task in tasks)
+
+    interrupted = None
+    with Stopwatch() as watch:
+        if args.interromper:
+            try:
+                await asyncio.wait_for(manager.start_downloads(), timeout=args.interromper)
+            except asyncio.TimeoutError:
+                await manager.close()
+                # nova instância, como após reiniciar o app: só a fila e os arquivos parciais no disco
+                manager = DownloadManager()
+                restored = manager.restore_queue()
+                interrupted = {'after_s': args.interromper, 'restored': len(restored),
+                               'resumed_bytes': sum(_on_disk(task.dest_path) for task in restored)}
+        await manager.start_downloads()
+        await manager.close()
+
+    completed = 0
+    corrupt = []
+    for task in tasks:
+        source = server.files[(task.month_key, task.filename)]
+        if os.path.exists(task.dest_path) and sha256_file(task.dest_path) == sha256_file(source):
+            completed += 1
+        else:
+            corrupt.append(task.filename)
+
+    from metrics import RETRIES
+    return {
+        'files': len(tasks), 'bytes': total,
+        'wall_s': round(watch.wall, 3), 'cpu_s': round(watch.cpu, 3),
+        'throughput_mb_s': round(total / 1024 ** 2 / watch.wall, 2) if watch.wall else None,
+        'intact': completed, 'mismatched': corrupt,
+        'retries': {key[0]: int(value) for key, value in RETRIES._values.items()},
+        'interrupted': interrupted,
+    }
+
+
+def _on_disk(path: str) -> int:
+    """Bytes já baixados: pelo journal de segmentos (o arquivo é pré-alocado) ou pelo tamanho do parcial."""
+    try:
+        with open(path + settings.SEGMENT_JOURNAL_SUFFIX, 'r') as file:
+            return sum(seg['done'] for seg in json.load(file).get('segments', []))
+    except FileNotFoundError:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0  # journal ilegível: a retomada descarta o arquivo pré-alocado
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='bench_download_')
+    isolate_state(work_dir)
+
+    server = FakeRFB(args.dados, args.meses, int(args.tamanho * 1024 ** 2), faults=faults_from_args(args),
+                     human_sizes=not args.tamanhos_exatos)
+    print("Gerando ZIPs sintéticos...", file=sys.stderr)
+    server.build()
+    url = await server.start()
+    settings.save_settings(os.path.join(work_dir, 'downloads'), url)
+
+    from data_download import DownloadManager
+    crawl_manager = DownloadManager()
+    try:
+        report = {'server': url, 'crawl': await crawl(await crawl_manager.get_session())}
+        await crawl_manager.close()
+        report['download'] = await download(args, server)
+        report['server_requests'] = dict(server.requests)
+        report['faults_injected'] = dict(server.faults.injected)
+        report['peak_rss_mb'] = round(peak_rss_mb(), 1) if resource else None
+    finally:
+        await server.stop()
+        if not args.manter:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def print_report(report: dict):
+    crawl_report, dl = report['crawl'], report['download']
+    print(f"Servidor: {report['server']}")
+    for label, name in (('crawl', 'varredura'), ('crawl_cache', 'varredura (cache)')):
+        c = crawl_report[label]
+        print(f"  {name:<20}{c['wall_s']:>9.3f} s  CPU {c['cpu_s']:.3f} s  {c['files']} arquivos" +
+              (f"  ({c['attempts']} varreduras)" if c['attempts'] > 1 else ''))
+    print(f"  {'downloads':<20}{dl['wall_s']:>9.3f} s  CPU {dl['cpu_s']:.3f} s  "
+          f"{dl['bytes'] / 1024 ** 2:.0f} MB em {dl['files']} arquivos  {dl['throughput_mb_s']} MB/s")
+    print(f"  {'íntegros':<20}{dl['intact']}/{dl['files']}" +
+          (f"  divergentes: {', '.join(dl['mismatched'])}" if dl['mismatched'] else ''))
+    if dl['interrupted']:
+        i = dl['interrupted']
+        print(f"  {'retomada':<20}interrompido após {i['after_s']} s; {i['restored']} downloads retomados "
+              f"com {i['resumed_bytes'] / 1024 ** 2:.1f} MB já no disco")
+    print(f"  {'novas tentativas':<20}{dl['retries'] or '-'}")
+    print(f"  {'falhas injetadas':<20}{report['faults_injected']}")
+    print(f"  {'requisições':<20}{report['server_requests']}")
+    if report['peak_rss_mb'] is not None:
+        print(f"  {'pico de RSS':<20}{report['peak_rss_mb']} MB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dados', default=os.path.join(BENCH_DIR, '.fake_rfb'),
+                        help='pasta dos ZIPs sintéticos (reaproveitados entre execuções)')
+    parser.add_argument('--meses', nargs='+', default=['2025-04'])
+    parser.add_argument('--tamanho', type=float, default=64, help='tamanho base dos ZIPs grandes em MB')
+    parser.add_argument('--tamanhos-exatos', action='store_true', help='listagem com tamanhos em bytes (sem HEAD)')
+    parser.add_argument('--timeout', type=float, help='substitui CHUNK_TIMEOUT (segundos) durante o benchmark')
+    parser.add_argument('--interromper', type=float, help='cancela os downloads após N segundos e retoma')
+    parser.add_argument('--manter', action='store_true', help='mantém a pasta temporária com os arquivos baixados')
+    parser.add_argument('--json', action='store_true', help='imprime o relatório em JSON')
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    download_report = report['download']
+    return 0 if download_report['intact'] == download_report['files'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
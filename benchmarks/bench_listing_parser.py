@@ -0,0 +1,50 @@
+"""
+Micro-benchmark dos parsers de listagem (listing_parser.PARSERS) sobre as
+listagens salvas em benchmarks/fixtures.
+
+Uso:
+    python benchmarks/bench_listing_parser.py [--repeat 7] [--number 200]
+"""
+import os
+import sys
+import timeit
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from listing_parser import PARSERS  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=7, help='número de rodadas (usa a mediana)')
+    parser.add_argument('--number', type=int, default=200, help='execuções por rodada')
+    args = parser.parse_args(argv)
+
+    fixtures = sorted(f for f in os.listdir(FIXTURES_DIR) if f.endswith('.html'))
+    print(f"{'listagem':<20}{'parser':<22}{'entradas':>9}{'com metadata':>14}{'µs/página':>12}{'relativo':>10}")
+    for fixture in fixtures:
+        with open(os.path.join(FIXTURES_DIR, fixture), encoding='utf-8') as file:
+            page = file.read()
+
+        baseline = None
+        for parse in PARSERS:
+            try:
+                entries = parse(page)
+            except ImportError as e:
+                print(f"{fixture:<20}{parse.__name__:<22}  indisponível ({e.name} não instalado)")
+                continue
+            runs = timeit.repeat(lambda: parse(page), repeat=args.repeat, number=args.number)
+            per_page = statistics.median(runs) / args.number * 1e6
+            baseline = baseline or per_page
+            with_meta = sum(1 for e in entries if e['last_modified'] and e['size'] is not None)
+            print(f"{fixture:<20}{parse.__name__:<22}{len(entries):>9}{with_meta:>14}"
+                  f"{per_page:>12.1f}{per_page / baseline:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Regressão do tempo de inicialização (a frio) do app.
+
+Cada execução é um processo Python novo que importa o main.py e carrega a
+interface (main.load_app), como ao abrir o app, sem subir o servidor. Mede o
+tempo total do processo e, com o medidor do startup.py, o custo de cada
+import. Falha (código de saída 1) se a mediana passar do orçamento
+(STARTUP_TIME_BUDGET, ou --orcamento).
+
+O settings.json e o catálogo ficam numa pasta temporária; os arquivos do
+usuário não são alterados.
+
+Uso:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --execucoes 10 --orcamento 1.5 --json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from settings import STARTUP_TIME_BUDGET  # noqa: E402
+
+# executado em cada processo novo: argv = [raiz do projeto, pasta temporária, arquivo do relatório]
+CHILD = """
+import os, sys, json
+root, work_dir, out_path = sys.argv[1:4]
+sys.path.insert(0, root)
+from startup import profiler
+profiler.start()
+import settings
+settings.ENV = 'dev'  # mantém o stdout (em produção o main.py o troca pelo log)
+settings.settings_store.path = os.path.join(work_dir, 'settings.json')
+settings.catalog_store.path = os.path.join(work_dir, 'rfb_catalog.json')
+import main
+main.load_app()
+profiler.stop()
+with open(out_path, 'w') as file:
+    json.dump(profiler.to_dict(), file)
+"""
+
+
+def run_once(work_dir: str, index: int) -> dict:
+    out_path = os.path.join(work_dir, f'imports_{index}.json')
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', CHILD, ROOT, work_dir, out_path], check=True, cwd=work_dir,
+                   stdout=subprocess.DEVNULL)
+    wall = time.perf_counter() - started
+    with open(out_path) as file:
+        return {'wall_s': round(wall, 4), 'imports': json.load(file)}
+
+
+def interpreter_baseline() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - started
+
+
+def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        runs = [run_once(work_dir, i) for i in range(args.execucoes)]
+        baseline = statistics.median(interpreter_baseline() for _ in range(3))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    median = statistics.median(r['wall_s'] for r in runs)
+    # detalhamento da execução mais próxima da mediana
+    typical = min(runs, key=lambda r: abs(r['wall_s'] - median))
+    return {
+        'runs': [r['wall_s'] for r in runs],
+        'median_s': round(median, 4),
+        'interpreter_s': round(baseline, 4),
+        'budget_s': args.orcamento,
+        'within_budget': median <= args.orcamento,
+        'imports': typical['imports'],
+    }
+
+
+def print_report(report: dict):
+    print(f"Inicialização a frio: mediana {report['median_s']:.3f} s em {len(report['runs'])} execuções "
+          f"({', '.join(f'{w:.3f}' for w in report['runs'])})")
+    print(f"  {'interpretador':<20}{report['interpreter_s']:.3f} s (python -c pass)")
+    imports = report['imports']
+    print(f"  {'imports':<20}{imports['elapsed_s']:.3f} s")
+    for item in imports['top_level']:
+        print(f"  {'':<20}{item['cumulative_ms']:>9.1f} ms  {item['module']}")
+    print("  mais lentos (tempo próprio):")
+    for item in imports['slowest']:
+        print(f"  {'':<20}{item['self_ms']:>9.1f} ms  {item['module']}")
+    status = 'dentro do' if report['within_budget'] else 'ACIMA DO'
+    print(f"  {status} orçamento de {report['budget_s']} s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--execucoes', type=int, default=5, help='processos novos medidos')
+    parser.add_argument('--orcamento', type=float, default=STARTUP_TIME_BUDGET,
+                        help='tempo máximo (mediana, em segundos)')
+    parser.add_argument('--json', action='store_true', help='imprime o relatório em JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0 if report['within_budget'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
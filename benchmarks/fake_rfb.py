@@ -0,0 +1,307 @@
+"""
+Servidor local (aiohttp) que imita o portal de dados abertos do CNPJ da RFB.
+
+Serve uma listagem no estilo autoindex do Apache (raiz com pastas "AAAA-MM/" e
+uma listagem por mês) e ZIPs sintéticos válidos, com HEAD, Range (e If-Range), ETag,
+Last-Modified e respostas 304 para GETs condicionais. Falhas podem ser
+injetadas para exercitar as novas tentativas e a retomada do downloader.
+
+Uso avulso (sobe o servidor até Ctrl+C):
+    python benchmarks/fake_rfb.py --porta 8765 --tamanho 64 --reset 0.2
+"""
+import os
+import sys
+import random
+import asyncio
+import hashlib
+import zipfile
+import argparse
+from email.utils import formatdate
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bandwidth import TokenBucket  # noqa: E402
+
+SERVE_CHUNK = 64 * 1024  # bytes escritos por vez na resposta
+GENERATE_CHUNK = 1024 * 1024
+LISTING_DATE = "2025-04-10 12:00"
+
+# (nome, fração do tamanho base): tabelas de referência pequenas e tabelas principais grandes
+DEFAULT_LAYOUT = [
+    ('Cnaes.zip', 0.01), ('Motivos.zip', 0.01), ('Municipios.zip', 0.01), ('Naturezas.zip', 0.01),
+    ('Paises.zip', 0.01), ('Qualificacoes.zip', 0.01), ('Simples.zip', 0.5),
+    ('Empresas0.zip', 1.0), ('Empresas1.zip', 1.0), ('Estabelecimentos0.zip', 1.0), ('Socios0.zip', 1.0),
+]
+
+
+class Faults:
+    """
+    Falhas injetadas pelo servidor. As taxas são a fração das respostas afetadas;
+    o ponto da resposta onde o reset ou o travamento acontece é sorteado.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None, reset_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 30.0, error_rate: float = 0.0,
+                 error_status: int = 503, retry_after: Optional[int] = None, seed: Optional[int] = None):
+        self.latency = latency  # segundos antes de cada resposta
+        self.bandwidth = bandwidth  # bytes/s, somando todas as conexões (None = sem limite)
+        self.reset_rate = reset_rate  # conexão encerrada no meio do corpo
+        self.stall_rate = stall_rate  # corpo para de chegar por stall_seconds
+        self.stall_seconds = stall_seconds
+        self.error_rate = error_rate  # respostas error_status (ex.: 503) no lugar do conteúdo
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.injected: Dict[str, int] = {'reset': 0, 'stall': 0, 'error': 0}
+
+
+def human_size(size: int) -> str:
+    """Tamanho no formato do autoindex do Apache ("84K", "1.2G")."""
+    for unit in ('', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            break
+        size /= 1024
+    return f"{size:.1f}{unit}" if size < 10 and unit else f"{int(size)}{unit}"
+
+
+def generate_zip(path: str, size: int):
+    """ZIP válido (sem compressão) com um CSV de ~size bytes de conteúdo aleatório."""
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+        member_name = os.path.splitext(os.path.basename(path))[0].upper() + '.CSV'
+        with zf.open(member_name, 'w', force_zip64=size > 2 ** 31) as member:
+            remaining = size
+            while remaining > 0:
+                block = min(GENERATE_CHUNK, remaining)
+                member.write(os.urandom(block))
+                remaining -= block
+    os.replace(tmp_path, path)
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(GENERATE_CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FakeRFB:
+    def __init__(self, data_dir: str, months: List[str], base_size: int,
+                 layout: List[Tuple[str, float]] = None, faults: Optional[Faults] = None, human_sizes: bool = True):
+        self.data_dir = data_dir
+        self.months = months
+        self.base_size = base_size
+        self.layout = layout or DEFAULT_LAYOUT
+        self.faults = faults or Faults()
+        self.human_sizes = human_sizes  # tamanhos aproximados, como na RFB, obrigam o cliente a fazer HEAD
+        self.files: Dict[Tuple[str, str], str] = {}
+        self.requests: Dict[str, int] = {'listing': 0, 'listing_304': 0, 'head': 0, 'get': 0, 'range': 0}
+        self.ranges: List[Tuple[str, int]] = []  # (arquivo, primeiro byte) de cada resposta 206
+        self._bucket = TokenBucket(self.faults.bandwidth) if self.faults.bandwidth else None
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ''
+
+    def build(self):
+        """Gera (ou reaproveita) os ZIPs sintéticos em data_dir."""
+        for month in self.months:
+            month_dir = os.path.join(self.data_dir, month)
+            os.makedirs(month_dir, exist_ok=True)
+            for name, fraction in self.layout:
+                path = os.path.join(month_dir, name)
+                size = max(1024, int(self.base_size * fraction))
+                if not os.path.exists(path) or abs(os.path.getsize(path) - size) > 64 * 1024:
+                    generate_zip(path, size)
+                self.files[(month, name)] = path
+
+    # --- listagens ---
+
+    def _listing_row(self, href: str, size_text: str) -> str:
+        return f'<img src="/icons/compressed.gif" alt="[   ]"> <a href="{href}">{href}</a>{" " * max(1, 24 - len(href))}' \
+               f'{LISTING_DATE}  {size_text:>5}  \n'
+
+    def _listing(self, title: str, rows: List[str]) -> str:
+        return (f'<html><head><title>Index of {title}</title></head><body><h1>Index of {title}</h1>'
+                f'<pre><a href="?C=N;O=D">Name</a> <a href="?C=M;O=A">Last modified</a> <a href="?C=S;O=A">Size</a><hr>'
+                f'{"".join(rows)}<hr></pre></body></html>')
+
+    def root_listing(self) -> str:
+        return self._listing('/', [self._listing_row(f'{month}/', '-') for month in self.months])
+
+    def month_listing(self, month: str) -> str:
+        rows = []
+        for name, _ in self.layout:
+            size = os.path.getsize(self.files[(month, name)])
+            rows.append(self._listing_row(name, human_size(size) if self.human_sizes else str(size)))
+        return self._listing(f'/{month}', rows)
+
+    # --- handlers ---
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        faults = self.faults
+        if faults.latency:
+            await asyncio.sleep(faults.latency)
+        if faults.error_rate and faults.random.random() < faults.error_rate:
+            faults.injected['error'] += 1
+            headers = {'Retry-After': str(faults.retry_after)} if faults.retry_after is not None else None
+            return web.Response(status=faults.error_status, headers=headers)
+
+        path = request.path.strip('/')
+        if not path:
+            return self._html(request, self.root_listing())
+        if request.path.endswith('/') and path in self.months:
+            return self._html(request, self.month_listing(path))
+        month, _, name = path.partition('/')
+        file_path = self.files.get((month, name))
+        if file_path is None:
+            return web.Response(status=404)
+        return await self._file(request, file_path)
+
+    def _html(self, request: web.Request, body: str) -> web.Response:
+        etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+        self.requests['listing'] += 1
+        if request.headers.get('If-None-Match') == etag:
+            self.requests['listing_304'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=body, content_type='text/html', headers={'ETag': etag})
+
+    @staticmethod
+    def _if_range_matches(request: web.Request, headers: dict, stat: os.stat_result) -> bool:
+        """If-Range ausente ou da versão atual; caso contrário o Range é ignorado (resposta 200 completa)."""
+        value = request.headers.get('If-Range')
+        if not value or value == headers['ETag']:
+            return True
+        when = request.if_range
+        return when is not None and int(when.timestamp()) == int(stat.st_mtime)
+
+    async def _file(self, request: web.Request, path: str) -> web.StreamResponse:
+        size = os.path.getsize(path)
+        stat = os.stat(path)
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': 'application/zip',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'ETag': f'"{stat.st_mtime_ns:x}-{size:x}"',
+        }
+        if request.method == 'HEAD':
+            self.requests['head'] += 1
+            return web.Response(headers={**headers, 'Content-Length': str(size)})
+
+        self.requests['get'] += 1
+        start, stop, status = 0, size, 200
+        if 'Range' in request.headers and self._if_range_matches(request, headers, stat):
+            self.requests['range'] += 1
+            try:
+                rng = request.http_range
+            except ValueError:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            start = rng.start or 0
+            stop = size if rng.stop is None else min(rng.stop, size)
+            if start < 0:  # sufixo: bytes=-N
+                start, stop = max(0, size + start), size
+            if start >= size or start >= stop:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            status = 206
+            self.ranges.append((os.path.basename(path), start))
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+        length = stop - start
+        response = web.StreamResponse(status=status, headers={**headers, 'Content-Length': str(length)})
+        await response.prepare(request)
+
+        faults = self.faults
+        reset_at = faults.random.randrange(length) if faults.reset_rate and faults.random.random() < faults.reset_rate else None
+        stall_at = faults.random.randrange(length) if faults.stall_rate and faults.random.random() < faults.stall_rate else None
+
+        sent = 0
+        try:
+            with open(path, 'rb') as file:
+                file.seek(start)
+                while sent < length:
+                    data = file.read(min(SERVE_CHUNK, length - sent))
+                    if reset_at is not None and sent + len(data) > reset_at:
+                        faults.injected['reset'] += 1
+                        request.transport.close()  # encerra a conexão sem completar o corpo
+                        return response
+                    if stall_at is not None and sent + len(data) > stall_at:
+                        faults.injected['stall'] += 1
+                        stall_at = None
+                        await asyncio.sleep(faults.stall_seconds)
+                    if self._bucket:
+                        await self._bucket.consume(len(data))
+                    await response.write(data)
+                    sent += len(data)
+            await response.write_eof()
+        except (ConnectionResetError, ConnectionError):
+            pass  # o cliente desistiu (ex.: timeout durante um travamento)
+        return response
+
+    # --- ciclo de vida ---
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        actual_port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{actual_port}/"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos antes de cada resposta')
+    parser.add_argument('--banda', type=float, help='limite de banda do servidor em MB/s')
+    parser.add_argument('--reset', type=float, default=0.0, help='fração das respostas interrompidas no meio')
+    parser.add_argument('--travar', type=float, default=0.0, help='fração das respostas que param de enviar dados')
+    parser.add_argument('--travar-segundos', type=float, default=30.0, help='duração de cada travamento')
+    parser.add_argument('--erro5xx', type=float, default=0.0, help='fração das respostas com HTTP 503')
+    parser.add_argument('--retry-after', type=int, help='Retry-After enviado nas respostas 503')
+    parser.add_argument('--semente', type=int, help='semente das falhas sorteadas (reprodutível)')
+
+
+def faults_from_args(args) -> Faults:
+    return Faults(latency=args.latencia, bandwidth=args.banda * 1024 ** 2 if args.banda else None,
+                  reset_rate=args.reset, stall_rate=args.travar, stall_seconds=args.travar_segundos,
+                  error_rate=args.erro5xx, retry_after=args.retry_after, seed=args.semente)
+
+
+async def serve_forever(args):
+    server = FakeRFB(args.dados, args.meses, int(args.tamanho * 1024 ** 2), faults=faults_from_args(args))
+    print("Gerando ZIPs sintéticos...")
+    server.build()
+    url = await server.start(port=args.porta)
+    print(f"RFB local em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--dados', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fake_rfb'),
+                        help='pasta dos ZIPs sintéticos (reaproveitados entre execuções)')
+    parser.add_argument('--meses', nargs='+', default=['2025-03', '2025-04'])
+    parser.add_argument('--tamanho', type=float, default=64, help='tamanho base dos ZIPs grandes em MB')
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+"""
+Linha de comando do DownloadCNPJ, para uso sem interface gráfica (servidores, cron).
+
+Não importa o NiceGUI: usa diretamente data_rfb e o DownloadManager.
+
+Exemplos:
+    python cli.py list --atualizar
+    python cli.py sync 2025-04
+    python cli.py sync 2025-04 --primeiro Empresas0.zip Socios0.zip
+    python cli.py resume --ordem by_table
+    python cli.py --json verify 2025-04
+    python cli.py dedupe --aplicar
+    python cli.py mirror --porta 8090
+    python cli.py sources 2025-04 --arquivo Cnaes.zip
+    python cli.py status
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from logs import setup_console_logging
+from settings import check_settings_file, load_settings, load_catalog, BANDWIDTH_SCHEDULE, MIRROR_HOST
+
+
+def emit(args, event: dict, text: str):
+    """Imprime um evento como JSON (uma linha) ou como texto simples."""
+    if args.json:
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+    else:
+        print(text, flush=True)
+
+
+def sorted_months(rfb_data: dict) -> list:
+    return sorted(rfb_data.keys(), key=lambda x: datetime.strptime(x, '%Y-%m'), reverse=True)
+
+
+def month_summary(download_path: str, month_key: str, files: list) -> dict:
+    # import tardio: só os comandos que consultam o disco precisam do data_rfb
+    from data_rfb import check_data_download
+
+    ok = [f['name'] for f in files if check_data_download(download_path, month_key, f['name'], int(f['size']))]
+    return {
+        'month': month_key,
+        'files': len(files),
+        'downloaded': len(ok),
+        'size': sum(int(f.get('size', 0)) for f in files),
+        'missing': [f['name'] for f in files if f['name'] not in ok],
+    }
+
+
+def cmd_list(args) -> int:
+    from data_rfb import atualizar_rfb_data
+    from data_download import format_size
+
+    if args.atualizar:
+        asyncio.run(atualizar_rfb_data(manual=True))
+
+    settings = load_settings()
+    rfb_data = load_catalog().get('rfb_available', {})
+    download_path = settings.get('download_path', '')
+    for month_key in sorted_months(rfb_data):
+        summary = month_summary(download_path, month_key, rfb_data[month_key])
+        emit(args, {'event': 'month', **summary},
+             f"{month_key}  {summary['downloaded']}/{summary['files']} arquivos  {format_size(summary['size'])}")
+    return 0
+
+
+def cmd_status(args) -> int:
+    from leases import active_leases
+
+    settings = load_settings()
+    catalog = load_catalog()
+    rfb_data = catalog.get('rfb_available', {})
+    download_path = settings.get('download_path', '')
+    months = [month_summary(download_path, m, rfb_data[m]) for m in sorted_months(rfb_data)]
+    complete = sum(1 for m in months if m['downloaded'] == m['files'])
+    leases = active_leases(download_path)
+
+    emit(args, {
+        'event': 'status',
+        'download_path': download_path,
+        'rfb_url': settings.get('rfb_url', ''),
+        'sources': settings.get('sources', []),
+        'rfb_last_check': catalog.get('rfb_last_check', ''),
+        'months': len(months),
+        'months_complete': complete,
+        'leases': leases,
+    }, "\n".join([
+        f"Pasta de downloads: {download_path}",
+        f"URL Receita Federal: {settings.get('rfb_url', '')}",
+    ] + [f"Outra fonte: {url}" for url in settings.get('sources', [])] + [
+        f"Última verificação: {catalog.get('rfb_last_check') or 'nunca'}",
+        f"Meses completos: {complete} de {len(months)}",
+    ] + [f"Em download por {lease.get('owner', '?')}: {lease['month']}/{lease['file']}" for lease in leases]))
+    return 0
+
+
+def cmd_verify(args) -> int:
+    from manifest import manifest
+
+    settings = load_settings()
+    rfb_data = load_catalog().get('rfb_available', {})
+    download_path = settings.get('download_path', '')
+    months = [args.month] if args.month else sorted_months(rfb_data)
+
+    # confere o disco e corrige o índice local (arquivos apagados ou alterados fora do app)
+    manifest.reconcile(download_path, {m: rfb_data[m] for m in months if m in rfb_data}, full=True)
+
+    failed = False
+    for month_key in months:
+        if month_key not in rfb_data:
+            emit(args, {'event': 'error', 'month': month_key, 'error': 'mês não encontrado'},
+                 f"{month_key}: mês não encontrado na base disponível")
+            failed = True
+            continue
+        summary = month_summary(download_path, month_key, rfb_data[month_key])
+        failed = failed or bool(summary['missing'])
+        text = f"{month_key}: {summary['downloaded']}/{summary['files']} arquivos completos"
+        if summary['missing']:
+            text += "\n  faltando: " + ", ".join(summary['missing'])
+        emit(args, {'event': 'verify', **summary}, text)
+
+        if args.zip:
+            complete = [f['name'] for f in rfb_data[month_key] if f['name'] not in summary['missing']]
+            corrupt = asyncio.run(verify_zips(args, download_path, month_key, complete))
+            failed = failed or bool(corrupt)
+    return 1 if failed else 0
+
+
+async def verify_zips(args, download_path: str, month_key: str, names: list) -> list:
+    """Confere o CRC-32 dos ZIPs completos em paralelo (pool de processos). Retorna os corrompidos."""
+    from verification import zip_verifier
+
+    async def check(name):
+        result = await zip_verifier.verify(os.path.join(download_path, month_key, name), use_cache=not args.refazer)
+        emit(args, {'event': 'zip', 'month': month_key, 'file': name, **result},
+             f"  {name}: {'ok' if result['status'] == 'verified' else 'CORROMPIDO — ' + result['error']}")
+        return name if result['status'] != 'verified' else None
+
+    try:
+        results = await asyncio.gather(*(check(name) for name in names))
+    finally:
+        zip_verifier.shutdown()
+    return [name for name in results if name]
+
+
+def cmd_dedupe(args) -> int:
+    from manifest import manifest
+    from dedupe import dedupe_existing
+    from data_download import format_size
+
+    settings = load_settings()
+    download_path = settings.get('download_path', '')
+    # registra no índice arquivos baixados antes dele existir
+    manifest.reconcile(download_path, load_catalog().get('rfb_available', {}))
+
+    pending = 0
+    for row, source, method in dedupe_existing(download_path, apply=args.aplicar):
+        pending += 0 if method else row['size']
+        emit(args, {'event': 'duplicate', 'month': row['month_key'], 'file': row['filename'], 'size': row['size'],
+                    'source': source['month_key'], 'linked': method},
+             f"{row['month_key']}/{row['filename']}: idêntico ao de {source['month_key']} ({format_size(row['size'])})"
+             + (f", substituído por {method}" if method else ""))
+
+    report = manifest.dedupe_report(download_path)
+    for month in report:
+        emit(args, {'event': 'dedupe', **month},
+             f"{month['month_key']}: {month['files']} arquivos reaproveitados, {format_size(month['saved'])} economizados")
+    saved = sum(month['saved'] for month in report)
+    emit(args, {'event': 'dedupe_total', 'saved': saved, 'pending': pending},
+         f"Total economizado: {format_size(saved)}"
+         + (f" (mais {format_size(pending)} em duplicatas; use --aplicar)" if pending else ""))
+    return 0
+
+
+async def run_mirror(args) -> int:
+    from manifest import manifest
+    from mirror import MirrorServer
+
+    download_path = load_settings().get('download_path', '')
+    # registra no índice arquivos baixados antes dele existir, para que também sejam servidos
+    manifest.reconcile(download_path, load_catalog().get('rfb_available', {}))
+    server = MirrorServer(download_path)
+    url = await server.start(args.porta, args.host)
+    emit(args, {'event': 'mirror', 'url': url, 'download_path': download_path},
+         f"Servindo {download_path} em {url} (Ctrl+C para encerrar)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+    return 0
+
+
+async def run_sources(args) -> int:
+    """Mede cada fonte com um arquivo do mês (o mesmo probe feito antes de cada download)."""
+    from data_download import download_manager, format_size
+    from sources import SourceSelector, file_urls, probe, reference, matches, host
+
+    settings = load_settings()
+    rfb_data = load_catalog().get('rfb_available', {})
+    month_key = args.month or next(iter(sorted_months(rfb_data)), None)
+    files = rfb_data.get(month_key, [])
+    entry = next((f for f in files if f['name'] == args.arquivo), None) if args.arquivo else \
+        (min(files, key=lambda f: int(f['size'])) if files else None)
+    if entry is None:
+        emit(args, {'event': 'error', 'month': month_key, 'error': 'arquivo não encontrado'},
+             "Arquivo não encontrado na base disponível (use list --atualizar)")
+        return 1
+
+    urls = file_urls(settings, entry['download_link'], month_key, entry['name'])
+    try:
+        session = await download_manager.get_session()
+        probes = await asyncio.gather(*(probe(session, url, {}) for url in urls))
+    finally:
+        await download_manager.close()
+    size, date = reference(urls[0], probes, int(entry['size']), entry.get('last_modified'))
+    for result in probes:
+        state = 'erro' if result.error else ('ok' if matches(result, size, date) else 'divergente')
+        emit(args, {'event': 'source', 'source': result.url, 'state': state, **result._asdict()},
+             f"{host(result.url)}: {state}" + (f" — {result.error}" if result.error else
+                                              f", {result.ttfb * 1000:.0f} ms até a resposta, "
+                                              f"{format_size(result.throughput)}/s, {result.size} bytes, "
+                                              f"{result.last_modified}"))
+    ranked = SourceSelector().select(urls[0], probes, int(entry['size']), entry.get('last_modified'))
+    emit(args, {'event': 'sources_ranked', 'file': entry['name'], 'sources': ranked},
+         f"Ordem para {month_key}/{entry['name']}: " + " > ".join(host(url) for url in ranked))
+    return 0
+
+
+async def run_sync(args) -> int:
+    from data_download import download_manager
+
+    try:
+        return await sync_month(args, download_manager)
+    finally:
+        await download_manager.close()
+
+
+async def run_resume(args) -> int:
+    from data_download import download_manager
+
+    try:
+        tasks = download_manager.restore_queue()
+        if not tasks:
+            emit(args, {'event': 'queue', 'pending': 0}, "Nenhum download pendente na fila")
+            return 0
+        emit(args, {'event': 'queue', 'pending': len(tasks)}, f"Retomando {len(tasks)} download(s) pendente(s)")
+        return await run_downloads(args, download_manager, tasks)
+    finally:
+        await download_manager.close()
+
+
+async def sync_month(args, download_manager) -> int:
+    from data_rfb import atualizar_rfb_data
+
+    await atualizar_rfb_data(manual=args.atualizar, session=await download_manager.get_session())
+
+    rfb_data = load_catalog().get('rfb_available', {})
+    month_key = args.month or next(iter(sorted_months(rfb_data)), None)
+    if month_key not in rfb_data:
+        emit(args, {'event': 'error', 'month': month_key, 'error': 'mês não encontrado'},
+             f"Mês {month_key} não encontrado na base disponível")
+        return 1
+
+    files = [f for f in rfb_data[month_key] if not args.arquivos or f['name'] in args.arquivos]
+    first = set(args.primeiro or [])
+    tasks = [download_manager.add_task(f['download_link'], month_key, f['name'], int(f['size']), force=args.force,
+                                       last_modified=f.get('last_modified'), priority=1 if f['name'] in first else 0)
+             for f in files]
+    return await run_downloads(args, download_manager, tasks)
+
+
+async def run_downloads(args, download_manager, tasks: list) -> int:
+    """Executa a fila do DownloadManager com as opções da linha de comando e relata o resultado de tasks."""
+    async def report_progress():
+        while True:
+            await asyncio.sleep(args.intervalo)
+            now = time.monotonic()
+            for task in download_manager.tasks:
+                if task.status != "downloading":
+                    continue
+                task.sample_speed(now)
+                emit(args, {
+                    'event': 'progress', 'month': task.month_key, 'file': task.filename,
+                    'downloaded': task.downloaded, 'size': task.file_size,
+                    'speed': round(task.speed), 'eta': round(task.eta) if task.eta else None,
+                }, f"{task.filename} ({task.month_key}): {task.percent}% — {task.progress_text()}")
+
+    if args.parquet:
+        download_manager.convert_to_parquet = True
+    if args.coordenar and download_manager.leases is None:
+        from leases import LeaseManager
+        download_manager.leases = LeaseManager()
+    if args.ordem:
+        download_manager.set_queue_policy(args.ordem)
+    if args.min_downloads or args.max_downloads:
+        concurrency = download_manager.concurrency
+        concurrency.configure(args.min_downloads or concurrency.floor, args.max_downloads or concurrency.ceiling)
+    download_manager.concurrency.on_decision = lambda decision: emit(
+        args, {'event': 'concurrency', **decision},
+        f"Downloads simultâneos: {decision['from']} -> {decision['to']} ({decision['reason']})")
+    if args.limite is not None:
+        limiter = download_manager.limiter
+        limiter.configure(limit=args.limite * 1024 ** 2 or None, per_task=limiter.per_task,
+                          schedule=BANDWIDTH_SCHEDULE)
+
+    metrics_server = None
+    if args.metricas_porta:
+        from metrics import serve_metrics
+        metrics_server = await serve_metrics(args.metricas_porta)
+        emit(args, {'event': 'metrics', 'url': f"http://127.0.0.1:{args.metricas_porta}/metrics"},
+             f"Métricas (Prometheus) em http://127.0.0.1:{args.metricas_porta}/metrics")
+
+    reporter = asyncio.create_task(report_progress())
+    try:
+        await download_manager.start_downloads()
+        await download_manager.wait_conversions()
+    finally:
+        reporter.cancel()
+        if metrics_server:
+            await metrics_server.cleanup()
+
+    for task in tasks:
+        emit(args, {'event': 'result', 'month': task.month_key, 'file': task.filename,
+                    'status': task.status, 'error': task.error_message},
+             f"{task.filename}: {task.status}" + (f" ({task.error_message})" if task.error_message else ""))
+    return 0 if all(task.status == "completed" for task in tasks) else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description='Download da base CNPJ da Receita Federal sem interface gráfica.')
+    parser.add_argument('--json', action='store_true', help='imprime eventos em JSON (uma linha por evento)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help='lista os meses disponíveis')
+    list_parser.add_argument('--atualizar', action='store_true', help='consulta o portal da RFB antes de listar')
+    list_parser.set_defaults(func=cmd_list)
+
+    # opções comuns aos comandos que executam downloads (sync e resume)
+    download_options = argparse.ArgumentParser(add_help=False)
+    download_options.add_argument('--parquet', action='store_true', help='converte os ZIPs baixados para Parquet (requer pyarrow)')
+    download_options.add_argument('--ordem', choices=['small_first', 'large_first', 'by_table', 'fifo'],
+                                  help='ordem da fila (padrão: a última usada)')
+    download_options.add_argument('--min-downloads', type=int, metavar='N', help='piso de downloads simultâneos')
+    download_options.add_argument('--max-downloads', type=int, metavar='N', help='teto de downloads simultâneos')
+    download_options.add_argument('--limite', type=float, metavar='MB/s',
+                                  help='limite global de banda em MB/s (0 = sem limite; a agenda de horários continua valendo)')
+    download_options.add_argument('--metricas-porta', type=int, metavar='PORTA',
+                                  help='expõe as métricas (Prometheus) em http://127.0.0.1:PORTA/metrics durante os downloads')
+    download_options.add_argument('--coordenar', action='store_true',
+                                  help='divide os arquivos com outros nós que baixam para a mesma pasta compartilhada (leases)')
+    download_options.add_argument('--intervalo', type=float, default=5, help='segundos entre relatórios de progresso')
+
+    sync_parser = commands.add_parser('sync', help='baixa os arquivos de um mês', parents=[download_options])
+    sync_parser.add_argument('month', nargs='?', help='mês no formato AAAA-MM (padrão: o mais recente)')
+    sync_parser.add_argument('--arquivos', nargs='+', help='baixa apenas os arquivos informados')
+    sync_parser.add_argument('--force', action='store_true', help='baixa novamente arquivos já completos')
+    sync_parser.add_argument('--primeiro', nargs='+', metavar='ARQUIVO',
+                             help='arquivos que saem antes dos demais, qualquer que seja a ordem (mantido na fila salva)')
+    sync_parser.add_argument('--atualizar', action='store_true', help='força a consulta ao portal da RFB')
+    sync_parser.set_defaults(func=lambda args: asyncio.run(run_sync(args)))
+
+    resume_parser = commands.add_parser('resume', help='retoma os downloads pendentes da fila salva',
+                                        parents=[download_options])
+    resume_parser.set_defaults(func=lambda args: asyncio.run(run_resume(args)))
+
+    verify_parser = commands.add_parser('verify', help='verifica os arquivos baixados')
+    verify_parser.add_argument('month', nargs='?', help='mês no formato AAAA-MM (padrão: todos)')
+    verify_parser.add_argument('--zip', action='store_true', help='confere também o conteúdo (CRC-32) dos ZIPs')
+    verify_parser.add_argument('--refazer', action='store_true', help='ignora verificações já registradas no manifest')
+    verify_parser.set_defaults(func=cmd_verify)
+
+    dedupe_parser = commands.add_parser('dedupe', help='relatório de arquivos reaproveitados entre meses')
+    dedupe_parser.add_argument('--aplicar', action='store_true',
+                               help='troca por links as cópias idênticas já baixadas em meses diferentes')
+    dedupe_parser.set_defaults(func=cmd_dedupe)
+
+    mirror_parser = commands.add_parser('mirror', help='serve a pasta de downloads para outras máquinas da rede local')
+    mirror_parser.add_argument('--porta', type=int, default=8090)
+    mirror_parser.add_argument('--host', default=MIRROR_HOST, help=f'endereço de escuta (padrão: {MIRROR_HOST})')
+    mirror_parser.set_defaults(func=lambda args: asyncio.run(run_mirror(args)))
+
+    sources_parser = commands.add_parser('sources', help='mede e ordena as fontes configuradas (RFB, espelhos, caches)')
+    sources_parser.add_argument('month', nargs='?', help='mês no formato AAAA-MM (padrão: o mais recente)')
+    sources_parser.add_argument('--arquivo', help='arquivo usado na medição (padrão: o menor do mês)')
+    sources_parser.set_defaults(func=lambda args: asyncio.run(run_sources(args)))
+
+    status_parser = commands.add_parser('status', help='mostra configurações e situação dos downloads')
+    status_parser.set_defaults(func=cmd_status)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    check_settings_file()
+    setup_console_logging()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Controle adaptativo do número de downloads simultâneos (AIMD).
+
+Substitui o semáforo fixo: a cada janela de CONCURRENCY_ADJUST_INTERVAL
+segundos o controlador compara a vazão total e a taxa de falhas (timeouts,
+erros HTTP, quedas de conexão, respostas interrompidas) e decide:
+
+- diminuir pela metade (multiplicativo) quando os erros passam do limite,
+  sinal de que o servidor está limitando as conexões;
+- voltar um passo quando o último aumento não trouxe mais vazão;
+- aumentar em um (aditivo) quando todas as vagas estão ocupadas e a vazão
+  se manteve ou cresceu.
+
+O limite fica sempre entre MIN_CONCURRENT_DOWNLOADS e MAX_CONCURRENT_DOWNLOADS.
+Reduções não interrompem downloads em andamento: apenas seguram os próximos.
+"""
+import time
+import asyncio
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Deque, Optional
+from metrics import events
+from settings import (MIN_CONCURRENT_DOWNLOADS, MAX_CONCURRENT_DOWNLOADS, INITIAL_CONCURRENT_DOWNLOADS,
+                      CONCURRENCY_ADJUST_INTERVAL, CONCURRENCY_ERROR_THRESHOLD)
+
+THROUGHPUT_TOLERANCE = 0.1  # variação de vazão considerada ruído entre duas janelas
+
+# causa da falha (retry.error_cause) -> texto do log de decisões
+ERROR_LABELS = {
+    'timeout': 'timeouts',
+    'http': 'erros HTTP',
+    'connection': 'quedas de conexão',
+    'payload': 'respostas interrompidas',
+    'changed': 'arquivos alterados no servidor',
+}
+
+
+class AdaptiveConcurrency:
+    def __init__(self, floor: int = MIN_CONCURRENT_DOWNLOADS, ceiling: int = MAX_CONCURRENT_DOWNLOADS,
+                 initial: int = INITIAL_CONCURRENT_DOWNLOADS):
+        self.limit = initial
+        self.configure(floor, ceiling)
+        self.active = 0
+        self.decisions: Deque[dict] = deque(maxlen=50)  # últimas decisões, para a UI e os logs
+        self.on_decision: Optional[Callable[[dict], None]] = None
+        self._condition: Optional[asyncio.Condition] = None  # criado dentro do event loop
+        self._last_throughput: Optional[float] = None
+        self._last_action = None
+        self._reset_window(time.monotonic())
+
+    def configure(self, floor: int, ceiling: int):
+        if floor < 1 or ceiling < floor:
+            raise ValueError(f"Limites inválidos de downloads simultâneos: mínimo {floor}, máximo {ceiling}")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.limit = min(max(self.limit, floor), ceiling)
+        self.status_text = self._status_text()
+
+    def _reset_window(self, now: float):
+        self._window_start = now
+        self._bytes = 0
+        self._requests = 0
+        self._errors: Counter = Counter()  # falhas por causa
+        self._peak_active = self.active
+
+    # --- Observações (chamadas pelo DownloadManager) ---
+
+    def record_bytes(self, num_bytes: int):
+        self._bytes += num_bytes
+
+    def record_request(self):
+        """Resposta HTTP aceita (início de um download ou segmento)."""
+        self._requests += 1
+
+    def record_error(self, cause: str):
+        """Falha transitória, pela causa de retry.error_cause ('timeout', 'http_503', 'connection'...)."""
+        self._errors['http' if cause.startswith('http_') else cause] += 1
+
+    # --- Vagas ---
+
+    def _cond(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        condition = self._cond()
+        async with condition:
+            self._maybe_adjust()
+            while self.active >= self.limit:
+                try:
+                    # acorda periodicamente para reavaliar o limite mesmo sem downloads terminando
+                    await asyncio.wait_for(condition.wait(), timeout=CONCURRENCY_ADJUST_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._maybe_adjust()
+            self.active += 1
+            self._peak_active = max(self._peak_active, self.active)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._cond()
+        async with condition:
+            self.active -= 1
+            self._maybe_adjust()
+            condition.notify_all()
+
+    # --- Decisão AIMD ---
+
+    def _maybe_adjust(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < CONCURRENCY_ADJUST_INTERVAL:
+            return
+
+        throughput = self._bytes / elapsed
+        errors = sum(self._errors.values())
+        attempts = self._requests + errors
+        error_rate = errors / attempts if attempts else 0.0
+        saturated = self._peak_active >= self.limit
+        previous = self._last_throughput
+
+        if error_rate > CONCURRENCY_ERROR_THRESHOLD:
+            new_limit, action = max(self.floor, self.limit // 2), 'decrease'
+            counts = ", ".join(f"{count} {ERROR_LABELS.get(cause, 'outros erros')}"
+                               for cause, count in self._errors.most_common())
+            reason = f"{counts} em {attempts} requisições"
+        elif (self._last_action == 'increase' and previous
+              and throughput < previous * (1 - THROUGHPUT_TOLERANCE)):
+            new_limit, action = max(self.floor, self.limit - 1), 'decrease'
+            reason = "o último aumento não trouxe mais vazão"
+        elif saturated and (previous is None or throughput >= previous * (1 - THROUGHPUT_TOLERANCE)):
+            new_limit, action = min(self.ceiling, self.limit + 1), 'increase'
+            reason = "todas as vagas ocupadas e vazão estável"
+        else:
+            new_limit, action, reason = self.limit, 'hold', "sem mudança"
+
+        if self._bytes or attempts:
+            self._last_throughput = throughput
+        self._last_action = action if new_limit != self.limit else 'hold'
+        if new_limit != self.limit:
+            self._decide(new_limit, action, reason, throughput, error_rate)
+        self._reset_window(now)
+
+    def _decide(self, new_limit: int, action: str, reason: str, throughput: float, error_rate: float):
+        decision = {
+            'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'action': action,
+            'from': self.limit, 'to': new_limit, 'reason': reason,
+            'throughput': round(throughput), 'error_rate': round(error_rate, 3),
+        }
+        self.limit = new_limit
+        self.decisions.append(decision)
+        self.status_text = self._status_text()
+        events.emit('concurrency', **{k: v for k, v in decision.items() if k != 'time'})
+        if self.on_decision:
+            self.on_decision(decision)
+        else:
+            print(f"Downloads simultâneos: {decision['from']} -> {decision['to']} ({reason})")
+
+    def _status_text(self) -> str:
+        return f"Downloads simultâneos: {self.limit} (entre {self.floor} e {self.ceiling})"
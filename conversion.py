@@ -0,0 +1,166 @@
+"""
+Conversão opcional dos ZIPs da RFB para Parquet.
+
+Cada CSV (latin-1, separado por ';', sem cabeçalho) é lido em streaming direto
+de dentro do ZIP, sem extrair para o disco, em blocos convertidos com o layout
+da tabela correspondente (empresas, estabelecimentos, sócios, simples e tabelas
+de domínio). A conversão roda num pool de processos, em paralelo aos downloads.
+
+Depende do pyarrow (opcional): pip install pyarrow
+"""
+import os
+import asyncio
+import zipfile
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from settings import CONVERT_WORKERS, PARQUET_DIR_NAME
+
+# pyarrow é opcional: sem ele a etapa de conversão fica indisponível. Só é
+# importado nos processos de conversão, não na inicialização do app
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+CSV_BLOCK_SIZE = 16 * 1024 * 1024  # bytes de CSV convertidos por lote
+DECIMAL_DIGITS = (18, 2)  # dígitos e casas das colunas 'decimal' (valores em reais, exatos, sem arredondar como float)
+
+# Layouts dos dados abertos do CNPJ: (coluna, tipo); tipos 'str', 'date' (AAAAMMDD) e 'decimal' (vírgula)
+_DOMINIO = [('codigo', 'str'), ('descricao', 'str')]
+SCHEMAS: Dict[str, List[Tuple[str, str]]] = {
+    'empresas': [
+        ('cnpj_basico', 'str'), ('razao_social', 'str'), ('natureza_juridica', 'str'),
+        ('qualificacao_responsavel', 'str'), ('capital_social', 'decimal'), ('porte_empresa', 'str'),
+        ('ente_federativo_responsavel', 'str'),
+    ],
+    'estabelecimentos': [
+        ('cnpj_basico', 'str'), ('cnpj_ordem', 'str'), ('cnpj_dv', 'str'), ('identificador_matriz_filial', 'str'),
+        ('nome_fantasia', 'str'), ('situacao_cadastral', 'str'), ('data_situacao_cadastral', 'date'),
+        ('motivo_situacao_cadastral', 'str'), ('nome_cidade_exterior', 'str'), ('pais', 'str'),
+        ('data_inicio_atividade', 'date'), ('cnae_fiscal_principal', 'str'), ('cnae_fiscal_secundaria', 'str'),
+        ('tipo_logradouro', 'str'), ('logradouro', 'str'), ('numero', 'str'), ('complemento', 'str'),
+        ('bairro', 'str'), ('cep', 'str'), ('uf', 'str'), ('municipio', 'str'), ('ddd_1', 'str'),
+        ('telefone_1', 'str'), ('ddd_2', 'str'), ('telefone_2', 'str'), ('ddd_fax', 'str'), ('fax', 'str'),
+        ('correio_eletronico', 'str'), ('situacao_especial', 'str'), ('data_situacao_especial', 'date'),
+    ],
+    'socios': [
+        ('cnpj_basico', 'str'), ('identificador_socio', 'str'), ('nome_socio', 'str'), ('cnpj_cpf_socio', 'str'),
+        ('qualificacao_socio', 'str'), ('data_entrada_sociedade', 'date'), ('pais', 'str'),
+        ('representante_legal', 'str'), ('nome_representante', 'str'), ('qualificacao_representante_legal', 'str'),
+        ('faixa_etaria', 'str'),
+    ],
+    'simples': [
+        ('cnpj_basico', 'str'), ('opcao_simples', 'str'), ('data_opcao_simples', 'date'),
+        ('data_exclusao_simples', 'date'), ('opcao_mei', 'str'), ('data_opcao_mei', 'date'),
+        ('data_exclusao_mei', 'date'),
+    ],
+    'cnaes': _DOMINIO,
+    'motivos': _DOMINIO,
+    'municipios': _DOMINIO,
+    'naturezas': _DOMINIO,
+    'paises': _DOMINIO,
+    'qualificacoes': _DOMINIO,
+}
+
+
+def table_type(filename: str) -> Optional[str]:
+    """Tipo da tabela a partir do nome do ZIP (ex.: "Estabelecimentos3.zip" -> "estabelecimentos")."""
+    lower = filename.lower()
+    return next((name for name in SCHEMAS if lower.startswith(name)), None)
+
+
+def parquet_path_for(zip_path: str) -> str:
+    month_dir, filename = os.path.split(zip_path)
+    return os.path.join(month_dir, PARQUET_DIR_NAME, os.path.splitext(filename)[0] + '.parquet')
+
+
+def _arrow_schema(columns: List[Tuple[str, str]]):
+    import pyarrow as pa
+    types = {'str': pa.string(), 'date': pa.date32(), 'decimal': pa.decimal128(*DECIMAL_DIGITS)}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _convert_batch(batch, columns: List[Tuple[str, str]]):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    arrays = []
+    for (name, kind), array in zip(columns, batch.columns):
+        if kind == 'date':
+            # datas "00000000" ou vazias viram nulo
+            array = pc.cast(pc.strptime(array, format='%Y%m%d', unit='s', error_is_null=True), pa.date32())
+        elif kind == 'decimal':
+            array = pc.cast(pc.replace_substring(array, ',', '.'), pa.decimal128(*DECIMAL_DIGITS))
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=_arrow_schema(columns))
+
+
+def convert_zip_to_parquet(zip_path: str) -> dict:
+    """
+    Executa no processo do pool. Converte todos os membros do ZIP para um único
+    arquivo Parquet. Retorna {'status': 'converted'|'skipped'|'failed', 'path', 'rows', 'error'}.
+    """
+    kind = table_type(os.path.basename(zip_path))
+    if kind is None:
+        return {'status': 'skipped', 'path': None, 'rows': 0, 'error': 'tabela desconhecida'}
+
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    columns = SCHEMAS[kind]
+    out_path = parquet_path_for(zip_path)
+    tmp_path = out_path + '.tmp'
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    read_options = pa_csv.ReadOptions(column_names=[name for name, _ in columns], encoding='latin1',
+                                      block_size=CSV_BLOCK_SIZE)
+    parse_options = pa_csv.ParseOptions(delimiter=';', quote_char='"')
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name, _ in columns},
+                                            strings_can_be_null=True)
+    rows = 0
+    try:
+        with zipfile.ZipFile(zip_path) as zf, \
+                pq.ParquetWriter(tmp_path, _arrow_schema(columns), compression='zstd') as writer:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                with zf.open(info) as member:
+                    reader = pa_csv.open_csv(member, read_options=read_options, parse_options=parse_options,
+                                             convert_options=convert_options)
+                    for batch in reader:
+                        writer.write_batch(_convert_batch(batch, columns))
+                        rows += batch.num_rows
+        os.replace(tmp_path, out_path)
+        return {'status': 'converted', 'path': out_path, 'rows': rows, 'error': None}
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {'status': 'failed', 'path': None, 'rows': rows, 'error': str(e) or type(e).__name__}
+
+
+class ParquetConverter:
+    """Pool de processos compartilhado para a conversão, sem bloquear o event loop."""
+
+    def __init__(self, max_workers: int = CONVERT_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def available(self) -> bool:
+        return HAS_PYARROW
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def convert(self, zip_path: str) -> dict:
+        if not HAS_PYARROW:
+            return {'status': 'skipped', 'path': None, 'rows': 0, 'error': 'pyarrow não instalado'}
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), convert_zip_to_parquet, zip_path)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+parquet_converter = ParquetConverter()
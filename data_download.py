@@ -1,11 +1,34 @@
 import os
+import json
+import math
 import asyncio
 import aiohttp
-import aiofiles
 import time
 import random
-from typing import Dict, List, Optional
-from settings import load_settings, MAX_RETRIES, MAX_CONCURRENT_DOWNLOADS, CHUNK_SIZE, CHUNK_TIMEOUT
+from typing import Callable, Dict, List, Optional
+from email.utils import parsedate_to_datetime
+from settings import (load_settings, MAX_RETRIES, CHUNK_TIMEOUT, CONNECT_TIMEOUT,
+                      SEGMENTS_PER_FILE, SEGMENT_MIN_SIZE, SEGMENT_JOURNAL_SUFFIX, STREAM_JOURNAL_SUFFIX,
+                      CONNECTION_LIMIT,
+                      CONNECTION_LIMIT_PER_HOST, KEEPALIVE_TIMEOUT, DNS_CACHE_TTL, SPEED_SMOOTHING,
+                      VERIFY_DOWNLOADS, CONVERT_TO_PARQUET, DEDUPE_ACROSS_MONTHS, QUEUE_POLICY, COORDINATED_DOWNLOADS,
+                      LEASE_POLL_INTERVAL, load_queue, save_queue)
+from verification import zip_verifier, get_verification
+from manifest import manifest
+from conversion import parquet_converter, table_type
+from bandwidth import BandwidthLimiter, TokenBucket
+from filewriter import BufferPool, FileWriter
+from dedupe import find_identical, link_file
+from leases import LeaseManager, LeaseHeld, LeaseLost
+from sources import SourceSelector, SourceMonitor, SourceDegraded, file_urls, host
+from concurrency import AdaptiveConcurrency
+from retry import (CircuitBreakers, HTTPStatusError, PermanentDownloadError, RemoteFileChanged, classify_error,
+                   error_cause, backoff_delay)
+from metrics import (events, register_gauge, DOWNLOADED_BYTES, DOWNLOADS_FINISHED, RETRIES, TASK_THROUGHPUT,
+                     TIME_TO_COMPLETE, SLOT_WAIT, TIME_TO_FIRST_BYTE, DEDUPED_BYTES, SOURCE_FAILOVERS)
+from logs import get_logger
+
+log = get_logger(__name__)
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/91.0.4472.124 Safari/537.36",
@@ -13,6 +36,24 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/103.0.0.0 Safari/537.36"
 ] # Lista de User-Agents para usar no download
 
+# by_table: tabelas de referência (pequenas) primeiro, depois as principais
+TABLE_ORDER = ['cnaes', 'motivos', 'municipios', 'naturezas', 'paises', 'qualificacoes',
+               'simples', 'empresas', 'socios', 'estabelecimentos']
+
+
+def _table_rank(task) -> int:
+    kind = table_type(task.filename)
+    return TABLE_ORDER.index(kind) if kind in TABLE_ORDER else len(TABLE_ORDER)
+
+
+# Políticas de ordenação da fila; dentro da mesma prioridade, a ordem é a da chave
+QUEUE_POLICIES = {
+    'small_first': lambda task: task.file_size,
+    'large_first': lambda task: -task.file_size,
+    'by_table': lambda task: (_table_rank(task), task.month_key, task.filename),
+    'fifo': lambda task: 0,
+}
+
 
 def format_size(bytes_size: float) -> str:
     if bytes_size >= 1024 ** 3:
@@ -32,10 +73,142 @@ def format_time(seconds: float) -> str:
     else:
         return f"{int(seconds)} seg restantes"
 
+class SegmentJournal:
+    """
+    Journal dos segmentos de um download em múltiplas conexões.
+
+    Fica salvo ao lado do arquivo (<arquivo>.parts) e guarda, para cada faixa
+    [start, end] (inclusive), quantos bytes já foram gravados, além do
+    Last-Modified da versão baixada (validator). Enquanto ele existir, o arquivo
+    pré-alocado é considerado incompleto.
+    """
+
+    def __init__(self, dest_path: str, file_size: int, num_segments: int, validator: Optional[str] = None):
+        self.path = dest_path + SEGMENT_JOURNAL_SUFFIX
+        self.file_size = file_size
+        self.validator = validator
+        self.segments: List[Dict[str, int]] = []
+        self.discarded = False  # havia um journal de outro tamanho ou de outra versão do arquivo
+        if not self._load():
+            if os.path.exists(self.path):
+                # o arquivo foi pré-alocado com zeros: sem o journal, nada nele é dado conferido
+                self.discarded = True
+                existing = 0
+                if os.path.exists(dest_path):
+                    os.truncate(dest_path, 0)
+            else:
+                # prefixo de um download anterior em uma única conexão
+                existing = os.path.getsize(dest_path) if os.path.exists(dest_path) else 0
+            self.segments = split_segments(file_size, num_segments, already_downloaded=existing)
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get("file_size") != self.file_size:
+            return False
+        if self.validator and data.get("validator") and not same_http_date(data["validator"], self.validator):
+            return False  # o arquivo mudou no servidor
+        self.validator = self.validator or data.get("validator")
+        self.segments = data.get("segments", [])
+        return bool(self.segments)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({"file_size": self.file_size, "validator": self.validator,
+                       "segments": self.segments}, file)  # type: ignore
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def downloaded(self) -> int:
+        return sum(seg['done'] for seg in self.segments)
+
+    @property
+    def complete(self) -> bool:
+        return all(seg['start'] + seg['done'] > seg['end'] for seg in self.segments)
+
+
+class StreamJournal:
+    """
+    Versão (Last-Modified) de um download em uma única conexão, salva ao lado do
+    arquivo parcial (<arquivo>.resume) antes do primeiro byte gravado. A retomada
+    a envia no If-Range mesmo depois de uma queda do processo. O ETag não serve:
+    muda de uma fonte (RFB ou espelho) para outra.
+    """
+
+    def __init__(self, dest_path: str):
+        self.path = dest_path + STREAM_JOURNAL_SUFFIX
+
+    def load(self) -> Optional[str]:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file).get("validator")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def save(self, validator: Optional[str]):
+        if not validator:
+            self.remove()  # sem Last-Modified, a retomada não tem como conferir a versão
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({"validator": validator}, file)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def same_http_date(a: str, b: str) -> bool:
+    """Compara duas datas HTTP (Last-Modified), que podem vir formatadas de outro jeito por outra fonte."""
+    try:
+        return parsedate_to_datetime(a) == parsedate_to_datetime(b)
+    except (TypeError, ValueError):
+        return a == b
+
+
+def split_segments(file_size: int, num_segments: int, already_downloaded: int = 0) -> List[Dict[str, int]]:
+    """
+    Divide [0, file_size) em até num_segments faixas contíguas. Bytes já presentes
+    no início do arquivo (download anterior em uma única conexão) são marcados
+    como concluídos.
+    """
+    num_segments = max(1, min(num_segments, file_size))
+    base = file_size // num_segments
+    segments = []
+    start = 0
+    for i in range(num_segments):
+        end = file_size - 1 if i == num_segments - 1 else start + base - 1
+        done = min(max(already_downloaded - start, 0), end - start + 1)
+        segments.append({'start': start, 'end': end, 'done': done})
+        start = end + 1
+    return segments
+
+
+def is_download_complete(dest_path: str, file_size: int) -> bool:
+    """Arquivo com o tamanho esperado e sem journal de segmentos pendente."""
+    return (os.path.exists(dest_path) and os.path.getsize(dest_path) == file_size
+            and not os.path.exists(dest_path + SEGMENT_JOURNAL_SUFFIX))
+
+
 class DownloadTask:
-    def __init__(self, url: str, dest_path: str, file_size: int, month_key: str, filename: str):
+    def __init__(self, url: str, dest_path: str, file_size: int, month_key: str, filename: str,
+                 last_modified: Optional[str] = None, priority: int = 0):
         self.url = url
+        self.priority = priority  # maior prioridade sai primeiro da fila, antes da política de ordenação
+        self.last_modified = last_modified  # Last-Modified remoto, registrado no índice local
         self._initial_size = 0
+        self.resumed_from: Optional[int] = None  # bytes já presentes no início da primeira tentativa
         self.dest_path = dest_path
         self.file_size = file_size
         self.month_key = month_key
@@ -47,32 +220,87 @@ class DownloadTask:
         self.error_message: Optional[str] = None
         self.start_time: Optional[float] = None
         self.last_update_time: Optional[float] = None
+        self.downloaded = 0  # bytes já gravados no destino, contados em memória
+        self.speed = 0.0  # bytes/s, média móvel exponencial
+        self.note: Optional[str] = None  # aviso temporário exibido no lugar da velocidade
+        self._sampled_bytes: Optional[int] = None
+        self._rendered: tuple = ()
+        self.bucket: Optional[TokenBucket] = None  # limite de banda próprio (BANDWIDTH_LIMIT_PER_TASK)
+        self.sources: List[str] = []  # URLs do arquivo em cada fonte, da mais rápida para a mais lenta
+        self.monitor: Optional[SourceMonitor] = None  # vazão da fonte atual (troca de fonte se degradar)
+        self.served_last_modified: Optional[str] = None  # Last-Modified da resposta, aplicado ao arquivo concluído
+        self.on_status: Optional[Callable[['DownloadTask'], None]] = None  # avisado a cada mudança de status
 
-    def update_progress(self):
-        now = time.monotonic()
+    @property
+    def source_url(self) -> str:
+        """URL usada nas requisições: a fonte atual (a mais rápida que ainda não falhou) ou a RFB."""
+        return self.sources[0] if self.sources else self.url
+
+    def add_progress(self, num_bytes: int):
+        """Contabiliza bytes gravados. Chamado a cada chunk, sem I/O nem atualização da UI."""
+        self.downloaded += num_bytes
+        self.note = None
+
+    def reset_progress(self, downloaded: int):
+        """Define os bytes já presentes no início de uma tentativa (retomada)."""
+        self.downloaded = downloaded
+        self._initial_size = downloaded
+        if self.resumed_from is None:
+            self.resumed_from = downloaded
+        self._sampled_bytes = downloaded
+
+    def sample_speed(self, now: Optional[float] = None):
+        """
+        Atualiza a velocidade com uma média móvel exponencial sobre os bytes
+        recebidos desde a última amostra. O peso de cada amostra depende do
+        intervalo decorrido, então a média não depende da frequência do ticker.
+        """
+        now = time.monotonic() if now is None else now
         if self.start_time is None:
             self.start_time = now
-        self.last_update_time = now
+        if self._sampled_bytes is None or self.last_update_time is None:
+            self._sampled_bytes = self.downloaded
+            self.last_update_time = now
+            return
 
-        downloaded_total = os.path.getsize(self.dest_path) if os.path.exists(self.dest_path) else 0
-        downloaded_now = max(0, downloaded_total - self._initial_size)
+        elapsed = now - self.last_update_time
+        if elapsed <= 0:
+            return
+        instant = max(0, self.downloaded - self._sampled_bytes) / elapsed
+        alpha = 1 - math.exp(-elapsed / SPEED_SMOOTHING)
+        self.speed = instant if self.speed == 0 else self.speed + alpha * (instant - self.speed)
+        self._sampled_bytes = self.downloaded
+        self.last_update_time = now
 
-        percent = min(100, int(downloaded_total * 100 / self.file_size))
-        if self.ui_elements.get('progress'):
-            self.ui_elements['progress'].value = percent / 100
-            self.ui_elements['progress'].props(f'label="{percent}%"')
+    @property
+    def percent(self) -> int:
+        return min(100, int(self.downloaded * 100 / self.file_size)) if self.file_size else 0
 
-        elapsed = max(1e-6, now - self.start_time)
-        speed = downloaded_now / elapsed
-        remaining = self.file_size - downloaded_total
-        eta = remaining / speed if speed > 0 else None
+    @property
+    def eta(self) -> Optional[float]:
+        remaining = self.file_size - self.downloaded
+        return remaining / self.speed if self.speed > 0 else None
 
-        downloaded_str = format_size(downloaded_total)
+    def progress_text(self) -> str:
+        if self.note:
+            return self.note
+        downloaded_str = format_size(self.downloaded)
         expected = format_size(self.file_size)
-        speed_str = f"{format_size(speed)}/s"
-        eta_str = format_time(eta) if eta else "Calculando..."
+        speed_str = f"{format_size(self.speed)}/s"
+        eta_str = format_time(self.eta) if self.eta else "Calculando..."
+        return f"{speed_str} — {downloaded_str} de {expected}, {eta_str}"
+
+    def render_progress(self):
+        """Envia o progresso atual para a UI, apenas se algo mudou desde o último envio."""
+        percent = self.percent
+        status_text = self.progress_text()
+        if (percent, status_text) == self._rendered:
+            return
+        self._rendered = (percent, status_text)
 
-        status_text = f"{speed_str} — {downloaded_str} de {expected}, {eta_str}"
+        if self.ui_elements.get('progress'):
+            self.ui_elements['progress'].value = percent / 100
+            self.ui_elements['progress'].props(f'label="{percent}%"')
         if self.ui_elements.get('status'):
             self.ui_elements['status'].text = status_text[:70] + '…' if len(status_text) > 70 else status_text
 
@@ -82,6 +310,7 @@ class DownloadTask:
         icon = None
         if status == "queued": icon = ('hourglass_empty', 'gray')
         elif status == "downloading": icon = ('cloud_download', 'blue')
+        elif status == "verifying": icon = ('fact_check', 'purple')
         elif status == "completed": icon = ('check_circle', 'green')
         elif status == "failed": icon = ('error', 'red')
         elif status == "cancelled": icon = ('cancel', 'orange')
@@ -92,6 +321,8 @@ class DownloadTask:
         if self.ui_elements.get('status'):
             if status == "failed" and error:
                 self.ui_elements['status'].text = f"{error}"
+            elif status == "verifying":
+                self.ui_elements['status'].text = "Verificando integridade..."
             elif status == "completed":
                 self.ui_elements['status'].text = "Concluído"
             elif status == "cancelled":
@@ -102,144 +333,703 @@ class DownloadTask:
             if cancel_btn:
                 cancel_btn.set_visibility(False)
 
+        if self.on_status:
+            self.on_status(self)
+
 class DownloadManager:
     def __init__(self):
         self.tasks: List[DownloadTask] = []
-        self.max_concurrent_downloads = MAX_CONCURRENT_DOWNLOADS
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        self.concurrency = AdaptiveConcurrency()  # limite de downloads simultâneos, ajustado em tempo de execução
+        self.breakers = CircuitBreakers()  # um circuit breaker por host
+        register_gauge('cnpj_download_concurrency_limit', 'Limite atual de downloads simultâneos.',
+                       lambda: self.concurrency.limit)
+        register_gauge('cnpj_downloads_active', 'Downloads ocupando uma vaga neste momento.',
+                       lambda: self.concurrency.active)
+        register_gauge('cnpj_downloads_queued', 'Downloads pendentes na fila.',
+                       lambda: sum(1 for task in self.tasks if task.status in ('queued', 'downloading')))
         self.running = False
         self.expected_files_by_month: Dict[str, List[str]] = {}
         self.tree = None
         self.tree_card = None
         self.download_container = None
-        self.build_tree = None  # será atribuído externamente
+        self.update_tree: Optional[Callable[[DownloadTask], None]] = None  # atribuído pela interface
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.limiter = BandwidthLimiter()
+        self.buffers = BufferPool()  # buffers de gravação reaproveitados por todos os downloads
+        register_gauge('cnpj_write_buffers_in_use', 'Buffers de gravação em uso.', lambda: self.buffers.in_use)
+        self.convert_to_parquet = CONVERT_TO_PARQUET
+        self.dedupe = DEDUPE_ACROSS_MONTHS
+        self.source_selector = SourceSelector()  # medição e escolha das fontes (RFB, espelhos, caches)
+        self.leases: Optional[LeaseManager] = LeaseManager() if COORDINATED_DOWNLOADS else None  # pasta compartilhada entre nós
+        self.queue_policy = load_queue().get('policy', QUEUE_POLICY)
+        self._queue_restored = False
+        self.conversions: set = set()  # conversões para Parquet em andamento (asyncio.Task)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Sessão HTTP única, compartilhada por todos os downloads, tentativas e HEADs.
+        O pool de conexões mantém keep-alive e cache de DNS, evitando um novo
+        handshake TCP+TLS a cada arquivo ou tentativa.
 
-    def add_task(self, url: str, month_key: str, filename: str, file_size: int, force: bool = False) -> DownloadTask:
+        Sem limite total: um arquivo grande (ou segmento) leva o tempo que a
+        banda permitir. Só a conexão (CONNECT_TIMEOUT) e cada leitura
+        (CHUNK_TIMEOUT) têm limite, e um timeout indica servidor travado.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=CONNECT_TIMEOUT, sock_read=CHUNK_TIMEOUT))
+        return self.session
+
+    async def close(self):
+        """Fecha a sessão compartilhada, o pool de conexões e os pools de verificação e conversão."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        zip_verifier.shutdown()
+        parquet_converter.shutdown()
+
+    def add_task(self, url: str, month_key: str, filename: str, file_size: int, force: bool = False,
+                 last_modified: Optional[str] = None, priority: int = 0) -> DownloadTask:
         settings = load_settings()
         download_path = settings.get("download_path", "")
         month_dir = os.path.join(download_path, month_key)
         os.makedirs(month_dir, exist_ok=True)
         dest_path = os.path.join(month_dir, filename)
 
-        task = DownloadTask(url, dest_path, file_size, month_key, filename)
+        pending = next((t for t in self.tasks if t.dest_path == dest_path and t.status in ('queued', 'downloading')), None)
+        if pending:
+            pending.priority = max(pending.priority, priority)
+            return pending
+
+        task = DownloadTask(url, dest_path, file_size, month_key, filename, last_modified, priority)
+        task.on_status = self._status_changed
 
         if month_key not in self.expected_files_by_month:
             self.expected_files_by_month[month_key] = []
         if filename not in self.expected_files_by_month[month_key]:
             self.expected_files_by_month[month_key].append(filename)
 
-        if not force and os.path.exists(dest_path) and os.path.getsize(dest_path) == file_size:
-            print(f"Arquivo já existe: {filename}, marcando como concluído.")
+        verification = get_verification(dest_path) or {}
+        if not force and is_download_complete(dest_path, file_size) and verification.get('status') != 'corrupt':
+            log.info(f"Arquivo já existe: {filename}, marcando como concluído.")
             task.set_status("completed")
         else:
+            if force or verification.get('status') == 'corrupt' or self._whole_file_on_disk(dest_path, file_size):
+                # o arquivo não é um parcial: retomar pediria um Range a partir do fim (HTTP 416)
+                self._remove_partial(task)
             self.tasks.append(task)
 
         return task
 
+    @staticmethod
+    def _whole_file_on_disk(dest_path: str, file_size: int) -> bool:
+        """Arquivo sem journal de segmentos e sem nada a retomar (do tamanho esperado ou maior)."""
+        return (os.path.exists(dest_path) and not os.path.exists(dest_path + SEGMENT_JOURNAL_SUFFIX)
+                and os.path.getsize(dest_path) >= file_size)
+
     async def download_file(self, task: DownloadTask):
         attempt = 0
+        ranked = False
+        compared = deduplicated = False
         while attempt < MAX_RETRIES:
             if task.cancel_event.is_set():
                 task.set_status("cancelled")
                 return
 
             task.set_status("downloading")
-            now = time.monotonic()
             if task.start_time is None:
-                task.start_time = now
-            task.last_update_time = now
-            timeout = aiohttp.ClientTimeout(total=300)
-
-            existing_size = os.path.getsize(task.dest_path) if os.path.exists(task.dest_path) else 0
-            task._initial_size = existing_size
+                task.start_time = time.monotonic()
 
             try:
-                async with self.semaphore:
-                    headers = {
-                        'User-Agent': random.choice(USER_AGENTS),
-                        'Range': f'bytes={existing_size}-'
-                    }
-                    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                        async with session.get(task.url) as response:
-                            if response.status not in (200, 206):
-                                raise aiohttp.ClientError(f"HTTP {response.status}")
-
-                            content_type = response.headers.get('Content-Type', '')
-                            if 'application/zip' not in content_type:
-                                raise aiohttp.ClientError(f"Tipo de conteúdo inesperado: {content_type}")
-
-                            content_length = response.headers.get('Content-Length')
-                            if content_length and content_length.isdigit():
-                                task.file_size = existing_size + int(content_length)
-
-                            async with aiofiles.open(task.dest_path, mode='ab' if existing_size > 0 else 'wb') as f:
-                                first_chunk = True
-                                while True:
-                                    if task.cancel_event.is_set():
-                                        break
-                                    chunk = await asyncio.wait_for(
-                                        response.content.read(CHUNK_SIZE),
-                                        timeout=CHUNK_TIMEOUT
-                                    )
-                                    if not chunk:
-                                        break
-                                    if first_chunk and existing_size == 0 and not chunk.startswith(b'PK'):
-                                        raise aiohttp.ClientError("Conteúdo não parece ser um ZIP válido")
-                                    first_chunk = False
-                                    await f.write(chunk)
-                                    task.update_progress()
+                waiting_since = time.monotonic()
+                async with self.concurrency:
+                    # no modo coordenado, a lease é pega só com a vaga, para os outros nós ficarem com o resto da fila
+                    finished_elsewhere = self.leases is not None and self._claim(task)
+                    if not finished_elsewhere and not compared:
+                        # também só com a vaga: o HEAD e as faixas da comparação contam no limite de conexões
+                        compared = True
+                        deduplicated = (self.dedupe and not os.path.exists(task.dest_path)
+                                        and await self._dedupe(task))
+                    if not (finished_elsewhere or deduplicated):
+                        SLOT_WAIT.observe(time.monotonic() - waiting_since)
+                        events.emit('download_started', month=task.month_key, file=task.filename,
+                                    attempt=attempt + 1, slot_wait=round(time.monotonic() - waiting_since, 3))
+                        if not ranked:
+                            # só com a vaga: a medição vale para o download que começa agora
+                            await self._rank_sources(task)
+                            ranked = True
+                        self._skip_open_breakers(task)
+                        breaker = self.breakers.for_url(task.source_url)
+                        if not breaker.is_closed:
+                            task.note = "Servidor indisponível, aguardando..."
+                        await breaker.before_request()
+                        session = await self.get_session()
+                        headers = {'User-Agent': random.choice(USER_AGENTS)}
+                        task.monitor = None if self.limiter.enabled else self.source_selector.monitor(task.sources)
+                        if await self._use_segments(session, task, headers):
+                            await self._download_segmented(session, task, headers)
+                        else:
+                            await self._download_stream(session, task, headers)
+
+                if deduplicated:
+                    await self._completed(task)
+                    return
+
+                if finished_elsewhere:
+                    log.info(f"{task.filename}: baixado por outro nó.")
+                    manifest.record(task.dest_path, 'complete', remote_last_modified=task.last_modified)
+                    task.reset_progress(task.file_size)
+                    task.render_progress()
+                    await self._completed(task)
+                    return
 
                 if task.cancel_event.is_set():
                     task.set_status("cancelled")
                     await asyncio.sleep(0.1)
-                    if os.path.exists(task.dest_path):
-                        os.remove(task.dest_path)
+                    self._remove_partial(task)
                     return
 
-                task.set_status("completed")
+                task.render_progress()
+                StreamJournal(task.dest_path).remove()
+                self._apply_last_modified(task)
+                manifest.record(task.dest_path, 'complete', remote_last_modified=task.last_modified)
+                if VERIFY_DOWNLOADS and not await self._verify(task):
+                    return
+                self._record_completed(task)
+                await self._completed(task)
+                return
 
-                # Atualiza a árvore após cada download
-                if self.build_tree:
-                    await self.build_tree()
+            except LeaseHeld as e:
+                # outro nó está baixando: espera fora da vaga, sem gastar tentativa
+                if isinstance(e, LeaseLost):
+                    self.leases.release(task.dest_path)
+                task.set_status("queued")
+                task.note = str(e)
+                await asyncio.sleep(LEASE_POLL_INTERVAL)
+                continue
 
-                return
+            except SourceDegraded as e:
+                # continua na próxima fonte a partir do que já está no disco, sem gastar tentativa
+                self._failover(task, 'degraded', str(e))
+                continue
 
             except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                failure = classify_error(e)
+                breaker = self.breakers.for_url(task.source_url)
+                cause = error_cause(e)
+                if len(task.sources) > 1 and (not failure.transient or self._source_unavailable(e)):
+                    # a fonte não tem o arquivo, está fora do ar ou respondeu algo inválido: sai da lista, sem gastar tentativa
+                    if failure.transient:
+                        breaker.record_failure(failure.retry_after)
+                    self._failover(task, cause, str(e), drop=True)
+                    continue
+                if not failure.transient:
+                    # o servidor respondeu; tentar de novo não muda o resultado
+                    breaker.record_success()
+                    task.set_status("failed", f"Erro: {e}")
+                    self._record_failed(task, cause, str(e))
+                    log.error(f"Erro permanente ({task.filename}): {e}")
+                    return
+
+                self.concurrency.record_error(cause)
+                breaker.record_failure(failure.retry_after)
                 attempt += 1
+                if attempt < MAX_RETRIES and len(task.sources) > 1:
+                    # há outra fonte: tenta nela já, sem esperar o backoff desta
+                    RETRIES.inc(cause=cause)
+                    events.emit('retry', month=task.month_key, file=task.filename, attempt=attempt + 1,
+                                cause=cause, error=str(e), delay=0)
+                    self._failover(task, cause, str(e))
+                    continue
                 if attempt < MAX_RETRIES:
+                    delay = backoff_delay(attempt, failure.retry_after)
+                    RETRIES.inc(cause=cause)
+                    events.emit('retry', month=task.month_key, file=task.filename, attempt=attempt + 1,
+                                cause=cause, error=str(e), delay=round(delay, 1))
                     task.set_status("downloading")
-                    if task.ui_elements.get('status'):
-                        task.ui_elements['status'].text = f"Tentativa {attempt + 1} de {MAX_RETRIES}..."
-                    await asyncio.sleep(random.uniform(1.5, 3.5))
+                    task.note = f"Tentativa {attempt + 1} de {MAX_RETRIES} em {int(delay)}s..."
+                    await asyncio.sleep(delay)
                     continue
                 else:
-                    task.set_status("failed", f"Falhou")
+                    task.set_status("failed", "Falhou")
                     if task.ui_elements.get('status'):
                         task.ui_elements['status'].text = f"Todas as {MAX_RETRIES} tentativas falharam"
-                    print(f"Erro temporário: {e}")
+                    log.warning(f"Erro temporário: {e}")
+                    self._record_failed(task, 'retries_exhausted', str(e))
                     return
 
             except Exception as e:
                 task.set_status("failed", f"Erro: {str(e)}")
+                self._record_failed(task, 'error', str(e))
                 return
 
+    def _status_changed(self, task: DownloadTask):
+        # só o nó do arquivo (e o do mês) é atualizado na árvore, sem remontá-la
+        if self.update_tree:
+            self.update_tree(task)
+
+    async def _completed(self, task: DownloadTask):
+        task.set_status("completed")
+        if self.convert_to_parquet:
+            # roda em segundo plano, liberando a vaga para o próximo download
+            conversion = asyncio.create_task(self._convert(task))
+            self.conversions.add(conversion)
+            conversion.add_done_callback(self.conversions.discard)
+
+    async def _dedupe(self, task: DownloadTask) -> bool:
+        """
+        Reaproveita uma cópia idêntica do arquivo em outro mês (link), sem baixá-lo.
+        Chamado com a vaga do download; as requisições da comparação passam pelo
+        circuit breaker do host, como as do download.
+        """
+        candidates = manifest.same_size(task.dest_path, task.file_size)
+        if not candidates:
+            return False
+        task.note = "Procurando cópia idêntica em outros meses..."
+        breaker = self.breakers.for_url(task.source_url)
+        try:
+            await breaker.before_request()
+            session = await self.get_session()
+            headers = {'User-Agent': random.choice(USER_AGENTS)}
+            source = await find_identical(session, task.source_url, task.file_size, task.last_modified, candidates, headers)
+            breaker.record_success()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            log.warning(f"Não foi possível comparar {task.filename} com outros meses: {e}")
+            breaker.record_failure(classify_error(e).retry_after)
+            source = None
+        method = link_file(source['path'], task.dest_path) if source else None
+        task.note = None
+        if method is None:
+            return False
+
+        manifest.record(task.dest_path, source['status'], remote_last_modified=task.last_modified,
+                        checked=source['status'] == 'verified', fingerprint=source['fingerprint'],
+                        linked_from=source['path'])
+        task.reset_progress(task.file_size)
+        task.render_progress()
+        DOWNLOADS_FINISHED.inc(result='deduplicated')
+        DEDUPED_BYTES.inc(task.file_size)
+        events.emit('download_deduplicated', month=task.month_key, file=task.filename, size=task.file_size,
+                    source=source['month_key'], method=method)
+        log.info(f"{task.filename}: idêntico ao de {source['month_key']}, reaproveitado ({method}).")
+        return True
+
+    def _record_completed(self, task: DownloadTask):
+        duration = time.monotonic() - task.start_time if task.start_time else 0.0
+        transferred = task.downloaded - (task.resumed_from or 0)
+        DOWNLOADS_FINISHED.inc(result='completed')
+        TIME_TO_COMPLETE.observe(duration)
+        if duration > 0 and transferred > 0:
+            TASK_THROUGHPUT.observe(transferred / duration)
+        events.emit('download_completed', month=task.month_key, file=task.filename, size=task.file_size,
+                    transferred=transferred, duration=round(duration, 3),
+                    throughput=round(transferred / duration) if duration > 0 else None)
+
+    @staticmethod
+    def _record_failed(task: DownloadTask, cause: str, error: str):
+        DOWNLOADS_FINISHED.inc(result='failed')
+        events.emit('download_failed', month=task.month_key, file=task.filename, cause=cause, error=error)
+
+    async def _verify(self, task: DownloadTask) -> bool:
+        """Confere o ZIP recém-baixado no pool de processos; se corrompido, descarta o arquivo."""
+        task.set_status("verifying")
+        result = await zip_verifier.verify(task.dest_path, use_cache=False)
+        if result['status'] == 'verified':
+            return True
+        log.error(f"ZIP corrompido ({task.filename}): {result['error']}")
+        self._remove_partial(task)
+        task.set_status("failed", f"ZIP corrompido: {result['error']}")
+        return False
+
+    async def _convert(self, task: DownloadTask):
+        if not parquet_converter.available:
+            log.warning(f"Conversão para Parquet ignorada ({task.filename}): pyarrow não instalado.")
+            return
+        if task.ui_elements.get('status'):
+            task.ui_elements['status'].text = "Convertendo para Parquet..."
+        result = await parquet_converter.convert(task.dest_path)
+        if result['status'] == 'converted':
+            manifest.set_parquet(task.dest_path, result['path'])
+            text = f"Concluído — Parquet com {result['rows']} linhas"
+        else:
+            text = f"Concluído — Parquet não gerado: {result['error']}"
+        log.info(f"{task.filename}: {text}")
+        if task.ui_elements.get('status'):
+            task.ui_elements['status'].text = text
+
+    async def wait_conversions(self):
+        """Aguarda as conversões para Parquet ainda em andamento."""
+        while self.conversions:
+            await asyncio.gather(*list(self.conversions), return_exceptions=True)
+
+    def _claim(self, task: DownloadTask) -> bool:
+        """
+        Pega a lease do arquivo (LeaseHeld se outro nó estiver com ela). Retorna
+        True se o arquivo já foi concluído por outro nó enquanto este esperava.
+        """
+        self.leases.claim(task.dest_path)
+        if is_download_complete(task.dest_path, task.file_size):
+            self.leases.release(task.dest_path)
+            return True
+        return False
+
+    def _lease_lost(self, task: DownloadTask) -> bool:
+        """A lease do arquivo passou para outro nó: daqui em diante, nada mais é gravado nele."""
+        return self.leases is not None and self.leases.is_lost(task.dest_path)
+
+    def _check_lease(self, task: DownloadTask):
+        if self._lease_lost(task):
+            raise LeaseLost(task.dest_path, "outro nó")
+
+    async def _rank_sources(self, task: DownloadTask):
+        """Ordena as fontes do arquivo pela vazão medida; com só a RFB configurada, não mede nada."""
+        task.sources = file_urls(load_settings(), task.url, task.month_key, task.filename)
+        if len(task.sources) < 2:
+            return
+        task.note = "Medindo as fontes..."
+        session = await self.get_session()
+        headers = {'User-Agent': random.choice(USER_AGENTS)}
+        task.sources = await self.source_selector.rank(session, task.sources, task.file_size, task.last_modified,
+                                                       headers, self.breakers)
+        task.note = None
+
+    def _skip_open_breakers(self, task: DownloadTask):
+        """Com a fonte atual pausada pelo circuit breaker, passa para a primeira que não está."""
+        for _ in range(len(task.sources) - 1):
+            if self.breakers.for_url(task.source_url).is_closed:
+                return
+            task.sources.append(task.sources.pop(0))
+
+    def _failover(self, task: DownloadTask, reason: str, error: str, drop: bool = False):
+        """Passa o download para a próxima fonte; a atual sai da lista (drop) ou vai para o fim dela."""
+        failed = task.sources.pop(0)
+        if not drop:
+            task.sources.append(failed)
+        SOURCE_FAILOVERS.inc(reason=reason)
+        events.emit('source_failover', month=task.month_key, file=task.filename, source=host(failed),
+                    to=host(task.source_url), reason=reason, error=error)
+        log.warning(f"{task.filename}: {host(failed)} -> {host(task.source_url)} ({error})")
+        task.note = f"Trocando para {host(task.source_url)}..."
+
+    @staticmethod
+    def _source_unavailable(error: BaseException) -> bool:
+        if isinstance(error, HTTPStatusError):
+            return error.status in (404, 410)
+        return isinstance(error, aiohttp.ClientConnectorError)
+
+    def _check_source(self, task: DownloadTask, num_bytes: int):
+        if task.monitor is not None:
+            task.monitor.record(num_bytes)  # SourceDegraded se a fonte ficou lenta
+
+    @staticmethod
+    def _apply_last_modified(task: DownloadTask):
+        """
+        Data do arquivo = Last-Modified da fonte (igual ao da RFB, conferido na
+        medição): o modo espelho deste app repassa a data da RFB, e o arquivo
+        passa na conferência quando outro nó o usa como fonte. Só é aplicada ao
+        arquivo concluído, depois da última escrita.
+        """
+        try:
+            modified = parsedate_to_datetime(task.served_last_modified).timestamp()
+            os.utime(task.dest_path, (time.time(), modified))
+        except (TypeError, ValueError, OSError):
+            pass
+
+    def _accepted(self, task: DownloadTask, response: aiohttp.ClientResponse):
+        """Resposta válida do servidor: alimenta o controle de concorrência e fecha o circuit breaker."""
+        self.concurrency.record_request()
+        self.breakers.for_url(task.source_url).record_success()
+        task.served_last_modified = response.headers.get('Last-Modified') or task.served_last_modified
+
+    async def _use_segments(self, session: aiohttp.ClientSession, task: DownloadTask, headers: Dict) -> bool:
+        """
+        Decide se o arquivo será baixado em faixas paralelas. Um journal existente
+        sempre retoma no modo segmentado; caso contrário, exige arquivo grande e
+        servidor que aceite Range (verificado via HEAD).
+        """
+        has_journal = os.path.exists(task.dest_path + SEGMENT_JOURNAL_SUFFIX)
+        if not has_journal and (SEGMENTS_PER_FILE <= 1 or task.file_size < SEGMENT_MIN_SIZE):
+            return False
+
+        async with session.head(task.source_url, headers=headers, allow_redirects=True) as response:
+            if response.status != 200:
+                raise HTTPStatusError(response.status, response.headers.get('Retry-After'))
+            self._accepted(task, response)
+            accept_ranges = response.headers.get('Accept-Ranges', '').lower()
+            content_length = response.headers.get('Content-Length')
+
+        if accept_ranges != 'bytes' or not (content_length and content_length.isdigit()):
+            if has_journal:
+                # servidor deixou de aceitar Range: recomeça em uma única conexão
+                log.warning(f"Servidor não aceita Range para {task.filename}; reiniciando download.")
+                self._remove_partial(task)
+            return False
+
+        task.file_size = int(content_length)
+        return True
+
+    async def _download_stream(self, session: aiohttp.ClientSession, task: DownloadTask, headers: Dict):
+        self._discard_unversioned_partial(task)
+        existing_size = os.path.getsize(task.dest_path) if os.path.exists(task.dest_path) else 0
+        task.reset_progress(existing_size)
+
+        headers = {**headers, 'Range': f'bytes={existing_size}-'}
+        validator = self._resume_validator(task)
+        if existing_size and validator:
+            headers['If-Range'] = validator  # versão diferente no servidor: resposta 200 com o arquivo inteiro
+        requested = time.monotonic()
+        async with session.get(task.source_url, headers=headers) as response:
+            if response.status not in (200, 206):
+                raise HTTPStatusError(response.status, response.headers.get('Retry-After'))
+            if response.status == 200 and existing_size:
+                # Range ignorado ou If-Range recusado: o corpo é o arquivo inteiro, que substitui o parcial
+                log.warning(f"{task.filename}: servidor enviou o arquivo inteiro; descartando a parte já baixada.")
+                existing_size = 0
+                task.reset_progress(0)
+
+            content_type = response.headers.get('Content-Type', '')
+            if 'application/zip' not in content_type:
+                raise PermanentDownloadError(f"Tipo de conteúdo inesperado: {content_type}")
+            self._accepted(task, response)
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit():
+                task.file_size = existing_size + int(content_length)
+            # versão dos bytes que vão para o disco, pedida no If-Range se o download for retomado
+            StreamJournal(task.dest_path).save(task.served_last_modified)
+
+            writer = FileWriter(self.buffers, task.dest_path, existing_size, truncate=existing_size == 0)
+            try:
+                first_chunk = True
+                async for chunk in self._receive(task, response):
+                    if task.cancel_event.is_set():
+                        break
+                    self._check_lease(task)
+                    if first_chunk:
+                        TIME_TO_FIRST_BYTE.observe(time.monotonic() - requested, mode='stream')
+                        if existing_size == 0 and chunk[:2] != b'PK':
+                            raise PermanentDownloadError("Conteúdo não parece ser um ZIP válido")
+                    first_chunk = False
+                    await writer.write(chunk)
+                    task.add_progress(len(chunk))
+                    self.concurrency.record_bytes(len(chunk))
+                    DOWNLOADED_BYTES.inc(len(chunk))
+                    self._check_source(task, len(chunk))
+            finally:
+                # grava também o que chegou antes de uma falha: a retomada continua do tamanho do arquivo
+                await writer.close(discard=self._lease_lost(task))
+
+    async def _download_segmented(self, session: aiohttp.ClientSession, task: DownloadTask, headers: Dict):
+        self._discard_unversioned_partial(task)
+        journal = SegmentJournal(task.dest_path, task.file_size, SEGMENTS_PER_FILE, self._resume_validator(task))
+        if journal.discarded:
+            log.warning(f"{task.filename}: journal de segmentos de outra versão do arquivo; reiniciando download.")
+        task.reset_progress(journal.downloaded)
+
+        # pré-aloca o destino para que cada segmento grave no seu próprio offset
+        with open(task.dest_path, 'r+b' if os.path.exists(task.dest_path) else 'wb') as file:
+            file.truncate(task.file_size)
+        journal.save()
+
+        pending = [seg for seg in journal.segments if seg['start'] + seg['done'] <= seg['end']]
+        workers = [asyncio.ensure_future(self._download_segment(session, task, journal, seg, headers)) for seg in pending]
+        changed = False
+        try:
+            await asyncio.gather(*workers)
+        except RemoteFileChanged:
+            changed = True
+            raise
+        finally:
+            # se um segmento falhar, encerra os demais; o journal guarda o ponto de cada um
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if changed:
+                # as faixas já gravadas são da versão anterior: a próxima tentativa recomeça do zero
+                self._remove_partial(task)
+
+        if task.cancel_event.is_set():
+            return
+        if not journal.complete:
+            raise aiohttp.ClientPayloadError("Segmentos incompletos")
+        journal.remove()
+
+    async def _download_segment(self, session: aiohttp.ClientSession, task: DownloadTask,
+                                journal: SegmentJournal, seg: Dict[str, int], headers: Dict):
+        position = seg['start'] + seg['done']
+        headers = {**headers, 'Range': f"bytes={position}-{seg['end']}"}
+        if journal.validator:
+            headers['If-Range'] = journal.validator
+        requested = time.monotonic()
+        async with session.get(task.source_url, headers=headers) as response:
+            if response.status == 200 and journal.validator:
+                raise RemoteFileChanged(f"{task.filename} mudou no servidor desde o início do download")
+            if response.status != 206:
+                raise HTTPStatusError(response.status, response.headers.get('Retry-After'))
+
+            content_type = response.headers.get('Content-Type', '')
+            if 'application/zip' not in content_type:
+                raise PermanentDownloadError(f"Tipo de conteúdo inesperado: {content_type}")
+            self._accepted(task, response)
+
+            def written(num_bytes: int):
+                # o journal só avança com os bytes já gravados no arquivo
+                seg['done'] += num_bytes
+                if not self._lease_lost(task):
+                    journal.save()
+
+            writer = FileWriter(self.buffers, task.dest_path, position, on_written=written)
+            try:
+                async for chunk in self._receive(task, response):
+                    if task.cancel_event.is_set():
+                        return
+                    self._check_lease(task)
+                    if requested is not None:
+                        TIME_TO_FIRST_BYTE.observe(time.monotonic() - requested, mode='segment')
+                        requested = None
+                    if position == 0 and chunk[:2] != b'PK':
+                        raise PermanentDownloadError("Conteúdo não parece ser um ZIP válido")
+                    chunk = chunk[:seg['end'] - position + 1]  # ignora o que passar do fim da faixa pedida
+                    await writer.write(chunk)
+                    position += len(chunk)
+                    task.add_progress(len(chunk))
+                    self.concurrency.record_bytes(len(chunk))
+                    DOWNLOADED_BYTES.inc(len(chunk))
+                    self._check_source(task, len(chunk))
+                    if position > seg['end']:
+                        break
+                else:
+                    raise aiohttp.ClientPayloadError("Conexão encerrada antes do fim do segmento")
+            finally:
+                await writer.close(discard=self._lease_lost(task))
+
+    async def _receive(self, task: DownloadTask, response: aiohttp.ClientResponse):
+        """
+        Pedaços do corpo da resposta como a conexão os recebeu (readchunk), sem
+        juntá-los numa cópia nova como read(n) faz: o FileWriter copia cada um
+        direto para o buffer do pool. Fora do pool fica só o buffer de leitura do
+        aiohttp, que pausa o socket quando enche. Com limite de banda, cada pedaço
+        sai em fatias de read_size, liberadas pelos baldes uma a uma.
+        """
+        while True:
+            chunk, _ = await asyncio.wait_for(response.content.readchunk(), timeout=CHUNK_TIMEOUT)
+            if not chunk:
+                return
+            data = memoryview(chunk)
+            if not self.limiter.enabled:
+                yield data
+                continue
+            step = self.limiter.read_size(task)
+            for start in range(0, len(data), step):
+                piece = data[start:start + step]
+                await self.limiter.throttle(task, len(piece))
+                yield piece
+
+    @staticmethod
+    def _resume_validator(task: DownloadTask) -> Optional[str]:
+        """
+        Last-Modified da versão já gravada no arquivo parcial, enviado em If-Range
+        ao retomar: o salvo em <arquivo>.resume ou, sem ele, o da última resposta.
+        """
+        return StreamJournal(task.dest_path).load() or task.served_last_modified
+
+    def _discard_unversioned_partial(self, task: DownloadTask):
+        """Parcial sem journal nem Last-Modified salvo: não há como pedir a mesma versão, recomeça do zero."""
+        if (os.path.exists(task.dest_path) and not os.path.exists(task.dest_path + SEGMENT_JOURNAL_SUFFIX)
+                and StreamJournal(task.dest_path).load() is None):
+            log.warning(f"{task.filename}: parte já baixada sem a versão de origem; reiniciando download.")
+            self._remove_partial(task)
+
+    @staticmethod
+    def _remove_partial(task: DownloadTask):
+        for path in (task.dest_path, task.dest_path + SEGMENT_JOURNAL_SUFFIX, task.dest_path + STREAM_JOURNAL_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        manifest.remove(task.dest_path)
+
+    def ordered_tasks(self) -> List[DownloadTask]:
+        """Downloads pendentes na ordem da fila: prioridade e, depois, a política escolhida."""
+        policy = QUEUE_POLICIES.get(self.queue_policy, QUEUE_POLICIES['fifo'])
+        pending = [task for task in self.tasks if task.status in ('queued', 'downloading')]
+        return sorted(pending, key=lambda task: (-task.priority, policy(task)))
+
+    def set_queue_policy(self, policy: str):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Política de fila desconhecida: {policy}")
+        self.queue_policy = policy
+        self.save_queue()
+
+    def save_queue(self):
+        """Grava os downloads pendentes, para que sejam retomados após reiniciar."""
+        items = [{
+            'url': task.url, 'month_key': task.month_key, 'filename': task.filename,
+            'file_size': task.file_size, 'last_modified': task.last_modified, 'priority': task.priority,
+        } for task in self.ordered_tasks()]
+        if not self._queue_restored:
+            # fila anterior ainda não foi carregada nesta execução: preserva os itens que não são destes downloads
+            known = {(task.month_key, task.filename) for task in self.tasks}
+            items += [item for item in load_queue().get('items', [])
+                      if (item['month_key'], item['filename']) not in known]
+        save_queue(items, self.queue_policy)
+
+    def restore_queue(self) -> List[DownloadTask]:
+        """Recoloca na fila os downloads pendentes salvos por uma execução anterior."""
+        self._queue_restored = True
+        restored = []
+        for item in load_queue().get('items', []):
+            task = self.add_task(item['url'], item['month_key'], item['filename'], int(item['file_size']),
+                                 last_modified=item.get('last_modified'), priority=item.get('priority', 0))
+            if task.status in ('queued', 'downloading'):
+                restored.append(task)
+        return restored
+
+    async def _run_task(self, task: DownloadTask):
+        try:
+            await self.download_file(task)
+        finally:
+            if self.leases is not None:
+                self.leases.release(task.dest_path)
+            self.save_queue()
+
     async def start_downloads(self):
         if self.running:
             return
         self.running = True
-        await asyncio.gather(*(self.download_file(task) for task in self.tasks if task.status in ('queued', 'downloading')))
-        self.running = False
+        try:
+            tasks = self.ordered_tasks()
+            self.save_queue()
+            # as vagas são liberadas na ordem em que os downloads chegam, isto é, na ordem da fila
+            await asyncio.gather(*(self._run_task(task) for task in tasks))
+        finally:
+            self.running = False
 
     def cancel_all(self):
         for task in self.tasks:
             if task.status in ('queued', 'downloading'):
                 task.cancel_event.set()
                 task.set_status("cancelled")
-                if os.path.exists(task.dest_path):
-                    try:
-                        os.remove(task.dest_path)
-                    except Exception as e:
-                        print(f"Erro ao remover arquivo cancelado: {e}")
+                try:
+                    self._remove_partial(task)
+                except Exception as e:
+                    log.error(f"Erro ao remover arquivo cancelado: {e}")
+        self.save_queue()
+
+    def refresh_progress(self):
+        """
+        Ticker único da UI: amostra a velocidade de cada download ativo e envia
+        o progresso em lote, numa frequência fixa independente dos chunks.
+        """
+        now = time.monotonic()
+        for task in self.tasks:
+            if task.status == "downloading":
+                task.sample_speed(now)
+                task.render_progress()
 
     def clear_completed(self):
         self.tasks = [t for t in self.tasks if t.status not in ("completed", "failed")]
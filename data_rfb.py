@@ -1,16 +1,25 @@
 import re
-import json
+import time
+import asyncio
 import datetime
-import requests
+import aiohttp
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
+from typing import Optional, Tuple
 from urllib.parse import urljoin
-from settings import load_settings, SETTINGS_FILE_PATH, DEFAULT_RFB_URL, NUM_RECENT_MONTHS, TIME_CHECK_INTERVAL
+from listing_parser import parse_listing
+from logs import get_logger
+from metrics import events, CRAWL_DURATION
+from settings import (load_settings, load_catalog, save_catalog, load_listing_cache, save_listing_cache,
+                      DEFAULT_RFB_URL, NUM_RECENT_MONTHS, TIME_CHECK_INTERVAL, SEGMENT_JOURNAL_SUFFIX,
+                      CATALOG_MAX_MONTHS, CRAWL_MAX_CONCURRENCY)
 
+log = get_logger(__name__)
 
-# Sessão para reutilizar conexões HTTP
-session = requests.Session()
+KEYWORDS = [
+    "cnaes", "empresas", "estabelecimentos", "movitos",
+    "municipios", "naturezas", "paises", "qualificacoes",
+    "simples", "socios"
+] # Arquivos de interesse nas pastas mensais
 
 
 def parse_key(key: str):
@@ -39,103 +48,151 @@ def get_threshold(current_data: dict, num_recent: int):
     return None
 
 
-def obter_conteudo(url: str) -> BeautifulSoup:
+async def obter_conteudo(session: aiohttp.ClientSession, url: str,
+                         cached: Optional[dict] = None) -> Tuple[Optional[str], dict]:
     """
-    Faz requisição GET e retorna BeautifulSoup do HTML.
-    """
-    resp = session.get(url)
-    resp.raise_for_status()
-    return BeautifulSoup(resp.text, 'html.parser')
-
+    Faz requisição GET condicional e retorna (HTML da página, registro de cache).
 
-def get_cnpj_zip_files() -> dict:
+    Se houver registro em cache para a URL, envia If-None-Match/If-Modified-Since;
+    quando o servidor responde 304, retorna (None, cached) e as entradas já
+    interpretadas podem ser reutilizadas sem baixar nem analisar a página.
+    """
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    async with session.get(url, headers=headers) as resp:
+        if resp.status == 304 and cached:
+            return None, cached
+        resp.raise_for_status()
+        record = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        html = await resp.text()
+    return html, record
+
+
+async def obter_head(session: aiohttp.ClientSession, url: str, entry: dict, limit: asyncio.Semaphore) -> bool:
+    """
+    Preenche last_modified e size de uma entrada via HEAD, respeitando o limite
+    global de requisições. Retorna False se o HEAD falhar.
+    """
+    async with limit:
+        try:
+            async with session.head(url, allow_redirects=True) as head:
+                content_length = head.headers.get('Content-Length')
+                entry['last_modified'] = head.headers.get('Last-Modified') or entry['last_modified']
+                entry['size'] = int(content_length) if content_length and content_length.isdigit() else None
+            return True
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            log.error(f"Erro ao obter HEAD para {url}: {e}")
+            return False
+
+
+async def processar_mes(session: aiohttp.ClientSession, rfb_url: str, mes: str, listing_cache: dict,
+                        novo_cache: dict, limit: asyncio.Semaphore) -> list:
+    """Lista os arquivos zip de uma pasta "YYYY-MM/", completando a metadata faltante com HEADs."""
+    mes_key = mes.rstrip('/')
+    url_mes = urljoin(rfb_url, mes)
+    async with limit:
+        html_mes, record = await obter_conteudo(session, url_mes, listing_cache.get(url_mes))
+    if html_mes is None:
+        print(f"Pasta {mes_key} sem alterações (cache).")
+        novo_cache[url_mes] = record
+        return [dict(entry) for entry in record['entries']]
+    print(f"Processando a pasta: {mes_key}")
+
+    file_entries = []  # lista de dicts com metadata parcial
+    missing = []       # lista de (entry, file_url) para HEAD
+
+    for item in parse_listing(html_mes):
+        href = item['name']
+        if not href.lower().endswith('.zip'):
+            continue
+        lower_nome = href.lower()
+        if not any(kw in lower_nome for kw in KEYWORDS):
+            continue
+
+        entry = { 'name': href, 'last_modified': item['last_modified'], 'size': item['size'] }
+        file_entries.append(entry)
+
+        # se faltou algum dado (ou o tamanho é aproximado, ex. "1.2G"), agendar HEAD
+        if entry['last_modified'] is None or entry['size'] is None or not item['exact']:
+            missing.append((entry, urljoin(url_mes, href)))
+
+    # HEADs concorrentes, limitados pelo mesmo semáforo de toda a varredura
+    heads_ok = await asyncio.gather(*(obter_head(session, url, entry, limit) for entry, url in missing))
+
+    # só guarda no cache listagens com metadata completa, para não reaproveitar falhas de HEAD
+    if all(heads_ok) and all(entry['last_modified'] and entry['size'] for entry in file_entries):
+        novo_cache[url_mes] = {**record, 'entries': [dict(entry) for entry in file_entries]}
+    return file_entries
+
+
+def record_crawl(started: float, arquivos_por_mes: dict):
+    duration = time.monotonic() - started
+    CRAWL_DURATION.observe(duration)
+    events.emit('crawl', duration=round(duration, 3), months=len(arquivos_por_mes),
+                files=sum(len(arquivos) for arquivos in arquivos_por_mes.values()))
+
+
+async def get_cnpj_zip_files(session: Optional[aiohttp.ClientSession] = None) -> dict:
     """
     Coleta arquivos ZIP de diretórios "YYYY-MM/" na URL da RFB,
     filtrando somente os meses novos (>= threshold) e extraindo
     nome, last-modified e size de cada arquivo.
 
-    Retorna dict: { 'YYYY-MM/': [ { 'name':..., 'last_modified':..., 'size':... }, ... ], ... }
+    As pastas mensais são consultadas concorrentemente e todas as requisições
+    (listagens e HEADs) passam por um único limite de CRAWL_MAX_CONCURRENCY.
+    Se session não for informada, uma sessão temporária é criada.
+
+    Retorna dict: { 'YYYY-MM': [ { 'name':..., 'last_modified':..., 'size':... }, ... ], ... }
     """
-    settings_data = load_settings()
-    rfb_url = settings_data.get("rfb_url", DEFAULT_RFB_URL)
+    if session is None:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as own_session:
+            return await get_cnpj_zip_files(own_session)
+
+    started = time.monotonic()
+    rfb_url = load_settings().get("rfb_url", DEFAULT_RFB_URL)
 
-    current_rfb_avail = settings_data.get("rfb_available", {})
+    current_rfb_avail = load_catalog().get("rfb_available", {})
     threshold = get_threshold(current_rfb_avail, NUM_RECENT_MONTHS)
 
+    # cache das listagens: só as URLs consultadas nesta verificação são mantidas
+    listing_cache = load_listing_cache()
+    novo_cache = {}
+
     print("Etapa 1: Coletando pastas de mês-ano...")
-    soup_base = obter_conteudo(rfb_url)
-    meses_ano = [
-        tag.get('href') for tag in soup_base.find_all('a')
-        if tag.get('href') and re.match(r'^\d{4}-\d{2}/$', tag.get('href'))
-    ]
+    html_base, record = await obter_conteudo(session, rfb_url, listing_cache.get(rfb_url))
+    if html_base is None:
+        print("Listagem principal sem alterações (cache).")
+        meses_ano = record['entries']
+    else:
+        meses_ano = [
+            item['name'] for item in parse_listing(html_base)
+            if re.match(r'^\d{4}-\d{2}/$', item['name'])
+        ]
+        record = {**record, 'entries': meses_ano}
+    novo_cache[rfb_url] = record
     meses_ano = sorted(meses_ano, key=parse_key)
     if threshold is not None:
         meses_ano = [m for m in meses_ano if parse_key(m) >= parse_key(threshold)]
     if not meses_ano and current_rfb_avail:
         print("Nenhum novo mês encontrado; mantendo registros existentes.")
+        save_listing_cache(novo_cache)
+        record_crawl(started, {})
         return {}
 
-    keywords = [
-        "cnaes", "empresas", "estabelecimentos", "movitos",
-        "municipios", "naturezas", "paises", "qualificacoes",
-        "simples", "socios"
-    ]
-
-    novos_arquivos_por_mes = {}
     print("Etapa 2: Processando pastas e filtrando arquivos zip...")
-    for mes in meses_ano:
-        mes_key = mes.rstrip('/')
-        print(f"Processando a pasta: {mes_key}")
-        url_mes = urljoin(rfb_url, mes)
-        soup_mes = obter_conteudo(url_mes)
-
-        file_entries = []  # lista de dicts com metadata parcial
-        missing = []       # lista de (idx, file_url) para HEAD
-
-        for tag in soup_mes.find_all('a'):
-            href = tag.get('href')
-            if not href or not href.lower().endswith('.zip'):
-                continue
-            lower_nome = href.lower()
-            if not any(kw in lower_nome for kw in keywords):
-                continue
-
-            # Tenta extrair metadata do listing HTML
-            last_mod = None
-            size = None
-            # Em listagens Apache, texto após o <a> contém data e tamanho
-            sibling = tag.next_sibling
-            if sibling and isinstance(sibling, str):
-                parts = sibling.strip().split()
-                if len(parts) >= 3:
-                    last_mod = f"{parts[0]} {parts[1]}"
-                    size = parts[2]
-
-            entry = { 'name': href, 'last_modified': last_mod, 'size': size }
-            file_entries.append(entry)
-
-            # se faltou algum dado, agendar HEAD
-            if last_mod is None or size is None:
-                file_url = urljoin(url_mes, href)
-                missing.append((len(file_entries) - 1, file_url))
-
-        # Executa HEADs em paralelo para preencher metadata faltante
-        if missing:
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_idx = {
-                    executor.submit(session.head, url, allow_redirects=True): idx
-                    for idx, url in missing
-                }
-                for future in as_completed(future_to_idx):
-                    idx = future_to_idx[future]
-                    try:
-                        head = future.result()
-                        file_entries[idx]['last_modified'] = head.headers.get('Last-Modified')
-                        file_entries[idx]['size'] = head.headers.get('Content-Length')
-                    except Exception as e:
-                        print(f"Erro ao obter HEAD para {missing[idx][1]}: {e}")
-
-        novos_arquivos_por_mes[mes_key] = file_entries
+    limit = asyncio.Semaphore(CRAWL_MAX_CONCURRENCY)
+    resultados = await asyncio.gather(*(
+        processar_mes(session, rfb_url, mes, listing_cache, novo_cache, limit) for mes in meses_ano
+    ))
+    novos_arquivos_por_mes = {mes.rstrip('/'): arquivos for mes, arquivos in zip(meses_ano, resultados)}
+
+    save_listing_cache(novo_cache)
+    record_crawl(started, novos_arquivos_por_mes)
 
     print("\nResumo final de arquivos extraídos por mês:")
     for mes, arquivos in novos_arquivos_por_mes.items():
@@ -145,13 +202,13 @@ def get_cnpj_zip_files() -> dict:
 
 def update_latest_rfb_available(dados_novos: dict):
     """
-    Atualiza 'rfb_available' e 'rfb_last_check' no settings.json,
-    combinando registros antigos e novos (>= threshold).
+    Atualiza 'rfb_available' e 'rfb_last_check' no catálogo, combinando
+    registros antigos e novos (>= threshold) e descartando os meses além
+    de CATALOG_MAX_MONTHS.
     Também adiciona 'id' único e 'download_link' para cada arquivo.
     """
-    current_settings = load_settings()
-    current_rfb_avail = current_settings.get("rfb_available", {})
-    rfb_url_base = current_settings.get("rfb_url", DEFAULT_RFB_URL)
+    current_rfb_avail = load_catalog().get("rfb_available", {})
+    rfb_url_base = load_settings().get("rfb_url", DEFAULT_RFB_URL)
     threshold = get_threshold(current_rfb_avail, NUM_RECENT_MONTHS)
 
     combined = current_rfb_avail.copy()
@@ -164,42 +221,42 @@ def update_latest_rfb_available(dados_novos: dict):
                 file['download_link'] = urljoin(rfb_url_base, f'{clean_key}/{file["name"]}')
             combined[clean_key] = arquivos
 
-    current_settings["rfb_available"] = combined
-    current_settings["rfb_last_check"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    recentes = sorted(combined.keys(), key=parse_key)[-CATALOG_MAX_MONTHS:]
+    combined = {key: combined[key] for key in recentes}
 
-    with open(SETTINGS_FILE_PATH, 'w') as file:
-        json.dump(current_settings, file, indent=4)  # type: ignore
+    last_check = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_catalog(combined, last_check)
 
-    print("settings.json atualizado com novos registros e metadata.")
-    print(f"Última verificação: {current_settings['rfb_last_check']}")
+    print("Catálogo atualizado com novos registros e metadata.")
+    print(f"Última verificação: {last_check}")
 
 
-def atualizar_rfb_data(manual: bool = False) -> bool:
+async def atualizar_rfb_data(manual: bool = False, session: Optional[aiohttp.ClientSession] = None) -> bool:
 
     """
     Atualiza dados da RFB:
       - Se manual=True, força a atualização e mostra "Aguarde..." no início.
-      - Se manual=False, só atualiza se tiver passado mais de 1h da última verificação.
+      - Se manual=False, só atualiza se tiver passado TIME_CHECK_INTERVAL desde a última verificação.
 
     Retorna True se a atualização rodou, False caso tenha sido pulada.
     """
 
-    # Se não for manual, verifica intervalo de 1h
+    # Se não for manual, verifica o intervalo mínimo entre verificações
     if not manual:
-        settings = load_settings()
-        last_check = settings.get("rfb_last_check")
+        last_check = load_catalog().get("rfb_last_check")
         if last_check:
             try:
                 last_time = datetime.datetime.strptime(last_check, "%Y-%m-%d %H:%M:%S")
-                diff_h = (datetime.datetime.now() - last_time).total_seconds() / TIME_CHECK_INTERVAL
-                if diff_h < 1:
-                    print(f"Última verificação há {diff_h:.2f}h. Aguardar 1 hora.")
+                elapsed = (datetime.datetime.now() - last_time).total_seconds()
+                if elapsed < TIME_CHECK_INTERVAL:
+                    print(f"Última verificação há {elapsed / 60:.1f} min. "
+                          f"Aguardar {TIME_CHECK_INTERVAL / 60:.0f} min.")
                     return False
             except (ValueError, TypeError):
-                print("Formato de data inválido, forçando atualização.")
+                log.warning("Formato de data inválido, forçando atualização.")
 
     # Executa a coleta de novos arquivos
-    novos = get_cnpj_zip_files()
+    novos = await get_cnpj_zip_files(session)
     if novos:
         update_latest_rfb_available(novos)
 
@@ -208,8 +265,10 @@ def atualizar_rfb_data(manual: bool = False) -> bool:
 
 def check_data_download(download_path: str, month_key: str, file_name: str, expected_size: int) -> bool:
     path = Path(download_path) / month_key / file_name
-    return path.exists() and path.stat().st_size == expected_size
+    # arquivos pré-alocados do download segmentado já têm o tamanho final; o journal indica se estão completos
+    journal = path.with_name(path.name + SEGMENT_JOURNAL_SUFFIX)
+    return path.exists() and path.stat().st_size == expected_size and not journal.exists()
 
 
 if __name__ == "__main__":
-    atualizar_rfb_data(manual=True)
+    asyncio.run(atualizar_rfb_data(manual=True))
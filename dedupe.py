@@ -0,0 +1,200 @@
+"""
+Deduplicação entre meses de arquivos que não mudaram.
+
+Tabelas de referência (Cnaes, Municipios, Paises...) costumam ser idênticas de
+um mês para o outro. Antes de baixar um arquivo, procura no índice local
+(manifest.py) o mesmo arquivo, com o mesmo tamanho, em outro mês e confirma
+que o conteúdo é o mesmo:
+
+- mesmo Last-Modified remoto: idêntico sem nenhuma requisição;
+- senão, compara a impressão digital do ZIP: SHA-256 do diretório central
+  (nome, tamanho e CRC-32 de cada membro) até o fim do arquivo. Do lado remoto,
+  basta um Range com os últimos TAIL_SIZE bytes.
+
+Confirmado, o arquivo é criado como reflink (btrfs, XFS) ou hardlink da cópia
+existente, sem baixar nem ocupar espaço de novo. O manifest guarda a origem
+(linked_from), de onde sai o relatório de bytes economizados.
+"""
+import os
+import sys
+import struct
+import asyncio
+import hashlib
+from typing import List, Optional, Tuple
+from settings import CHUNK_TIMEOUT, DEDUPE_LINK_MODE
+from manifest import manifest
+from retry import HTTPStatusError, classify_error
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+TAIL_SIZE = 64 * 1024 + 22  # registro final do ZIP (22 bytes) com o maior comentário possível
+MAX_CENTRAL_DIRECTORY = 16 * 1024 * 1024  # diretórios centrais maiores não são comparados
+FICLONE = 0x40049409  # ioctl do Linux para cópia por referência (reflink)
+LINK_METHODS = {'auto': ('reflink', 'hardlink'), 'reflink': ('reflink',), 'hardlink': ('hardlink',)}
+
+
+def central_directory_offset(tail: bytes, tail_start: int) -> Optional[int]:
+    """Offset, no arquivo, do diretório central; None se tail (que começa em tail_start) não tem um fim de ZIP válido."""
+    pos = tail.rfind(EOCD_SIGNATURE)
+    if pos < 0 or len(tail) - pos < 22:
+        return None
+    cd_size, cd_offset = struct.unpack('<II', tail[pos + 12:pos + 20])
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+        # ZIP64: o localizador, logo antes do registro final, aponta para o registro ZIP64
+        locator = pos - 20
+        if locator < 0 or tail[locator:locator + 4] != ZIP64_LOCATOR_SIGNATURE:
+            return None
+        (record_offset,) = struct.unpack('<Q', tail[locator + 8:locator + 16])
+        record = record_offset - tail_start
+        if record < 0 or tail[record:record + 4] != ZIP64_EOCD_SIGNATURE:
+            return None
+        (cd_offset,) = struct.unpack('<Q', tail[record + 48:record + 56])
+    return cd_offset
+
+
+def _digest(file_size: int, central_directory: bytes) -> str:
+    return hashlib.sha256(f"{file_size}:".encode() + central_directory).hexdigest()
+
+
+def local_fingerprint(path: str) -> Optional[str]:
+    """Impressão digital de um ZIP no disco (lê só o final do arquivo)."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            tail_start = max(0, size - TAIL_SIZE)
+            file.seek(tail_start)
+            cd_offset = central_directory_offset(file.read(), tail_start)
+            if cd_offset is None or cd_offset > size or size - cd_offset > MAX_CENTRAL_DIRECTORY:
+                return None
+            file.seek(cd_offset)
+            return _digest(size, file.read())
+    except OSError:
+        return None
+
+
+async def _fetch_range(session, url: str, start: int, end: int, headers: dict) -> Optional[bytes]:
+    async with session.get(url, headers={**headers, 'Range': f'bytes={start}-{end}'}) as response:
+        if response.status != 206:
+            error = HTTPStatusError(response.status, response.headers.get('Retry-After'))
+            if classify_error(error).transient:
+                raise error  # servidor sobrecarregado: conta no circuit breaker de quem chamou
+            return None  # servidor sem suporte a Range: não baixa o arquivo inteiro só para comparar
+        data = await asyncio.wait_for(response.read(), timeout=CHUNK_TIMEOUT)
+    return data if len(data) == end - start + 1 else None
+
+
+async def remote_fingerprint(session, url: str, size: int, headers: dict) -> Optional[str]:
+    """Impressão digital do ZIP remoto, a partir de um Range com o final do arquivo."""
+    tail_start = max(0, size - TAIL_SIZE)
+    tail = await _fetch_range(session, url, tail_start, size - 1, headers)
+    if tail is None:
+        return None
+    cd_offset = central_directory_offset(tail, tail_start)
+    if cd_offset is None or cd_offset > size or size - cd_offset > MAX_CENTRAL_DIRECTORY:
+        return None
+    if cd_offset < tail_start:
+        head = await _fetch_range(session, url, cd_offset, tail_start - 1, headers)
+        if head is None:
+            return None
+        tail, tail_start = head + tail, cd_offset
+    return _digest(size, tail[cd_offset - tail_start:])
+
+
+async def find_identical(session, url: str, size: int, last_modified: Optional[str],
+                         candidates: List[dict], headers: dict) -> Optional[dict]:
+    """
+    Primeira cópia local idêntica ao arquivo remoto entre os candidatos do
+    manifest (mesmo nome e tamanho em outros meses), ou None.
+    """
+    remote = None
+    for row in candidates:
+        try:
+            stat = os.stat(row['path'])
+        except FileNotFoundError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (row['size'], row['mtime']):
+            continue  # alterado fora do app depois de registrado
+        if last_modified and row['remote_last_modified'] == last_modified:
+            return row
+        local = row['fingerprint'] or local_fingerprint(row['path'])
+        if local is None:
+            continue
+        if not row['fingerprint']:
+            manifest.set_fingerprint(row['path'], local)
+        if remote is None:
+            remote = await remote_fingerprint(session, url, size, headers)
+            if remote is None:
+                return None
+        if local == remote:
+            return {**row, 'fingerprint': local}
+    return None
+
+
+def _reflink(source: str, dest: str):
+    if not sys.platform.startswith('linux'):
+        raise OSError("reflink indisponível neste sistema")
+    import fcntl
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source: str, dest: str, mode: str = DEDUPE_LINK_MODE) -> Optional[str]:
+    """
+    Cria (ou substitui) dest como cópia sem dados de source. Retorna o método
+    usado ('reflink' ou 'hardlink'), ou None se o sistema de arquivos não permitir.
+    """
+    tmp_path = dest + '.dedupe'
+    for method in LINK_METHODS.get(mode, LINK_METHODS['auto']):
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if method == 'reflink':
+                _reflink(source, tmp_path)
+            else:
+                os.link(source, tmp_path)
+            os.replace(tmp_path, dest)
+            return method
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return None
+
+
+def dedupe_existing(download_path: str, apply: bool = False) -> List[Tuple[dict, dict, Optional[str]]]:
+    """
+    Procura, entre os arquivos já baixados, cópias idênticas em meses
+    diferentes. Mantém a do mês mais antigo e, com apply=True, troca as demais
+    por links para ela. Retorna [(arquivo, origem, método)]; o método é None
+    se não foi aplicado.
+    """
+    groups = {}
+    for row in manifest.snapshot(download_path).values():
+        if row['status'] in ('complete', 'verified'):
+            groups.setdefault((row['filename'], row['size']), []).append(row)
+
+    found = []
+    for rows in groups.values():
+        if len(rows) < 2:
+            continue
+        sources = {}  # impressão digital -> linha do mês mais antigo
+        for row in sorted(rows, key=lambda r: r['month_key']):
+            try:
+                stat = os.stat(row['path'])
+            except FileNotFoundError:
+                continue
+            fingerprint = row['fingerprint'] if (stat.st_size, stat.st_mtime_ns) == (row['size'], row['mtime']) else None
+            fingerprint = fingerprint or local_fingerprint(row['path'])
+            if fingerprint is None:
+                continue
+            if fingerprint != row['fingerprint']:
+                manifest.set_fingerprint(row['path'], fingerprint)
+            source = sources.setdefault(fingerprint, row)
+            if source is row or os.path.samefile(source['path'], row['path']):
+                continue
+            method = link_file(source['path'], row['path']) if apply else None
+            if method:
+                manifest.record(row['path'], source['status'], fingerprint=fingerprint, linked_from=source['path'],
+                                checked=source['status'] == 'verified')
+            found.append((row, source, method))
+    return found
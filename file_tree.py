@@ -0,0 +1,165 @@
+"""
+Modelo da árvore de arquivos da interface (meses e seus arquivos).
+
+Os nós são montados uma vez, a partir do catálogo e do índice local, e a
+ui.tree recebe a própria lista de nós: uma mudança de status de download
+altera só o ícone do arquivo e o contador e o ícone do mês dele, e a árvore é
+reenviada ao navegador sem ser recriada (a seleção e os meses abertos ficam).
+
+Os arquivos de um mês só entram na árvore quando o mês é aberto ou marcado;
+até lá, o mês tem um único filho provisório.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from data_download import DownloadTask, format_size
+from manifest import manifest
+
+PLACEHOLDER_PREFIX = 'carregando:'  # id do filho provisório: carregando:<AAAA-MM>
+
+# estado do arquivo -> (ícone, cor)
+FILE_ICONS = {
+    'verified': ('verified', 'green'),  # CRC conferido
+    'complete': ('check_circle', 'green'),  # tamanho correto
+    'corrupt': ('broken_image', 'red'),  # ZIP corrompido
+    'missing': ('error', 'red'),
+    'queued': ('hourglass_empty', 'gray'),
+    'downloading': ('cloud_download', 'blue'),
+}
+DONE_STATES = ('verified', 'complete')
+
+
+def file_state(local: Optional[dict], size: int) -> str:
+    """Estado de um arquivo a partir do registro do índice local (manifest)."""
+    if not local:
+        return 'missing'
+    if local['status'] == 'corrupt':
+        return 'corrupt'
+    if local['size'] != size:
+        return 'missing'
+    return 'verified' if local['status'] == 'verified' else 'complete'
+
+
+def task_state(task: DownloadTask) -> str:
+    """Estado exibido na árvore para o arquivo de um download."""
+    if task.status == 'queued':
+        return 'queued'
+    if task.status in ('downloading', 'verifying'):
+        return 'downloading'
+    local = manifest.get(task.dest_path)
+    if task.status == 'completed' and local is None:
+        return 'complete'  # concluído por outro caminho e ainda não registrado no índice
+    return file_state(local, task.file_size)
+
+
+def short_size(size: int) -> str:
+    formatted = format_size(round(size))
+    if '.' in formatted:
+        formatted = formatted.split('.')[0] + formatted.split(' ')[1]
+    return formatted
+
+
+class MonthNode:
+    def __init__(self, month_key: str, files: List[dict]):
+        self.month_key = month_key
+        self.files = files  # entradas do catálogo
+        self.states: Dict[str, str] = {}  # nome do arquivo -> estado
+        self.file_nodes: Dict[str, dict] = {}  # nome do arquivo -> nó (após carregar)
+        self.total_gb = sum(int(item.get('size', 0)) for item in files) / (1024 ** 3)
+        self.node = {
+            'id': month_key,
+            'children': [{'id': PLACEHOLDER_PREFIX + month_key, 'label': 'Carregando...'}] if files else [],
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.file_nodes) or not self.files
+
+    def refresh(self):
+        """Recalcula o rótulo e o ícone do mês a partir dos estados dos arquivos."""
+        found = sum(1 for state in self.states.values() if state in DONE_STATES)
+        display = datetime.strptime(self.month_key, '%Y-%m').strftime('%m/%Y')
+        self.node['label'] = f"{display} ({self.total_gb:.2f} GB, {found}/{len(self.files)})"
+        self.node['icon'], self.node['iconColor'] = ('check_circle', 'green') if found == len(self.files) else \
+                                                    ('cancel', 'red') if found == 0 else \
+                                                    ('warning', 'orange')
+
+
+class FileTree:
+    def __init__(self):
+        self.nodes: List[dict] = []  # lista entregue à ui.tree e alterada no lugar
+        self.months: Dict[str, MonthNode] = {}
+        self.files: Dict[str, dict] = {}  # id do nó -> dados do arquivo para o download
+        self.dirty = False  # há alterações ainda não enviadas ao navegador
+
+    def load(self, rfb_data: dict, local_files: dict):
+        """Monta os nós dos meses. local_files vem de manifest.snapshot."""
+        self.nodes.clear()
+        self.months.clear()
+        self.files.clear()
+        for month_key in sorted(rfb_data.keys(), key=lambda x: datetime.strptime(x, '%Y-%m'), reverse=True):
+            month = self.months[month_key] = MonthNode(month_key, rfb_data[month_key])
+            for file in month.files:
+                size = int(file['size'])
+                month.states[file['name']] = file_state(local_files.get((month_key, file['name'])), size)
+                self.files[file['id']] = {
+                    'download_link': file['download_link'],
+                    'month_key': month_key,
+                    'filename': file['name'],
+                    'size': size,
+                    'last_modified': file.get('last_modified')
+                }
+            month.refresh()
+            self.nodes.append(month.node)
+        self.dirty = False
+
+    def _file_node(self, month: MonthNode, file: dict) -> dict:
+        icon, icon_color = FILE_ICONS[month.states[file['name']]]
+        return {
+            'id': file['id'],
+            'label': f"{file['name']} ({short_size(int(file['size']))})",
+            'icon': icon,
+            'iconColor': icon_color
+        }
+
+    def expand(self, month_key: str) -> bool:
+        """Cria os nós dos arquivos do mês. Retorna True se a árvore mudou."""
+        month = self.months.get(month_key)
+        if month is None or month.loaded:
+            return False
+        children = []
+        for file in month.files:
+            node = month.file_nodes[file['name']] = self._file_node(month, file)
+            children.append(node)
+        month.node['children'] = children
+        self.dirty = True
+        return True
+
+    def resolve_ticked(self, ticked: List[str]) -> List[str]:
+        """
+        Troca o filho provisório marcado (mês marcado antes de ser aberto) pelos
+        arquivos do mês, carregando-os.
+        """
+        resolved = []
+        for node_id in ticked:
+            if not node_id.startswith(PLACEHOLDER_PREFIX):
+                resolved.append(node_id)
+                continue
+            month_key = node_id[len(PLACEHOLDER_PREFIX):]
+            self.expand(month_key)
+            month = self.months.get(month_key)
+            if month:
+                resolved.extend(file['id'] for file in month.files)
+        return list(dict.fromkeys(resolved))
+
+    def set_state(self, month_key: str, filename: str, state: str) -> bool:
+        """Atualiza o ícone do arquivo e o contador do mês. Retorna True se algo mudou."""
+        month = self.months.get(month_key)
+        if month is None or month.states.get(filename, state) == state:
+            return False
+        month.states[filename] = state
+        node = month.file_nodes.get(filename)
+        if node is not None:
+            node['icon'], node['iconColor'] = FILE_ICONS[state]
+        month.refresh()
+        self.dirty = True
+        return True
@@ -0,0 +1,135 @@
+"""
+Gravação dos downloads em disco com buffers reutilizáveis.
+
+Cada download copia os pedaços recebidos pela conexão (sem cópia intermediária:
+o aiohttp os entrega como chegaram do socket) para um buffer pré-alocado e, quando
+ele enche, grava o buffer inteiro numa escrita posicional (os.pwrite) no pool
+de threads: uma ida ao executor a cada WRITE_BUFFER_SIZE bytes, e não a cada
+chunk. Enquanto um buffer é gravado, o download já preenche o próximo.
+
+Os buffers vêm de um pool do DownloadManager limitado a WRITE_BUFFER_BUDGET
+bytes e são reaproveitados entre downloads: a memória não cresce com o número
+de downloads simultâneos (fora do pool, cada conexão guarda só o buffer de
+leitura do aiohttp, que pausa o socket quando enche). Com o pool esgotado, o download aguarda um buffer
+livre (e a leitura da rede para junto).
+"""
+import os
+import asyncio
+from typing import Callable, List, Optional
+from settings import WRITE_BUFFER_SIZE, WRITE_BUFFER_BUDGET
+
+HAS_PWRITE = hasattr(os, 'pwrite')  # ausente no Windows
+OPEN_FLAGS = os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+
+
+def write_at(fd: int, data: memoryview, offset: int):
+    """Grava data inteira a partir de offset (executado no pool de threads)."""
+    while data:
+        if HAS_PWRITE:
+            written = os.pwrite(fd, data, offset)
+        else:
+            # cada FileWriter tem o próprio descritor e no máximo uma escrita pendente
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+        data = data[written:]
+        offset += written
+
+
+class BufferPool:
+    def __init__(self, budget: int = WRITE_BUFFER_BUDGET, buffer_size: int = WRITE_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.capacity = max(1, budget // buffer_size)
+        self._free: List[bytearray] = []  # buffers já alocados e devolvidos
+        self._semaphore: Optional[asyncio.Semaphore] = None  # criado dentro do event loop
+        self.in_use = 0
+
+    def _sem(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.capacity)
+        return self._semaphore
+
+    async def acquire(self) -> bytearray:
+        await self._sem().acquire()
+        self.in_use += 1
+        return self._free.pop() if self._free else bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray):
+        self._free.append(buffer)
+        self.in_use -= 1
+        self._sem().release()
+
+
+class FileWriter:
+    """
+    Grava uma sequência contígua de bytes a partir de offset. Mantém no máximo
+    uma escrita pendente, e on_written(n) só é chamado depois que os n bytes
+    estão no arquivo (o journal de segmentos depende disso).
+    """
+
+    def __init__(self, pool: BufferPool, path: str, offset: int, truncate: bool = False,
+                 on_written: Optional[Callable[[int], None]] = None):
+        self.pool = pool
+        self.offset = offset  # posição, no arquivo, do início do buffer atual
+        self.on_written = on_written
+        self.fd = os.open(path, OPEN_FLAGS | os.O_CREAT | (os.O_TRUNC if truncate else 0), 0o666)
+        self._buffer: Optional[bytearray] = None
+        self._filled = 0
+        self._pending: Optional[asyncio.Future] = None
+        self._pending_size = 0
+
+    async def write(self, data: bytes):
+        data = memoryview(data)
+        while data:
+            if self._buffer is None:
+                self._buffer = await self.pool.acquire()
+            size = min(len(data), len(self._buffer) - self._filled)
+            self._buffer[self._filled:self._filled + size] = data[:size]
+            self._filled += size
+            data = data[size:]
+            if self._filled == len(self._buffer):
+                await self._submit()
+
+    async def _submit(self):
+        await self._wait_pending()
+        buffer, filled, offset = self._buffer, self._filled, self.offset
+        self._buffer, self._filled = None, 0
+        self.offset += filled
+        future = asyncio.get_running_loop().run_in_executor(None, write_at, self.fd, memoryview(buffer)[:filled], offset)
+        # o buffer só volta ao pool quando a thread termina, mesmo que o download seja cancelado antes
+        future.add_done_callback(lambda f: self._written(f, buffer))
+        self._pending, self._pending_size = future, filled
+
+    def _written(self, future: asyncio.Future, buffer: bytearray):
+        self.pool.release(buffer)
+        if not future.cancelled():
+            future.exception()  # a falha é tratada por quem aguarda _wait_pending
+
+    async def _wait_pending(self):
+        if self._pending is None:
+            return
+        future, size = self._pending, self._pending_size
+        await asyncio.shield(future)
+        self._pending = None
+        if self.on_written:
+            self.on_written(size)
+
+    async def close(self, discard: bool = False):
+        """
+        Grava o que restou no buffer e fecha o arquivo. Com discard (o arquivo
+        passou a ser de outro nó), o buffer é descartado e on_written não é mais
+        chamado; uma escrita já em andamento só termina antes do fechamento.
+        """
+        try:
+            if not discard:
+                if self._filled:
+                    await self._submit()
+                await self._wait_pending()
+        finally:
+            if self._buffer is not None:
+                self.pool.release(self._buffer)
+                self._buffer = None
+            fd = self.fd
+            if self._pending is not None and not self._pending.done():
+                self._pending.add_done_callback(lambda f: os.close(fd))
+            else:
+                os.close(fd)
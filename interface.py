@@ -1,17 +1,21 @@
+import sys
 import asyncio
-from nicegui import ui, run
-from datetime import datetime
-from settings import load_settings, save_settings, restore_default_settings
-from folder_picker import LocalFolderPicker
-from data_rfb import atualizar_rfb_data, check_data_download
-from data_download import download_manager, format_size
+from nicegui import app, ui, run
+from settings import (load_settings, load_catalog, save_settings, restore_default_settings, UI_REFRESH_INTERVAL,
+                      RESUME_QUEUE_ON_STARTUP)
+from manifest import manifest
+from metrics import registry
+from fastapi.responses import PlainTextResponse
 
 
 def render_layout(content_function):
+    # imports tardios: aiohttp e o gerenciador de downloads só carregam ao abrir a página, não na inicialização
+    from data_download import download_manager
     settings = load_settings()
     drawer = None
 
     async def pick_folder() -> None:
+        from folder_picker import LocalFolderPicker
         folder = await LocalFolderPicker('~')
         if folder is not None:
             folder_ui.value = folder
@@ -50,20 +54,33 @@ def render_layout(content_function):
                         value=settings.get("rfb_url", ""),
                     ).classes('w-full').props('rows=3 dense outlined')
 
+                with ui.card().classes('w-full'):
+                    ui.label("Outras fontes (opcional, uma por linha):").classes('font-bold')
+                    sources_ui = ui.textarea(
+                        placeholder="http://maquina:8090/",
+                        value="\n".join(settings.get("sources", [])),
+                    ).classes('w-full').props('rows=3 dense outlined')
+
             with ui.column().classes('w-full'):
                 with ui.row().classes('w-full gap-2 flex flex-nowrap'):
                     ui.button('Salvar', icon='save', color='primary',
-                              on_click=lambda: save_settings(folder_ui.value, url_ui.value)) \
+                              on_click=lambda: save_and_notify()) \
                         .props('size="md"').classes('flex-grow')
                     ui.button(icon='settings_backup_restore', color='green',
                               on_click=lambda: set_default_settings()) \
                         .props('size="md"').classes('flex-shrink-0')
 
+                    def save_and_notify():
+                        save_settings(folder_ui.value, url_ui.value, sources_ui.value.splitlines())
+                        ui.notify("Configurações salvas!", type='positive')
+
                     def set_default_settings():
-                        restore_default_settings(notify=True)
+                        restore_default_settings()
+                        ui.notify("Configurações restauradas!", type='positive')
                         new_settings = load_settings()
                         folder_ui.value = new_settings.get("download_path", "")
                         url_ui.value = new_settings.get("rfb_url", "")
+                        sources_ui.value = "\n".join(new_settings.get("sources", []))
 
 
     with ui.column().classes('w-full items-center'):
@@ -72,10 +89,13 @@ def render_layout(content_function):
 
 @ui.page('/')
 def download_page():
+    from data_download import download_manager
+    from file_tree import FileTree, task_state
+
     def content():
         ui.label('Download da Base de Dados').style('color: #00205B').classes('text-2xl font-bold')
 
-        file_map = {}
+        file_tree = FileTree()
         tree = None
         task_cards = []
 
@@ -112,60 +132,26 @@ def download_page():
                         ui.button(icon='cleaning_services', color='green', on_click=refresh_cards) \
                             .classes('flex-shrink-0')
 
+                    ui.select({'small_first': 'Menores primeiro', 'large_first': 'Maiores primeiro',
+                               'by_table': 'Por tabela (referência primeiro)', 'fifo': 'Ordem de seleção'},
+                              value=download_manager.queue_policy, label='Ordem da fila',
+                              on_change=lambda e: download_manager.set_queue_policy(e.value)) \
+                        .props('dense').classes('w-full')
+                    ui.label().classes('text-xs text-gray-500 text-center') \
+                        .bind_text_from(download_manager.concurrency, 'status_text')
+
                     download_container = ui.column().classes('space-y-1') \
                         .style('max-height: 360px; overflow-y: auto;')
 
         async def build_tree():
-            nonlocal file_map, tree
+            """Monta a árvore uma única vez; depois ela só é atualizada por update_tree."""
+            nonlocal tree
             settings = load_settings()
-            rfb_data = settings.get('rfb_available', {})
-            tree_data = []
-
-            for month_key in sorted(rfb_data.keys(), key=lambda x: datetime.strptime(x, '%Y-%m'), reverse=True):
-                files = rfb_data[month_key]
-                display_label = datetime.strptime(month_key, '%Y-%m').strftime('%m/%Y')
-                total_bytes = sum(int(item.get('size', 0)) for item in files)
-                total_gb = total_bytes / (1024 ** 3)
-                children = []
-                encontrados = 0
-
-                for file in files:
-                    size = int(file['size'])
-                    node_id = file['id']
-                    is_ok = check_data_download(settings.get("download_path", ""), month_key, file['name'], size)
-                    file_map[node_id] = {
-                        'download_link': file['download_link'],
-                        'month_key': month_key,
-                        'filename': file['name'],
-                        'size': size
-                    }
-                    if is_ok:
-                        encontrados += 1
-
-                    formatted_size = format_size(round(size))
-                    if '.' in formatted_size:
-                        formatted_size = formatted_size.split('.')[0] + formatted_size.split(' ')[1]
-                    label = f"{file['name']} ({formatted_size})"
-
-                    children.append({
-                        'id': node_id,
-                        'label': label,
-                        'icon': 'check_circle' if is_ok else 'error',
-                        'iconColor': 'green' if is_ok else 'red'
-                    })
-
-                icon, icon_color = ('check_circle', 'green') if encontrados == len(files) else \
-                                   ('cancel', 'red') if encontrados == 0 else \
-                                   ('warning', 'orange')
-                display_label = f"{display_label} ({total_gb:.2f} GB)"
-
-                tree_data.append({
-                    'id': month_key,
-                    'label': display_label,
-                    'icon': icon,
-                    'iconColor': icon_color,
-                    'children': children
-                })
+            rfb_data = load_catalog().get('rfb_available', {})
+            # estado local vem do índice (uma consulta), sem stat por arquivo
+            file_tree.load(rfb_data, manifest.snapshot(settings.get("download_path", "")))
+            for task in download_manager.tasks:
+                file_tree.set_state(task.month_key, task.filename, task_state(task))
 
             tree_card.clear()
             with tree_card:
@@ -175,13 +161,61 @@ def download_page():
                               ui.notify("Download em andamento", type='warning')
                               if download_manager.running else start_download()
                           )).classes('w-full mb-4')
-                tree = ui.tree(tree_data,
+                tree = ui.tree(file_tree.nodes,
                                label_key='label',
                                tick_strategy='leaf',
-                               on_tick=lambda e: setattr(tree, 'selected', e.value)
+                               on_tick=on_tick,
+                               on_expand=on_expand
                                ).classes('w-full text-lg border rounded-md').props('html-label').style('max-height: 360px; overflow-y: auto;')
-
-        download_manager.build_tree = build_tree
+                tree.selected = []
+            file_tree.dirty = False
+
+        def on_tick(e):
+            selected = file_tree.resolve_ticked(e.value)
+            if selected != e.value:
+                tree.tick(selected)  # mês marcado antes de aberto: marca os arquivos recém-carregados
+            tree.selected = selected
+
+        def on_expand(e):
+            # carrega os arquivos dos meses abertos pela primeira vez
+            if [month_key for month_key in e.value if file_tree.expand(month_key)]:
+                flush_tree()
+
+        def update_tree(task):
+            file_tree.set_state(task.month_key, task.filename, task_state(task))
+
+        def flush_tree():
+            # um único envio por intervalo, por mais downloads que tenham mudado de status
+            if tree is not None and file_tree.dirty:
+                file_tree.dirty = False
+                tree.update()
+
+        download_manager.update_tree = update_tree
+
+        def add_task_card(task):
+            task_cards.append(None)  # placeholder
+
+            with download_container:
+                with ui.card().classes('w-full p-3 items-stretch').style('min-width: 100%;') as card:
+                    task_cards[-1] = (card, task)
+                    with ui.row().classes('items-center gap-2'):
+                        task.ui_elements['status_icon'] = ui.icon('hourglass_empty').props('size=sm')
+                        ui.label(f"{task.filename} ({task.month_key})").classes('font-bold ml-2')
+
+                        cancel_btn = ui.button('Cancelar', icon='cancel', color='red') \
+                            .props('flat size=sm').classes('absolute top-2 right-2')
+                        task.ui_elements['cancel_btn'] = cancel_btn
+                        cancel_btn.on('click', lambda e, t=task, b=cancel_btn: (
+                            t.cancel_event.set(), b.set_visibility(False)))
+
+                    task.ui_elements['progress'] = ui.linear_progress(value=0, show_value=False,
+                                                                      color='#00205B') \
+                        .classes('w-full mt-2')
+                    with ui.row().classes('justify-between items-center mt-2'):
+                        task.ui_elements['status'] = ui.label('Na fila')
+
+            # Reaplica o status para atualizar a UI se o task já estiver concluído
+            task.set_status(task.status)
 
         async def start_download():
             download_container.clear()
@@ -192,49 +226,58 @@ def download_page():
                 return
 
             for node_id in selected_nodes:
-                info = file_map.get(node_id)
+                info = file_tree.files.get(node_id)
                 if info:
                     task = download_manager.add_task(
-                        info['download_link'], info['month_key'], info['filename'], info['size'])
-
-                    task_cards.append(None)  # placeholder
-
-                    with download_container:
-                        with ui.card().classes('w-full p-3 items-stretch').style('min-width: 100%;') as card:
-                            task_cards[-1] = (card, task)
-                            with ui.row().classes('items-center gap-2'):
-                                task.ui_elements['status_icon'] = ui.icon('hourglass_empty').props('size=sm')
-                                ui.label(f"{info['filename']} ({info['month_key']})").classes('font-bold ml-2')
-
-                                cancel_btn = ui.button('Cancelar', icon='cancel', color='red') \
-                                    .props('flat size=sm').classes('absolute top-2 right-2')
-                                task.ui_elements['cancel_btn'] = cancel_btn
-                                cancel_btn.on('click', lambda e, t=task, b=cancel_btn: (
-                                    t.cancel_event.set(), b.set_visibility(False)))
-
-                            task.ui_elements['progress'] = ui.linear_progress(value=0, show_value=False,
-                                                                              color='#00205B') \
-                                .classes('w-full mt-2')
-                            with ui.row().classes('justify-between items-center mt-2'):
-                                task.ui_elements['status'] = ui.label('Na fila')
-
-                    # Reaplica o status para atualizar a UI se o task já estiver concluído
-                    task.set_status(task.status)
+                        info['download_link'], info['month_key'], info['filename'], info['size'],
+                        last_modified=info['last_modified'])
+                    add_task_card(task)
 
             asyncio.create_task(download_manager.start_downloads())
-            await build_tree()
 
         async def load_data():
-            nonlocal spinner, loading_label
 
+            from data_rfb import atualizar_rfb_data
             await asyncio.sleep(0.1)
-            await run.io_bound(atualizar_rfb_data, False)
+            await atualizar_rfb_data(False, await download_manager.get_session())
+            # registra no índice arquivos que ainda não estão nele (ex.: baixados antes do índice existir)
+            await run.io_bound(manifest.reconcile, load_settings().get("download_path", ""),
+                               load_catalog().get('rfb_available', {}))
             with tree_card:
                 ui.notify("Informações atualizadas!", type='positive')
                 spinner.delete()
                 loading_label.delete()
             await build_tree()
 
+            # downloads pendentes da execução anterior (ou em andamento, ao recarregar a página)
+            if RESUME_QUEUE_ON_STARTUP and not download_manager.tasks:
+                download_manager.restore_queue()
+            pending = download_manager.ordered_tasks()
+            for task in pending:
+                add_task_card(task)
+            if pending and not download_manager.running:
+                with tree_card:
+                    ui.notify(f"{len(pending)} download(s) pendente(s) retomado(s)", type='info')
+                asyncio.create_task(download_manager.start_downloads())
+
         ui.timer(0.1, lambda: asyncio.create_task(load_data()), once=True)
+        ui.timer(UI_REFRESH_INTERVAL, download_manager.refresh_progress)
+        ui.timer(UI_REFRESH_INTERVAL, flush_tree)
+
+    render_layout(content)
+
+
+@app.get('/metrics')
+def metrics_endpoint():
+    # formato texto do Prometheus; ex.: curl http://127.0.0.1:<porta>/metrics
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
+async def close_downloads():
+    # encerra a sessão HTTP compartilhada dos downloads junto com o servidor (se alguma página chegou a abri-la)
+    if 'data_download' in sys.modules:
+        from data_download import download_manager
+        await download_manager.close()
+
 
-    render_layout(content)
\ No newline at end of file
+app.on_shutdown(close_downloads)
@@ -0,0 +1,195 @@
+"""
+Coordenação de vários nós que baixam para a mesma pasta compartilhada (NFS/SMB).
+
+Antes de baixar um arquivo, o nó cria <arquivo>.lease com O_EXCL, operação
+atômica também em NFS (v3 ou superior); quem não conseguir segue para o
+próximo arquivo da fila e volta a conferir depois. Enquanto baixa, o nó
+renova a lease a cada LEASE_RENEW_INTERVAL segundos e a remove ao terminar.
+Leases não renovadas por LEASE_TTL segundos (nó travado ou desligado) são
+assumidas por outro nó, que retoma o download a partir do arquivo parcial.
+
+A lease vale para o arquivo inteiro: o journal de segmentos (.parts) é de um
+único nó, então os segmentos de um arquivo são baixados pelo nó que o assumiu.
+Os relógios dos nós devem estar sincronizados (NTP), com folga bem menor que
+LEASE_TTL.
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+from metrics import events
+from logs import get_logger
+from settings import LEASE_SUFFIX, LEASE_TTL, LEASE_RENEW_INTERVAL
+
+log = get_logger(__name__)
+
+
+class LeaseHeld(Exception):
+    """O arquivo está sendo baixado por outro nó."""
+
+    def __init__(self, path: str, owner: str):
+        super().__init__(f"Em download por {owner}")
+        self.path = path
+        self.owner = owner
+
+
+class LeaseLost(LeaseHeld):
+    """A lease deste nó expirou e foi assumida por outro nó durante o download."""
+
+
+class Lease:
+    def __init__(self, path: str, owner: str):
+        self.path = path  # caminho do arquivo .lease
+        self.owner = owner
+        self.lost = False
+
+
+def read_lease(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        return {}  # sendo escrita por outro nó, ou corrompida
+
+
+def is_expired(path: str, record: Optional[dict]) -> bool:
+    if record is None:
+        return True
+    if 'expires' in record:
+        return time.time() > record['expires']
+    # conteúdo ilegível: vale a idade do arquivo
+    try:
+        return time.time() - os.path.getmtime(path) > LEASE_TTL
+    except FileNotFoundError:
+        return True
+
+
+def active_leases(download_path: str) -> List[dict]:
+    """Leases válidas na pasta de downloads (arquivos sendo baixados por algum nó)."""
+    found = []
+    if not os.path.isdir(download_path):
+        return found
+    for month in sorted(os.listdir(download_path)):
+        month_dir = os.path.join(download_path, month)
+        if not os.path.isdir(month_dir):
+            continue
+        for name in sorted(os.listdir(month_dir)):
+            if not name.endswith(LEASE_SUFFIX):
+                continue
+            path = os.path.join(month_dir, name)
+            record = read_lease(path)
+            if record is not None and not is_expired(path, record):
+                found.append({'month': month, 'file': name[:-len(LEASE_SUFFIX)], **record})
+    return found
+
+
+class LeaseManager:
+    def __init__(self, worker_id: Optional[str] = None):
+        self.host = socket.gethostname()
+        self.worker_id = worker_id or f"{self.host}-{os.getpid()}"
+        self.leases: Dict[str, Lease] = {}  # caminho do arquivo baixado -> lease
+        self._renewer: Optional[asyncio.Task] = None
+
+    def _record(self) -> dict:
+        return {
+            'owner': self.worker_id, 'host': self.host, 'pid': os.getpid(),
+            'renewed': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'expires': time.time() + LEASE_TTL,
+        }
+
+    def _write(self, lease_path: str):
+        """Regrava a lease atomicamente (arquivo temporário + rename)."""
+        tmp_path = f"{lease_path}.{self.worker_id}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self._record(), file)  # type: ignore
+        os.replace(tmp_path, lease_path)
+
+    def claim(self, dest_path: str) -> Lease:
+        """Assume o arquivo para este nó; LeaseHeld se outro nó estiver com uma lease válida."""
+        if dest_path in self.leases:
+            return self.leases[dest_path]
+        lease_path = dest_path + LEASE_SUFFIX
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            except FileExistsError:
+                record = read_lease(lease_path)
+                if not is_expired(lease_path, record):
+                    raise LeaseHeld(dest_path, (record or {}).get('owner', 'outro nó'))
+                if not self._take_over(lease_path):
+                    continue
+                events.emit('lease_taken_over', file=dest_path, previous=(record or {}).get('owner'))
+                print(f"Lease expirada de {(record or {}).get('owner', 'outro nó')} assumida: {os.path.basename(dest_path)}")
+                continue
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self._record(), file)  # type: ignore
+            lease = self.leases[dest_path] = Lease(lease_path, self.worker_id)
+            events.emit('lease_claimed', file=dest_path, owner=self.worker_id)
+            self._start_renewer()
+            return lease
+        record = read_lease(lease_path) or {}
+        raise LeaseHeld(dest_path, record.get('owner', 'outro nó'))
+
+    def _take_over(self, lease_path: str) -> bool:
+        """Remove uma lease expirada. Só um nó consegue o rename; os demais recebem FileNotFoundError."""
+        stale_path = f"{lease_path}.{self.worker_id}.stale"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return False
+        record = read_lease(stale_path)
+        if record and not is_expired(stale_path, record):
+            # renovada entre a leitura e o rename: devolve, se ninguém tiver criado outra
+            try:
+                os.link(stale_path, lease_path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        return True
+
+    def is_lost(self, dest_path: str) -> bool:
+        lease = self.leases.get(dest_path)
+        return lease is not None and lease.lost
+
+    def release(self, dest_path: str):
+        lease = self.leases.pop(dest_path, None)
+        if lease is None or lease.lost:
+            return
+        if (read_lease(lease.path) or {}).get('owner') == self.worker_id:
+            try:
+                os.remove(lease.path)
+            except FileNotFoundError:
+                pass
+
+    def renew(self):
+        for dest_path, lease in list(self.leases.items()):
+            if lease.lost:
+                continue
+            record = read_lease(lease.path)
+            # None: expirou e foi removida por outro nó, que vai criá-la de novo; {}: outro nó
+            # acabou de criá-la (a nossa é sempre regravada por rename). Só se renova a própria.
+            if not record or record.get('owner') != self.worker_id:
+                lease.lost = True
+                owner = (record or {}).get('owner', 'outro nó')
+                events.emit('lease_lost', file=dest_path, owner=owner)
+                log.warning(f"Lease perdida para {owner}: {os.path.basename(dest_path)}")
+                continue
+            try:
+                self._write(lease.path)
+            except OSError as e:
+                log.error(f"Erro ao renovar a lease de {os.path.basename(dest_path)}: {e}")
+
+    def _start_renewer(self):
+        if self._renewer is None or self._renewer.done():
+            self._renewer = asyncio.create_task(self._renew_loop())
+
+    async def _renew_loop(self):
+        while self.leases:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            self.renew()
@@ -0,0 +1,125 @@
+"""
+Interpretação das páginas de listagem de diretórios (autoindex Apache/nginx).
+
+Cada parser recebe o HTML da página e retorna uma lista de entradas:
+    { 'name': href, 'last_modified': 'YYYY-MM-DD HH:MM' ou None, 'size': bytes ou None, 'exact': bool }
+
+'exact' é False quando o tamanho veio em formato legível ("1.2G") e, portanto,
+é apenas aproximado. O parser rápido (regex) é usado primeiro; o BeautifulSoup
+fica apenas como alternativa para layouts que ele não reconhece: uma listagem
+em que algum .zip ficou sem data ou tamanho conta como não reconhecida.
+"""
+import re
+import html
+from typing import Callable, Dict, List, Optional
+from logs import get_logger
+
+log = get_logger(__name__)
+
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+MONTHS = {name: i for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+
+_DATE = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?|\d{2}-[A-Za-z]{3}-\d{4} \d{2}:\d{2}(?::\d{2})?'
+_SIZE = r'\d+(?:\.\d+)?\s?[KMGT]?i?B?|-'
+_GAP = r'(?:\s|&nbsp;|</?td[^>]*>)*'  # espaços e células de tabela (Apache com FancyIndexing em tabela)
+
+# <a href="NOME">texto</a>  DATA HORA  TAMANHO  (metadata opcional)
+_ANCHOR_RE = re.compile(
+    r'<a\s[^>]*?href\s*=\s*(?:"(?P<dq>[^"]*)"|\'(?P<sq>[^\']*)\')[^>]*>[^<]*(?:<(?!/a>)[^<]*)*</a>'
+    r'(?:' + _GAP + r'(?P<date>' + _DATE + r')' + _GAP + r'(?P<size>' + _SIZE + r'))?',
+    re.IGNORECASE
+)
+_SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s?([KMGT]?)i?B?$', re.IGNORECASE)
+
+
+def parse_size(text: Optional[str]):
+    """
+    Converte o tamanho da listagem em bytes. Retorna (bytes, exato); "1.2G" vira
+    (1288490188, False) e "-" ou texto inválido vira (None, False).
+    """
+    if not text:
+        return None, False
+    match = _SIZE_RE.match(text.strip())
+    if not match:
+        return None, False
+    number, unit = match.groups()
+    unit = unit.upper()
+    if not unit and '.' not in number:
+        return int(number), True
+    return int(float(number) * SIZE_UNITS[unit]), False
+
+
+def normalize_date(text: Optional[str]) -> Optional[str]:
+    """
+    Padroniza as datas das listagens Apache ("2025-04-13 10:21"), nginx
+    ("13-Apr-2025 10:21") e de servidores com data brasileira ("13/04/2025 10:21").
+    """
+    if not text:
+        return None
+    if text[4] == '-':  # YYYY-MM-DD HH:MM[:SS]
+        return text[:16]
+    if text[2] == '/':  # DD/MM/YYYY HH:MM[:SS]
+        return f"{text[6:10]}-{text[3:5]}-{text[:2]} {text[11:16]}"
+    month = MONTHS.get(text[3:6].lower())  # DD-Mon-YYYY HH:MM[:SS]
+    if month is None:
+        return text
+    return f"{text[7:11]}-{month:02d}-{text[:2]} {text[12:17]}"
+
+
+def _entry(href: str, date: Optional[str], size_text: Optional[str]) -> Dict:
+    size, exact = parse_size(size_text)
+    return {'name': href, 'last_modified': normalize_date(date), 'size': size, 'exact': exact}
+
+
+def parse_autoindex(page: str) -> List[Dict]:
+    """Parser rápido: uma única regex sobre o HTML do autoindex Apache/nginx."""
+    entries = []
+    for match in _ANCHOR_RE.finditer(page):
+        href = html.unescape(match.group('dq') if match.group('dq') is not None else match.group('sq'))
+        entries.append(_entry(href, match.group('date'), match.group('size')))
+    return entries
+
+
+def parse_beautifulsoup(page: str) -> List[Dict]:
+    """Parser alternativo (mais lento), baseado no texto após cada <a> da listagem."""
+    from bs4 import BeautifulSoup  # import tardio: só é necessário quando o parser rápido falha
+
+    entries = []
+    for tag in BeautifulSoup(page, 'html.parser').find_all('a'):
+        href = tag.get('href')
+        if not href:
+            continue
+        date = size = None
+        sibling = tag.next_sibling
+        if sibling and isinstance(sibling, str):
+            parts = sibling.strip().split()
+            if len(parts) >= 3:
+                date, size = f"{parts[0]} {parts[1]}", parts[2]
+        entries.append(_entry(href, date, size))
+    return entries
+
+
+# Parsers em ordem de preferência; o primeiro que reconhecer a listagem é usado
+PARSERS: List[Callable[[str], List[Dict]]] = [parse_autoindex, parse_beautifulsoup]
+
+
+def is_complete(entries: List[Dict]) -> bool:
+    """Há entradas e todos os .zip têm data e tamanho (as pastas podem vir sem tamanho, "-")."""
+    return bool(entries) and all(entry['last_modified'] and entry['size'] is not None for entry in entries
+                                 if entry['name'].lower().endswith('.zip'))
+
+
+def parse_listing(page: str) -> List[Dict]:
+    """Entradas do primeiro parser que reconhecer a página; se nenhum reconhecer, as do primeiro com entradas."""
+    partial: List[Dict] = []
+    for parser in PARSERS:
+        try:
+            entries = parser(page)
+        except Exception as e:
+            log.error(f"Erro no parser de listagem {parser.__name__}: {e}")
+            continue
+        if is_complete(entries):
+            return entries
+        partial = partial or entries
+    return partial
@@ -1,18 +1,183 @@
+"""
+Log do app em produção (logs.txt, ao lado do settings.json).
+
+O sys.stdout é trocado por um LogStream: cada linha impressa vira um registro
+INFO no logger do módulo que chamou print (downloadcnpj.data_rfb,
+downloadcnpj.data_download...), sujeito ao nível definido para ele em
+LOG_LEVELS. Avisos e erros não passam pelo print: os módulos os registram com
+log.warning/log.error no mesmo logger (get_logger), e um módulo em WARNING
+continua registrando os erros dele. Os registros entram numa fila e uma thread em segundo plano os
+grava em lotes, com um flush por lote: print nunca espera o disco, nem no
+event loop.
+
+O arquivo é mantido entre execuções e rotacionado por tamanho (LOG_MAX_BYTES)
+ou na virada do dia, guardando LOG_BACKUP_COUNT arquivos antigos
+(logs.txt.1, logs.txt.2...).
+"""
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
 from datetime import datetime
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, Optional
+from settings import LOG_LEVEL, LOG_LEVELS, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_FLUSH_INTERVAL
+
+LOGGER_NAME = 'downloadcnpj'
+LOG_FORMAT = '[%(asctime)s] %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+BATCH_SIZE = 1000  # registros gravados, no máximo, entre dois flushes
+
+
+def get_logger(module: str) -> logging.Logger:
+    """Logger do módulo (downloadcnpj.<módulo>), o mesmo que recebe os prints dele."""
+    return logging.getLogger(f"{LOGGER_NAME}.{'main' if module == '__main__' else module}")
+
+
+class RotatingLogHandler(RotatingFileHandler):
+    """Rotação por tamanho ou (com daily) na virada do dia; emit não faz flush (o LogWriter faz, por lote)."""
+
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT,
+                 daily: bool = True):
+        super().__init__(path, mode='a', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.daily = daily
+        # dia do arquivo atual: o log de uma execução anterior também é rotacionado se for de outro dia
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        self.day = datetime.fromtimestamp(mtime).date() if mtime is not None else datetime.now().date()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.daily and datetime.fromtimestamp(record.created).date() != self.day:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.day = datetime.now().date()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter:
+    """Thread que grava os registros da fila em lotes."""
+
+    def __init__(self, handler: logging.Handler, flush_interval: float = LOG_FLUSH_INTERVAL, name: str = 'log-writer'):
+        self.handler = handler
+        self.flush_interval = flush_interval
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._stop = object()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
 
-class Logger:
-    def __init__(self, file_path):
-        self.file = open(file_path, 'w', encoding='utf-8')
+    def start(self):
+        self._thread.start()
 
-    def write(self, message):
-        trimmed = message.strip()
-        if trimmed:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.file.write(f"[{timestamp}] {trimmed}\n")
-            self.file.flush()
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [record]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._stop:
+                    self.handler.flush()
+                    return
+                self.handler.handle(record)
+            self.handler.flush()
+
+    def stop(self):
+        """Grava o que ainda está na fila e encerra a thread (ao sair do app)."""
+        if self._thread.is_alive():
+            self.queue.put(self._stop)
+            self._thread.join(timeout=5)
+        self.handler.close()
+
+
+class LogStream:
+    """Substitui o sys.stdout: cada linha impressa vira um registro INFO do logger do módulo que chamou print."""
+
+    encoding = 'utf-8'
+
+    def __init__(self):
+        self._partial = threading.local()  # texto sem quebra de linha ainda, por thread
+        self._loggers: Dict[str, logging.Logger] = {}
+
+    def _logger(self, module: str) -> logging.Logger:
+        logger = self._loggers.get(module)
+        if logger is None:
+            logger = self._loggers[module] = get_logger(module)
+        return logger
+
+    def write(self, message: str) -> int:
+        partial = getattr(self._partial, 'text', '')
+        if '\n' not in message:
+            self._partial.text = partial + message
+            return len(message)
+        lines = (partial + message).split('\n')
+        self._partial.text = lines.pop()
+        frame = sys._getframe(1)  # quem chamou print (print é uma função em C, sem frame próprio)
+        logger = self._logger(frame.f_globals.get('__name__', ''))
+        if not logger.isEnabledFor(logging.INFO):
+            return len(message)
+        for line in lines:
+            trimmed = line.strip()
+            if trimmed:
+                # makeRecord + handle: sem o findCaller do logger.info, que percorre a pilha
+                logger.handle(logger.makeRecord(logger.name, logging.INFO, frame.f_code.co_filename,
+                                                frame.f_lineno, trimmed, None, None))
+        return len(message)
 
     def flush(self):
-        self.file.flush()
+        pass  # a gravação é da thread do LogWriter
 
     def isatty(self):
         return False  # comportamento esperado por sys.stdout em produção
+
+
+_writer: Optional[LogWriter] = None
+
+
+def setup_logging(log_path: str) -> LogStream:
+    """Liga o logger do app ao arquivo (via fila) e retorna o substituto do sys.stdout."""
+    global _writer
+    handler = RotatingLogHandler(log_path)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    _writer = LogWriter(handler)
+    _writer.start()
+    atexit.register(_writer.stop)
+
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False  # não duplica no logger raiz (uvicorn, NiceGUI)
+    root.addHandler(QueueHandler(_writer.queue))
+    for module, level in LOG_LEVELS.items():
+        logging.getLogger(f"{LOGGER_NAME}.{module}").setLevel(level)
+    return LogStream()
+
+
+def setup_console_logging():
+    """Sem o arquivo de log (cli.py, ENV dev): os registros do app saem no terminal, junto com os prints."""
+    root = logging.getLogger(LOGGER_NAME)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    root.addHandler(handler)
+    for module, level in LOG_LEVELS.items():
+        logging.getLogger(f"{LOGGER_NAME}.{module}").setLevel(level)
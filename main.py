@@ -1,29 +1,61 @@
 import os
+from startup import profiler, IMPORTTIME_ENV
+
+if __name__ == "__main__" and os.environ.get(IMPORTTIME_ENV):
+    profiler.start()  # mede os imports até a interface estar pronta
+
 import sys
-from settings import check_settings_file, ENV, SETTINGS_FILE_PATH
-from logs import Logger
+import multiprocessing
+from settings import check_settings_file, load_settings, ENV, LOG_PATH, MIRROR_PORT, MIRROR_HOST
 
+if __name__ == "__main__":
+    # necessário no executável empacotado: a verificação dos ZIPs usa um pool de processos
+    multiprocessing.freeze_support()
 
-if ENV != 'dev':
-    # Cria o caminho completo para o arquivo de log, ao lado do settings.json
-    log_path = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'logs.txt')
-    sys.stdout = Logger(log_path)
+# processos filhos (pool de verificação) não devem reabrir/truncar o log
+if ENV != 'dev' and multiprocessing.parent_process() is None:
+    from logs import setup_logging
+    # logs.txt ao lado do settings.json, gravado em segundo plano
+    sys.stdout = setup_logging(LOG_PATH)
+elif multiprocessing.parent_process() is None:
+    from logs import setup_console_logging
+    setup_console_logging()
 
 
 # roda sempre, mesmo em import — cria/atualiza settings.json
 check_settings_file()
 
-from nicegui import ui, native
-import interface  # noqa: F401
+
+def load_app():
+    """
+    Importa a interface (NiceGUI) e registra as páginas. Fica fora do import do
+    main.py: os processos dos pools de verificação e conversão reimportam este
+    módulo e não precisam dela.
+    """
+    import interface  # noqa: F401
+
+
+async def start_mirror():
+    from mirror import MirrorServer
+    url = await MirrorServer(load_settings().get("download_path", "")).start(MIRROR_PORT, MIRROR_HOST)
+    print(f"Modo espelho: pasta de downloads servida em {url}")
 
 # só sobe o servidor se for executado como script/entrypoint
 if __name__ == "__main__":
+    load_app()
+    from nicegui import app, ui, native
+    if profiler.running:
+        profiler.stop()
+        print(profiler.report())
+    port = native.find_open_port()
+    print(f"Métricas (Prometheus) em http://127.0.0.1:{port}/metrics")
+    if MIRROR_PORT:
+        app.on_startup(start_mirror)
     ui.run(
         native=True,
         reload=False,
-        port=native.find_open_port(),
+        port=port,
         window_size=(1024, 800),
         title='Download Base CNPJ',
         favicon='https://i.ibb.co/PZXFSDp2/icons8-baixar-16.png'
     )
-
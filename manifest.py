@@ -0,0 +1,183 @@
+"""
+Índice local (SQLite) dos arquivos baixados.
+
+Guarda, para cada arquivo, caminho, tamanho, mtime, Last-Modified remoto, o
+resultado da verificação e a impressão digital do ZIP (dedupe.py). É atualizado incrementalmente quando um download
+termina ou é verificado, e a árvore da interface é montada a partir de uma
+única consulta, sem stat por arquivo.
+
+Status: 'complete' (tamanho correto), 'verified' (CRC conferido), 'corrupt'.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from settings import MANIFEST_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    month_key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    remote_last_modified TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    checked_at TEXT,
+    parquet_path TEXT,
+    fingerprint TEXT,
+    linked_from TEXT
+);
+CREATE INDEX IF NOT EXISTS files_root_month ON files (root, month_key);
+"""
+
+# colunas adicionadas depois da primeira versão da tabela: (nome, tipo)
+MIGRATIONS = [
+    ('parquet_path', 'TEXT'),
+    ('fingerprint', 'TEXT'),
+    ('linked_from', 'TEXT'),
+]
+
+
+def split_path(path: str) -> Tuple[str, str, str]:
+    """Separa <root>/<YYYY-MM>/<arquivo> em (root, month_key, filename)."""
+    month_dir, filename = os.path.split(os.path.abspath(path))
+    root, month_key = os.path.split(month_dir)
+    return root, month_key, filename
+
+
+class Manifest:
+    def __init__(self, db_path: str = MANIFEST_DB_PATH):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(files)")}
+            for column, kind in MIGRATIONS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {kind}")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+    def record(self, path: str, status: str, remote_last_modified: Optional[str] = None,
+               error: Optional[str] = None, checked: bool = False, fingerprint: Optional[str] = None,
+               linked_from: Optional[str] = None):
+        """
+        Registra (ou atualiza) o arquivo com o tamanho/mtime atuais no disco.
+        Impressão digital e origem do link só são mantidas se o arquivo não mudou.
+        """
+        stat = os.stat(path)
+        root, month_key, filename = split_path(path)
+        checked_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S") if checked else None
+        self._execute(
+            """
+            INSERT INTO files (path, root, month_key, filename, size, mtime, remote_last_modified, status, error,
+                               checked_at, fingerprint, linked_from)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                fingerprint = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime
+                                   THEN COALESCE(excluded.fingerprint, files.fingerprint) ELSE excluded.fingerprint END,
+                linked_from = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime
+                                   THEN COALESCE(excluded.linked_from, files.linked_from) ELSE excluded.linked_from END,
+                size = excluded.size,
+                mtime = excluded.mtime,
+                remote_last_modified = COALESCE(excluded.remote_last_modified, files.remote_last_modified),
+                status = excluded.status,
+                error = excluded.error,
+                checked_at = COALESCE(excluded.checked_at, files.checked_at)
+            """,
+            (os.path.abspath(path), root, month_key, filename, stat.st_size, stat.st_mtime_ns,
+             remote_last_modified, status, error, checked_at, fingerprint, linked_from)
+        )
+
+    def set_parquet(self, path: str, parquet_path: Optional[str]):
+        self._execute("UPDATE files SET parquet_path = ? WHERE path = ?", (parquet_path, os.path.abspath(path)))
+
+    def set_fingerprint(self, path: str, fingerprint: str):
+        self._execute("UPDATE files SET fingerprint = ? WHERE path = ?", (fingerprint, os.path.abspath(path)))
+
+    def same_size(self, path: str, size: int) -> List[dict]:
+        """Arquivos completos com o mesmo nome e tamanho em outros meses da mesma pasta, do mais recente ao mais antigo."""
+        root, month_key, filename = split_path(path)
+        rows = self._execute(
+            """
+            SELECT * FROM files
+            WHERE root = ? AND filename = ? AND size = ? AND month_key != ? AND status IN ('complete', 'verified')
+            ORDER BY month_key DESC
+            """,
+            (root, filename, size, month_key)
+        )
+        return [dict(row) for row in rows]
+
+    def dedupe_report(self, download_path: str) -> List[dict]:
+        """Arquivos criados como link de outro mês e bytes economizados, por mês."""
+        rows = self._execute(
+            """
+            SELECT month_key, COUNT(*) AS files, SUM(size) AS saved FROM files
+            WHERE root = ? AND linked_from IS NOT NULL GROUP BY month_key ORDER BY month_key
+            """,
+            (os.path.abspath(download_path),)
+        )
+        return [dict(row) for row in rows]
+
+    def get(self, path: str) -> Optional[dict]:
+        rows = self._execute("SELECT * FROM files WHERE path = ?", (os.path.abspath(path),))
+        return dict(rows[0]) if rows else None
+
+    def remove(self, path: str):
+        self._execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    def snapshot(self, download_path: str) -> Dict[Tuple[str, str], dict]:
+        """Todos os arquivos registrados sob download_path, indexados por (month_key, filename)."""
+        rows = self._execute("SELECT * FROM files WHERE root = ?", (os.path.abspath(download_path),))
+        return {(row['month_key'], row['filename']): dict(row) for row in rows}
+
+    def reconcile(self, download_path: str, rfb_available: dict, full: bool = False) -> int:
+        """
+        Sincroniza o índice com o disco para os arquivos do catálogo. Por padrão só
+        consulta o disco para arquivos ainda não registrados; com full=True confere
+        todos (remove registros de arquivos apagados ou alterados).
+        Retorna o número de registros alterados.
+        """
+        # import tardio: evita importar data_rfb (aiohttp) só para o índice
+        from data_rfb import check_data_download
+
+        known = self.snapshot(download_path)
+        changes = 0
+        for month_key, files in rfb_available.items():
+            for file in files:
+                row = known.get((month_key, file['name']))
+                if row and not full:
+                    continue
+                path = os.path.join(download_path, month_key, file['name'])
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    stat = None
+
+                if row and stat and (row['size'], row['mtime']) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                if row:
+                    self.remove(path)
+                    changes += 1
+                if stat and check_data_download(download_path, month_key, file['name'], int(file['size'])):
+                    self.record(path, 'complete', remote_last_modified=file.get('last_modified'))
+                    changes += 1
+        return changes
+
+
+manifest = Manifest()
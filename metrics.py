@@ -0,0 +1,249 @@
+"""
+Métricas de operação dos downloads.
+
+Contadores e histogramas em memória, sem dependências externas, exportados no
+formato texto do Prometheus (rota /metrics da interface ou `cli.py sync
+--metricas-porta`). Os mesmos acontecimentos são gravados como eventos em
+JSON, um por linha, em EVENT_LOG_PATH.
+
+Incrementar um contador sem rótulos custa uma soma num dicionário, então as
+métricas por chunk (bytes baixados) podem ficar no laço de download.
+"""
+import sys
+import json
+import math
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from logs import LogWriter, RotatingLogHandler, get_logger
+from settings import EVENT_LOG_ENABLED, EVENT_LOG_PATH, EVENT_LOG_MAX_BYTES
+
+log = get_logger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# segundos: de 10 ms a ~17 min
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1000)
+# bytes/s: de 100 KB/s a 1 GB/s
+THROUGHPUT_BUCKETS = tuple(100 * 1024 * 2 ** i for i in range(14))
+# segundos para concluir um arquivo: de 10 s a ~5,5 h
+DURATION_BUCKETS = tuple(10 * 2 ** i for i in range(12))
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + ''.join(line + '\n' for line in self.samples())
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels) if labels else ()
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """Valor lido no momento da exportação (ex.: limite atual de downloads)."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.read())}"]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, list] = {}  # [contagens por bucket, soma, total]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels) if labels else ()
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        return ''.join(metric.render() for metric in self.metrics)
+
+
+class EventFileHandler(RotatingLogHandler):
+    """Uma linha JSON por registro; só rotaciona por tamanho, e uma falha de gravação vai para o log do app."""
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__(path, max_bytes=max_bytes, backup_count=1, daily=False)
+        self.setFormatter(logging.Formatter('%(message)s'))
+
+    def handleError(self, record: logging.LogRecord):
+        log.error(f"Erro ao gravar evento em {self.baseFilename}: {sys.exc_info()[1]}")
+
+
+class EventLog:
+    """
+    Eventos em JSON, um por linha. Ao passar de max_bytes, o arquivo atual vira
+    <arquivo>.1. emit só enfileira a linha: a gravação é de uma thread própria
+    (logs.LogWriter), em lotes e com um flush por lote, fora do event loop.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, max_bytes: int = EVENT_LOG_MAX_BYTES):
+        self._path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._writer: Optional[LogWriter] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @path.setter
+    def path(self, path: str):
+        # grava o que já está na fila no arquivo antigo; o próximo evento abre o novo
+        self.close()
+        self._path = path
+
+    def _start(self) -> LogWriter:
+        with self._lock:
+            if self._writer is None:
+                self._writer = LogWriter(EventFileHandler(self._path, self.max_bytes), name='event-writer')
+                self._writer.start()
+                atexit.register(self._writer.stop)
+            return self._writer
+
+    def emit(self, event: str, **fields):
+        if not self.enabled:
+            return
+        record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        writer = self._writer or self._start()
+        writer.queue.put(logging.makeLogRecord({'msg': line, 'levelno': logging.INFO, 'levelname': 'INFO'}))
+
+    def close(self):
+        """Grava os eventos ainda na fila e fecha o arquivo."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop()
+            atexit.unregister(writer.stop)
+
+
+registry = Registry()
+events = EventLog(EVENT_LOG_PATH, enabled=EVENT_LOG_ENABLED)
+
+DOWNLOADED_BYTES = registry.register(Counter(
+    'cnpj_downloaded_bytes_total', 'Bytes gravados pelos downloads.'))
+DOWNLOADS_FINISHED = registry.register(Counter(
+    'cnpj_downloads_total', 'Downloads encerrados, por resultado.', ['result']))
+RETRIES = registry.register(Counter(
+    'cnpj_download_retries_total', 'Novas tentativas de download, por causa.', ['cause']))
+TASK_THROUGHPUT = registry.register(Histogram(
+    'cnpj_download_throughput_bytes_per_second', 'Vazão média de cada download concluído.', THROUGHPUT_BUCKETS))
+TIME_TO_COMPLETE = registry.register(Histogram(
+    'cnpj_download_duration_seconds', 'Tempo do início à conclusão de cada download.', DURATION_BUCKETS))
+SLOT_WAIT = registry.register(Histogram(
+    'cnpj_download_slot_wait_seconds', 'Espera por uma vaga de download simultâneo.', TIME_BUCKETS))
+TIME_TO_FIRST_BYTE = registry.register(Histogram(
+    'cnpj_download_time_to_first_byte_seconds', 'Tempo entre a requisição e o primeiro chunk recebido.',
+    TIME_BUCKETS, ['mode']))
+DEDUPED_BYTES = registry.register(Counter(
+    'cnpj_dedupe_saved_bytes_total', 'Bytes não baixados por reaproveitar arquivos idênticos de outros meses.'))
+SOURCE_FAILOVERS = registry.register(Counter(
+    'cnpj_source_failovers_total', 'Downloads que passaram para outra fonte, por motivo.', ['reason']))
+CRAWL_DURATION = registry.register(Histogram(
+    'cnpj_listing_crawl_duration_seconds', 'Duração da varredura das listagens do portal da RFB.', TIME_BUCKETS))
+
+
+def register_gauge(name: str, documentation: str, read: Callable[[], float]) -> Optional[Gauge]:
+    """Registra um gauge uma única vez (leituras de estado do DownloadManager)."""
+    if any(metric.name == name for metric in registry.metrics):
+        return None
+    return registry.register(Gauge(name, documentation, read))
+
+
+async def serve_metrics(port: int, host: str = '127.0.0.1'):
+    """Servidor HTTP mínimo com a rota /metrics, para o modo sem interface (cli.py)."""
+    from aiohttp import web  # import tardio: só o cli.py usa
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
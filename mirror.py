@@ -0,0 +1,124 @@
+"""
+Modo espelho: serve a pasta de downloads para outras máquinas da rede local.
+
+As listagens imitam o autoindex do Apache usado pela RFB (a raiz com as pastas
+AAAA-MM/ e, em cada pasta, os ZIPs com data e tamanho exato em bytes), então
+o listing_parser e o DownloadManager funcionam sem mudanças contra o espelho.
+Os arquivos saem pela FileResponse do aiohttp, com Range, ETag e
+Last-Modified: os outros nós retomam downloads e usam o modo segmentado.
+
+Só são servidos os arquivos completos segundo o índice local (manifest.py);
+downloads em andamento, ou com journal de segmentos, respondem 404, e o
+cliente recorre à RFB.
+
+Uso no outro nó: configure a URL do espelho como "URL Receita Federal" (toda a
+rede passa pelo espelho) ou em "Outras fontes" (o catálogo continua vindo da
+RFB, e cada download usa o espelho quando ele tem o arquivo e é o mais rápido;
+veja sources.py).
+"""
+import os
+import re
+import html
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional
+from aiohttp import web
+from manifest import manifest
+from settings import SEGMENT_JOURNAL_SUFFIX, MIRROR_HOST
+
+MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+SERVE_CHUNK_SIZE = 1024 * 1024  # bytes enviados por vez pela FileResponse
+
+
+def listing_row(href: str, mtime: float, size_text: str) -> str:
+    name = html.escape(href, quote=True)
+    date = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
+    return f'<a href="{name}">{name}</a>{" " * max(1, 50 - len(href))}{date}  {size_text:>14}\n'
+
+
+def listing_page(title: str, rows: List[str]) -> str:
+    return (f'<html><head><title>Index of {title}</title></head><body><h1>Index of {title}</h1>'
+            f'<pre>Name{" " * 47}Last modified     {"Size":>14}<hr>{"".join(rows)}<hr></pre></body></html>')
+
+
+class MirrorServer:
+    def __init__(self, download_path: str):
+        self.download_path = os.path.abspath(download_path)
+        self.url = ''
+        self._runner: Optional[web.AppRunner] = None
+
+    def _servable(self, row: dict) -> Optional[os.stat_result]:
+        """stat do arquivo, se ele estiver completo no índice e no disco."""
+        if row['status'] not in ('complete', 'verified') or not MONTH_RE.match(row['month_key']):
+            return None
+        path = os.path.join(self.download_path, row['month_key'], row['filename'])
+        if os.path.exists(path + SEGMENT_JOURNAL_SUFFIX):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat if stat.st_size == row['size'] else None
+
+    def available(self) -> Dict[str, Dict[str, os.stat_result]]:
+        """Arquivos completos por mês, conferidos com o disco a cada listagem."""
+        files: Dict[str, Dict[str, os.stat_result]] = {}
+        for (month_key, filename), row in manifest.snapshot(self.download_path).items():
+            stat = self._servable(row)
+            if stat is not None:
+                files.setdefault(month_key, {})[filename] = stat
+        return files
+
+    async def _available(self) -> Dict[str, Dict[str, os.stat_result]]:
+        # índice e stat de todos os arquivos fora do event loop: os downloads servidos continuam fluindo
+        return await asyncio.get_running_loop().run_in_executor(None, self.available)
+
+    # --- handlers ---
+
+    @staticmethod
+    def _html(request: web.Request, body: str) -> web.Response:
+        etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:16] + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=body, content_type='text/html', headers={'ETag': etag})
+
+    async def root(self, request: web.Request) -> web.Response:
+        rows = []
+        for month_key, files in sorted((await self._available()).items()):
+            newest = max(stat.st_mtime for stat in files.values())
+            rows.append(listing_row(f'{month_key}/', newest, '-'))
+        return self._html(request, listing_page('/', rows))
+
+    async def month(self, request: web.Request) -> web.Response:
+        files = (await self._available()).get(request.match_info['month'])
+        if not files:
+            raise web.HTTPNotFound()
+        rows = [listing_row(name, stat.st_mtime, str(stat.st_size)) for name, stat in sorted(files.items())]
+        return self._html(request, listing_page(f"/{request.match_info['month']}", rows))
+
+    async def file(self, request: web.Request) -> web.StreamResponse:
+        # só o arquivo pedido: cada segmento de um download é uma requisição
+        path = os.path.join(self.download_path, request.match_info['month'], request.match_info['name'])
+        row = manifest.get(path)
+        if row is None or self._servable(row) is None:
+            raise web.HTTPNotFound()
+        return web.FileResponse(path, chunk_size=SERVE_CHUNK_SIZE)
+
+    # --- ciclo de vida ---
+
+    async def start(self, port: int, host: str = MIRROR_HOST) -> str:
+        app = web.Application()
+        app.router.add_get('/', self.root)
+        app.router.add_get(r'/{month:\d{4}-\d{2}}/', self.month)
+        app.router.add_get(r'/{month:\d{4}-\d{2}}/{name:[^/]+}', self.file)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.url = f"http://{host}:{port}/"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,174 @@
+"""
+Política de novas tentativas dos downloads.
+
+- Classifica cada falha como transitória (timeout, conexão, HTTP 408/425/429/5xx)
+  ou permanente (demais 4xx, conteúdo que não é ZIP), que não é repetida.
+- Espera entre tentativas com backoff exponencial e jitter ("full jitter"),
+  respeitando o cabeçalho Retry-After quando o servidor o envia.
+- Um circuit breaker por host: após falhas transitórias seguidas, todos os
+  downloads daquele host aguardam juntos; depois do intervalo, uma única
+  requisição de teste decide se o circuito fecha ou volta a abrir.
+"""
+import time
+import random
+import asyncio
+import aiohttp
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+from metrics import events
+from logs import get_logger
+from settings import (RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_AFTER_MAX, BREAKER_FAILURE_THRESHOLD,
+                      BREAKER_COOLDOWN, BREAKER_MAX_COOLDOWN, CHUNK_TIMEOUT)
+
+log = get_logger(__name__)
+
+TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+HALF_OPEN_POLL = 1  # segundos entre checagens enquanto a requisição de teste não termina
+
+
+class HTTPStatusError(aiohttp.ClientError):
+    """Resposta com status inesperado; guarda o Retry-After, se houver."""
+
+    def __init__(self, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = parse_retry_after(retry_after)
+
+
+class PermanentDownloadError(aiohttp.ClientError):
+    """Falha que não se resolve tentando de novo (ex.: conteúdo que não é ZIP)."""
+
+
+class RemoteFileChanged(aiohttp.ClientPayloadError):
+    """O arquivo mudou no servidor (If-Range recusado): a parte já baixada é de outra versão."""
+
+
+class Failure(NamedTuple):
+    transient: bool
+    retry_after: Optional[float]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After em segundos ("120") ou data HTTP; None se ausente ou inválido."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_MAX)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return min(max(0.0, (when - datetime.now(timezone.utc)).total_seconds()), RETRY_AFTER_MAX)
+
+
+def classify_error(error: BaseException) -> Failure:
+    if isinstance(error, HTTPStatusError):
+        transient = error.status in TRANSIENT_STATUS or error.status >= 500
+        return Failure(transient, error.retry_after)
+    if isinstance(error, PermanentDownloadError):
+        return Failure(False, None)
+    # timeouts, quedas de conexão e respostas truncadas
+    return Failure(True, None)
+
+
+def error_cause(error: BaseException) -> str:
+    """Rótulo curto da causa da falha, usado nas métricas e no log de eventos."""
+    if isinstance(error, HTTPStatusError):
+        return f"http_{error.status}"
+    if isinstance(error, PermanentDownloadError):
+        return "content"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, RemoteFileChanged):
+        return "changed"
+    if isinstance(error, aiohttp.ClientPayloadError):
+        return "payload"
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return "connection"
+    return "other"
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Espera antes da tentativa attempt (1, 2, ...): Retry-After ou exponencial com jitter."""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(RETRY_BASE_DELAY, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = 'closed'  # closed, open, half_open
+        self.failures = 0
+        self.open_until = 0.0
+        self._cooldown = cooldown
+        self._probe_started: Optional[float] = None
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == 'closed'
+
+    async def before_request(self):
+        """Aguarda enquanto o circuito estiver aberto; no meio-aberto, libera só a requisição de teste."""
+        while True:
+            now = time.monotonic()
+            if self.state == 'closed':
+                return
+            if self.state == 'open':
+                if now < self.open_until:
+                    await asyncio.sleep(self.open_until - now)
+                    continue
+                self.state = 'half_open'
+                self._probe_started = None
+            # half_open: uma requisição por vez (o teste pode ter sido cancelado sem resultado)
+            if self._probe_started is None or now - self._probe_started > CHUNK_TIMEOUT:
+                self._probe_started = now
+                return
+            await asyncio.sleep(HALF_OPEN_POLL)
+
+    def record_success(self):
+        """O servidor respondeu (mesmo que com erro permanente): fecha o circuito."""
+        if self.state != 'closed':
+            print(f"Servidor {self.host} voltou a responder; downloads retomados.")
+            events.emit('breaker_closed', host=self.host)
+        self.state = 'closed'
+        self.failures = 0
+        self._cooldown = self.base_cooldown
+        self._probe_started = None
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        self.failures += 1
+        if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+            self._trip(retry_after)
+
+    def _trip(self, retry_after: Optional[float]):
+        cooldown = retry_after if retry_after is not None else self._cooldown
+        self.state = 'open'
+        self.open_until = time.monotonic() + cooldown
+        self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+        self._probe_started = None
+        log.warning(f"Servidor {self.host} indisponível ({self.failures} falhas seguidas); "
+                    f"downloads pausados por {int(cooldown)}s.")
+        events.emit('breaker_open', host=self.host, failures=self.failures, cooldown=cooldown)
+
+
+class CircuitBreakers:
+    """Um circuit breaker por host, criado sob demanda."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(host)
+        return self._breakers[host]
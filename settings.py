@@ -1,20 +1,78 @@
 import os
 import sys
+import copy
 import json
-from nicegui import ui
+import tempfile
+import threading
 
 APP_NAME = "DownloadCNPJ"
 ENV = "dev" # dev/prod
 
 #DATA_DOWNLOAD CONSTANTS
 MAX_RETRIES = 100 # Máximo de tentativas para baixar um arquivo
+RETRY_BASE_DELAY = 2 # Espera base (em segundos) do backoff exponencial entre tentativas
+RETRY_MAX_DELAY = 120 # Espera máxima (em segundos) entre tentativas
+RETRY_AFTER_MAX = 900 # Maior Retry-After (em segundos) respeitado
+BREAKER_FAILURE_THRESHOLD = 5 # Falhas transitórias seguidas no mesmo host que pausam todos os downloads dele
+BREAKER_COOLDOWN = 30 # Pausa inicial (em segundos) do circuit breaker; dobra a cada nova falha, até BREAKER_MAX_COOLDOWN
+BREAKER_MAX_COOLDOWN = 600 # Pausa máxima (em segundos) do circuit breaker
 CHUNK_TIMEOUT = 60 # Tempo máximo para baixar um chunk de um arquivo
-MAX_CONCURRENT_DOWNLOADS = 10 # Número máximo de downloads concorrentes
-CHUNK_SIZE = 10 * 1024 * 1024  # 10 MB
+CONNECT_TIMEOUT = 30 # Tempo máximo (em segundos) para abrir uma conexão; sem limite para a duração total de um download
+MAX_CONCURRENT_DOWNLOADS = 10 # Número máximo de downloads concorrentes (teto do controle adaptativo)
+MIN_CONCURRENT_DOWNLOADS = 2 # Número mínimo de downloads concorrentes (piso do controle adaptativo)
+INITIAL_CONCURRENT_DOWNLOADS = 4 # Downloads concorrentes ao iniciar, ajustados conforme vazão e erros
+CONCURRENCY_ADJUST_INTERVAL = 15 # Janela (em segundos) avaliada a cada ajuste do número de downloads
+CONCURRENCY_ERROR_THRESHOLD = 0.1 # Fração de falhas (timeouts, erros HTTP, quedas de conexão) que faz o número de downloads cair pela metade
+SEGMENTS_PER_FILE = 4 # Conexões (faixas de bytes) simultâneas por arquivo; 1 desativa o modo segmentado
+SEGMENT_MIN_SIZE = 64 * 1024 * 1024 # Arquivos menores que isso (64 MB) são baixados em uma única conexão
+SEGMENT_JOURNAL_SUFFIX = ".parts" # Sufixo do journal de segmentos salvo ao lado do arquivo em download
+STREAM_JOURNAL_SUFFIX = ".resume" # Sufixo do arquivo com a versão (Last-Modified) de um download parcial em uma única conexão
+CONNECTION_LIMIT_PER_HOST = MAX_CONCURRENT_DOWNLOADS * SEGMENTS_PER_FILE # Conexões simultâneas por host na sessão HTTP compartilhada
+CONNECTION_LIMIT = CONNECTION_LIMIT_PER_HOST + 10 # Total de conexões abertas pela sessão HTTP compartilhada
+KEEPALIVE_TIMEOUT = 60 # Tempo (em segundos) que uma conexão ociosa fica aberta para reuso
+DNS_CACHE_TTL = 300 # Tempo (em segundos) de cache das consultas DNS
+EVENT_LOG_ENABLED = True # Grava os eventos dos downloads (início, tentativas, conclusão) em JSON, um por linha
+EVENT_LOG_MAX_BYTES = 20 * 1024 * 1024 # Tamanho máximo do log de eventos antes de rotacionar (20 MB)
+LOG_LEVEL = "INFO" # Nível do log do app (logs.txt, em produção): DEBUG, INFO, WARNING ou ERROR
+LOG_LEVELS = {} # Nível por módulo, sobrepondo LOG_LEVEL: {"data_rfb": "WARNING"} mantém só os avisos e erros do módulo
+LOG_MAX_BYTES = 10 * 1024 * 1024 # Tamanho máximo do logs.txt antes de rotacionar (10 MB); também rotaciona na virada do dia
+LOG_BACKUP_COUNT = 5 # Arquivos de log antigos mantidos (logs.txt.1 ... logs.txt.5)
+LOG_FLUSH_INTERVAL = 1.0 # Intervalo máximo (em segundos) entre uma linha impressa e sua gravação no logs.txt
+UI_REFRESH_INTERVAL = 0.25 # Intervalo (em segundos) entre atualizações do progresso na interface (4 Hz)
+SPEED_SMOOTHING = 5 # Janela (em segundos) da média móvel exponencial usada na velocidade e no tempo restante
+CHUNK_SIZE = 10 * 1024 * 1024 # Maior fatia liberada de uma vez pelo limite de banda (10 MB)
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024 # Tamanho de cada buffer de gravação; o arquivo recebe uma escrita a cada buffer cheio (4 MB)
+WRITE_BUFFER_BUDGET = 128 * 1024 * 1024 # Memória total dos buffers de gravação, compartilhada por todos os downloads (128 MB)
+BANDWIDTH_LIMIT = None # Limite global de banda em bytes/s, dividido entre os downloads (None = sem limite)
+BANDWIDTH_LIMIT_PER_TASK = None # Limite de banda de cada download em bytes/s (None = sem limite)
+BANDWIDTH_SCHEDULE = [] # Limite global por horário: [("08:00", "18:00", 20 * 1024 * 1024)]; fora das janelas vale BANDWIDTH_LIMIT
+VERIFY_DOWNLOADS = True # Verifica a integridade (diretório central e CRC-32) de cada ZIP ao concluir o download
+VERIFY_WORKERS = 2 # Processos dedicados à verificação dos ZIPs
+DEDUPE_ACROSS_MONTHS = True # Reaproveita (hardlink/reflink) arquivos idênticos já baixados em outros meses em vez de baixá-los de novo
+DEDUPE_LINK_MODE = "auto" # Como reaproveitar: auto (reflink, senão hardlink), reflink ou hardlink
+CONVERT_TO_PARQUET = False # Converte cada ZIP verificado para Parquet (requer pyarrow)
+CONVERT_WORKERS = 2 # Processos dedicados à conversão para Parquet
+PARQUET_DIR_NAME = "parquet" # Subpasta de cada mês onde os arquivos Parquet são gravados
+QUEUE_POLICY = "small_first" # Ordem da fila: small_first, large_first, by_table (tabelas de referência primeiro) ou fifo
+COORDINATED_DOWNLOADS = False # Vários nós baixando para a mesma pasta compartilhada (NFS/SMB) dividem os arquivos via leases
+LEASE_SUFFIX = ".lease" # Sufixo do arquivo de lease criado ao lado do arquivo em download
+LEASE_TTL = 120 # Segundos sem renovação após os quais a lease de um nó é considerada abandonada
+LEASE_RENEW_INTERVAL = 30 # Intervalo (em segundos) entre renovações das leases deste nó
+LEASE_POLL_INTERVAL = 15 # Intervalo (em segundos) entre consultas a arquivos em download por outro nó
+MIRROR_PORT = None # Porta em que o app serve a pasta de downloads para a rede local ao abrir (None = modo espelho desativado)
+MIRROR_HOST = "0.0.0.0" # Endereço do modo espelho; "0.0.0.0" aceita conexões de outras máquinas da rede
+DOWNLOAD_SOURCES = [] # Fontes fixas além da RFB (espelhos públicos, caches internos), com as mesmas pastas AAAA-MM; somam-se às "sources" do settings.json
+PROBE_BYTES = 256 * 1024 # Bytes pedidos (Range) a cada fonte antes de um download, para medir o tempo até o primeiro byte e a vazão
+PROBE_TIMEOUT = 10 # Tempo máximo (em segundos) da medição de cada fonte
+SOURCE_DEGRADED_RATIO = 0.25 # Fração da vazão medida abaixo da qual a fonte é considerada degradada e o download passa para a próxima
+SOURCE_DEGRADED_WINDOW = 20 # Janela (em segundos) em que a vazão do download é comparada com a medida da fonte
+RESUME_QUEUE_ON_STARTUP = True # Retoma automaticamente, ao abrir o app, os downloads pendentes da execução anterior
+STARTUP_TIME_BUDGET = 2.5 # Tempo máximo (em segundos) de inicialização a frio até a interface estar pronta, conferido por benchmarks/bench_startup.py
 
 # DATA_RFB CONSTANTS
 NUM_RECENT_MONTHS = 1 # Número de meses recentes a considerar
-TIME_CHECK_INTERVAL = 3600  # 1 hora em segundos
+CRAWL_MAX_CONCURRENCY = 10 # Requisições simultâneas (listagens e HEADs) ao varrer o portal da RFB
+TIME_CHECK_INTERVAL = 600  # 10 minutos em segundos (listagens inalteradas respondem 304 e vêm do cache)
 
 def get_settings_path():
     # dev coloca o settings no diretório do projeto
@@ -33,52 +91,152 @@ def get_settings_path():
     return os.path.join(base_dir, "settings.json")
 
 SETTINGS_FILE_PATH = get_settings_path() # Onde criar/salvar o arquivo de settings
+CATALOG_FILE_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'rfb_catalog.json') # Catálogo de arquivos disponíveis na RFB
+MANIFEST_DB_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'manifest.db') # Índice local dos arquivos baixados
+LISTING_CACHE_FILE_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'rfb_listing_cache.json') # Cache das listagens (ETag/Last-Modified)
+EVENT_LOG_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'events.jsonl') # Log de eventos (JSON lines)
+LOG_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'logs.txt') # Log do app em produção (saída do print)
+QUEUE_FILE_PATH = os.path.join(os.path.dirname(SETTINGS_FILE_PATH), 'download_queue.json') # Fila de downloads pendentes
 DEFAULT_DOWNLOAD_PATH = os.path.join(os.path.expanduser("~"), "Downloads", "DadosCNPJ") # Caminho padrão para downloads
 DEFAULT_RFB_URL = "https://arquivos.receitafederal.gov.br/dados/cnpj/dados_abertos_cnpj/" # URL dos recursos da RFB
 DEFAULT_SETTINGS = {
     "download_path": DEFAULT_DOWNLOAD_PATH,
-    "rfb_last_check": "",
     "rfb_url": DEFAULT_RFB_URL,
+    "sources": []
+} # Settings padrão (preferências do usuário)
+DEFAULT_CATALOG = {
+    "rfb_last_check": "",
     "rfb_available": {}
-} # Settings padrão
+} # Catálogo padrão (dados coletados do portal da RFB)
+DEFAULT_QUEUE = {
+    "policy": QUEUE_POLICY,
+    "items": []
+} # Fila padrão (downloads pendentes, retomados ao reiniciar)
+CATALOG_MAX_MONTHS = 24 # Número máximo de meses mantidos no catálogo; os mais antigos são descartados
+
+
+class JsonStore:
+    """
+    Arquivo JSON com cache em memória.
+
+    O conteúdo só é relido quando o mtime (ou o tamanho) do arquivo muda, e a
+    gravação é atômica: escreve num arquivo temporário e renomeia por cima do
+    original. O dicionário retornado por load() é compartilhado; para alterar,
+    use save() ou update().
+    """
+
+    def __init__(self, path: str, defaults: dict):
+        self.path = path
+        self.defaults = defaults
+        self._data = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> dict:
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return copy.deepcopy(self.defaults)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp != self._stamp:
+                with open(self.path, 'r') as file:
+                    self._data = json.load(file)
+                self._stamp = stamp
+            return self._data
+
+    def save(self, data: dict):
+        with self._lock:
+            directory = os.path.dirname(self.path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(data, file, indent=4)  # type: ignore
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            stat = os.stat(self.path)
+            self._data = data
+            self._stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def update(self, **changes) -> dict:
+        data = {**self.load(), **changes}
+        self.save(data)
+        return data
+
+
+settings_store = JsonStore(SETTINGS_FILE_PATH, DEFAULT_SETTINGS)
+catalog_store = JsonStore(CATALOG_FILE_PATH, DEFAULT_CATALOG)
+listing_cache_store = JsonStore(LISTING_CACHE_FILE_PATH, {})
+queue_store = JsonStore(QUEUE_FILE_PATH, DEFAULT_QUEUE)
+
 
 def check_settings_file():
-    if not os.path.exists(SETTINGS_FILE_PATH):
+    if not settings_store.exists():
         restore_default_settings()
         print(f"Arquivo '{SETTINGS_FILE_PATH}' criado com os settings padrão.")
 
-def restore_default_settings(notify=False):
-    current_settings = {}
-    if os.path.exists(SETTINGS_FILE_PATH):
-        with open(SETTINGS_FILE_PATH, 'r') as file:
-            current_settings = json.load(file)
+    # versões anteriores guardavam o catálogo da RFB dentro do settings.json
+    current_settings = settings_store.load()
+    legacy = {key: current_settings[key] for key in DEFAULT_CATALOG if key in current_settings}
+    if legacy:
+        if not catalog_store.exists():
+            catalog_store.save({**DEFAULT_CATALOG, **legacy})
+        settings_store.save({k: v for k, v in current_settings.items() if k not in DEFAULT_CATALOG})
+        print(f"Catálogo da RFB movido para '{CATALOG_FILE_PATH}'.")
 
-    current_settings.update(DEFAULT_SETTINGS)
+    # versões anteriores tinham um único espelho (mirror_url) em vez da lista de fontes
+    current_settings = settings_store.load()
+    if 'mirror_url' in current_settings:
+        mirror = (current_settings['mirror_url'] or '').strip()
+        sources = list(current_settings.get('sources', []))
+        if mirror and mirror not in sources:
+            sources.insert(0, mirror)
+        settings_store.save({**{k: v for k, v in current_settings.items() if k != 'mirror_url'}, 'sources': sources})
 
-    with open(SETTINGS_FILE_PATH, 'w') as file:
-        json.dump(current_settings, file, indent=4)  # type: ignore
 
-    if notify:
-        ui.notify("Configurações restauradas!", type='positive')
+def restore_default_settings():
+    settings_store.update(**DEFAULT_SETTINGS)
+    catalog_store.save(copy.deepcopy(DEFAULT_CATALOG))
+
 
 def load_settings():
-    if os.path.exists(SETTINGS_FILE_PATH):
-        with open(SETTINGS_FILE_PATH, 'r') as file:
-            return json.load(file)
-    return DEFAULT_SETTINGS
-
-def save_settings(download_path, rfb_url):
-    current_settings = {}
-    if os.path.exists(SETTINGS_FILE_PATH):
-        with open(SETTINGS_FILE_PATH, 'r') as file:
-            current_settings = json.load(file)
-
-    current_settings.update({
-        "download_path": download_path,
-        "rfb_url": rfb_url
-    })
-
-    with open(SETTINGS_FILE_PATH, 'w') as file:
-        json.dump(current_settings, file, indent=4)  # type: ignore
-
-    ui.notify("Configurações salvas!", type='positive')
+    return settings_store.load()
+
+
+def save_settings(download_path, rfb_url, sources=None):
+    changes = {'download_path': download_path, 'rfb_url': rfb_url}
+    if sources is not None:
+        changes['sources'] = [url.strip() for url in sources if url.strip()]
+    settings_store.update(**changes)
+
+
+def load_catalog():
+    return catalog_store.load()
+
+
+def save_catalog(rfb_available: dict, rfb_last_check: str):
+    catalog_store.save({"rfb_last_check": rfb_last_check, "rfb_available": rfb_available})
+
+
+def load_listing_cache():
+    return listing_cache_store.load()
+
+
+def save_listing_cache(cache: dict):
+    listing_cache_store.save(cache)
+
+
+def load_queue():
+    return queue_store.load()
+
+
+def save_queue(items: list, policy: str):
+    queue_store.save({"policy": policy, "items": items})
@@ -0,0 +1,196 @@
+"""
+Várias fontes para os mesmos arquivos: a RFB, espelhos públicos e caches
+internos (como o modo espelho deste app, mirror.py), todos com as pastas
+AAAA-MM/ da RFB.
+
+Quando o download ganha uma vaga, cada fonte recebe um Range com os primeiros
+PROBE_BYTES bytes do próprio arquivo, que mede o tempo até o primeiro byte e a
+vazão e traz o tamanho total (Content-Range) e o Last-Modified. Fontes cujo
+tamanho ou Last-Modified divergem dos da RFB (cópia de outro mês, incompleta)
+ficam de fora para aquele arquivo; as demais são ordenadas pelo tempo estimado
+para baixá-lo. A RFB sempre fica na lista, no mínimo como última opção.
+
+Durante o download, o SourceMonitor compara a vazão com a esperada para a
+fonte; abaixo de SOURCE_DEGRADED_RATIO dela por SOURCE_DEGRADED_WINDOW
+segundos, o download passa para a próxima fonte e continua de onde parou
+(Range), já que o conteúdo foi conferido.
+"""
+import math
+import time
+import asyncio
+import aiohttp
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+from metrics import events
+from settings import DOWNLOAD_SOURCES, PROBE_BYTES, PROBE_TIMEOUT, SOURCE_DEGRADED_RATIO, SOURCE_DEGRADED_WINDOW
+
+STATS_SMOOTHING = 0.5  # peso da medida mais recente na média de cada fonte
+
+
+def host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _base(url: str) -> str:
+    return url.strip().rstrip('/') + '/'
+
+
+def file_urls(settings: dict, official_url: str, month_key: str, filename: str) -> List[str]:
+    """URLs do arquivo em cada fonte: a da RFB primeiro, depois as do settings.json e de DOWNLOAD_SOURCES."""
+    urls = [official_url]
+    rfb_base = _base(settings.get('rfb_url', ''))
+    for base in [*settings.get('sources', []), *DOWNLOAD_SOURCES]:
+        if not base.strip() or _base(base) == rfb_base:
+            continue
+        url = urljoin(_base(base), f'{month_key}/{filename}')
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _http_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return parsedate_to_datetime(value) if value else None
+    except (TypeError, ValueError):
+        return None  # ex.: data da listagem ('AAAA-MM-DD HH:MM'), sem fuso
+
+
+class Probe(NamedTuple):
+    url: str
+    ttfb: Optional[float] = None  # segundos até a resposta
+    throughput: Optional[float] = None  # bytes/s do corpo
+    size: Optional[int] = None  # tamanho total do arquivo (Content-Range)
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+
+
+async def probe(session: aiohttp.ClientSession, url: str, headers: dict) -> Probe:
+    started = time.monotonic()
+    try:
+        async with session.get(url, headers={**headers, 'Range': f'bytes=0-{PROBE_BYTES - 1}'},
+                               timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as response:
+            if response.status != 206:
+                return Probe(url, error=f"HTTP {response.status}")
+            ttfb = time.monotonic() - started
+            body = await response.read()
+            elapsed = max(time.monotonic() - started - ttfb, 1e-3)
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]  # bytes 0-262143/<total>
+            return Probe(url, ttfb, len(body) / elapsed, int(total) if total.isdigit() else None,
+                         response.headers.get('Last-Modified'))
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        return Probe(url, error=str(e) or type(e).__name__)
+
+
+def reference(official: str, probes: List[Probe], size: int, last_modified: Optional[str]):
+    """(tamanho, data) de referência: os da resposta da RFB ou, se o probe dela falhou, os do catálogo."""
+    result = next((p for p in probes if p.url == official and not p.error), None)
+    if result is None:
+        return size, _http_date(last_modified)
+    return result.size or size, _http_date(result.last_modified)
+
+
+def matches(result: Probe, size: int, date: Optional[datetime]) -> bool:
+    return result.size == size and (date is None or _http_date(result.last_modified) == date)
+
+
+class SourceStats:
+    def __init__(self):
+        self.ttfb: Optional[float] = None
+        self.throughput: Optional[float] = None  # bytes/s
+
+    def update(self, ttfb: Optional[float] = None, throughput: Optional[float] = None):
+        if ttfb is not None:
+            self.ttfb = ttfb if self.ttfb is None else STATS_SMOOTHING * ttfb + (1 - STATS_SMOOTHING) * self.ttfb
+        if throughput is not None:
+            self.throughput = throughput if self.throughput is None else \
+                STATS_SMOOTHING * throughput + (1 - STATS_SMOOTHING) * self.throughput
+
+
+class SourceDegraded(Exception):
+    """A vazão da fonte atual caiu bem abaixo da esperada durante o download."""
+
+    def __init__(self, url: str, rate: float, expected: float):
+        super().__init__(f"{host(url)} caiu para {rate / 1024 ** 2:.2f} MB/s "
+                         f"(esperado {expected / 1024 ** 2:.2f} MB/s)")
+        self.url = url
+
+
+class SourceMonitor:
+    """Vazão de um download na fonte atual, medida em janelas de SOURCE_DEGRADED_WINDOW segundos."""
+
+    def __init__(self, url: str, stats: SourceStats, alternative: Optional[float]):
+        self.url = url
+        self.stats = stats
+        self.expected = stats.throughput
+        self.alternative = alternative or 0.0  # vazão esperada da próxima fonte
+        self._window_start = time.monotonic()
+        self._bytes = 0
+
+    def record(self, num_bytes: int):
+        """SourceDegraded se a janela fechou com vazão abaixo do esperado e a próxima fonte promete mais."""
+        self._bytes += num_bytes
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < SOURCE_DEGRADED_WINDOW:
+            return
+        rate = self._bytes / elapsed
+        self._window_start, self._bytes = now, 0
+        self.stats.update(throughput=rate)
+        if self.expected and rate < self.expected * SOURCE_DEGRADED_RATIO and self.alternative > rate:
+            raise SourceDegraded(self.url, rate, self.expected)
+
+
+class SourceSelector:
+    def __init__(self):
+        self.stats: Dict[str, SourceStats] = {}  # por host, acumulado entre os downloads
+
+    def _stats(self, url: str) -> SourceStats:
+        return self.stats.setdefault(host(url), SourceStats())
+
+    def estimate(self, url: str, size: int) -> float:
+        """Segundos estimados para baixar size bytes da fonte."""
+        stats = self._stats(url)
+        if not stats.throughput:
+            return math.inf
+        return (stats.ttfb or 0.0) + size / stats.throughput
+
+    async def rank(self, session: aiohttp.ClientSession, urls: List[str], size: int, last_modified: Optional[str],
+                   headers: dict, breakers) -> List[str]:
+        """
+        Fontes (urls[0] é a RFB) com o mesmo arquivo que a RFB, da mais rápida
+        para a mais lenta. Se o probe da RFB falhar, o tamanho e o Last-Modified
+        de referência são os do catálogo.
+        """
+        probes = await asyncio.gather(*(probe(session, url, headers) for url in urls
+                                        if breakers.for_url(url).is_closed))
+        return self.select(urls[0], probes, size, last_modified)
+
+    def select(self, official: str, probes: List[Probe], size: int, last_modified: Optional[str]) -> List[str]:
+        expected_size, expected_date = reference(official, probes, size, last_modified)
+        healthy = []
+        for result in probes:
+            if result.error:
+                events.emit('source_probe_failed', source=result.url, error=result.error)
+                continue
+            if not matches(result, expected_size, expected_date):
+                events.emit('source_mismatch', source=result.url, size=result.size, expected_size=expected_size,
+                            last_modified=result.last_modified)
+                continue
+            self._stats(result.url).update(result.ttfb, result.throughput)
+            healthy.append(result.url)
+
+        ranked = sorted(healthy, key=lambda url: self.estimate(url, expected_size))
+        if official not in ranked:
+            ranked.append(official)
+        events.emit('sources_ranked', file=official.rsplit('/', 1)[-1], sources=[
+            {'source': host(url), 'ttfb': self._stats(url).ttfb, 'throughput': self._stats(url).throughput}
+            for url in ranked])
+        return ranked
+
+    def monitor(self, urls: List[str]) -> Optional[SourceMonitor]:
+        """Monitor da fonte atual (urls[0]); None se não houver outra para onde ir."""
+        if len(urls) < 2:
+            return None
+        return SourceMonitor(urls[0], self._stats(urls[0]), self._stats(urls[1]).throughput)
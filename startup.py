@@ -0,0 +1,109 @@
+"""
+Tempo de inicialização: quanto custa cada import até a interface estar pronta.
+
+Equivalente embutido ao `python -X importtime`, que não existe no executável
+empacotado. Com a variável de ambiente DOWNLOADCNPJ_IMPORTTIME=1, o main.py
+mede os imports e imprime (no log, em produção) o relatório:
+
+    DOWNLOADCNPJ_IMPORTTIME=1 python main.py
+
+Como no -X importtime, cada módulo tem o tempo próprio (sem os imports que ele
+faz) e o acumulado. O benchmarks/bench_startup.py usa o mesmo medidor em
+processos novos e falha se a inicialização passar de STARTUP_TIME_BUDGET.
+
+Este módulo não importa nada do app: precisa ser o primeiro import do main.py.
+"""
+import sys
+import time
+import builtins
+import threading
+import importlib.util
+from typing import List, Optional
+
+IMPORTTIME_ENV = 'DOWNLOADCNPJ_IMPORTTIME'
+
+
+class ImportRecord:
+    __slots__ = ('name', 'depth', 'self_time', 'cumulative')
+
+    def __init__(self, name: str, depth: int, self_time: float, cumulative: float):
+        self.name = name
+        self.depth = depth  # 0: importado diretamente pelo main.py
+        self.self_time = self_time  # segundos, sem os imports feitos pelo módulo
+        self.cumulative = cumulative  # segundos, com os imports feitos pelo módulo
+
+
+class ImportProfiler:
+    """Substitui builtins.__import__ enquanto mede; só a thread que chamou start() é medida."""
+
+    def __init__(self):
+        self.records: List[ImportRecord] = []  # na ordem em que os imports terminam, como no -X importtime
+        self.elapsed: Optional[float] = None
+        self._stack: List[List[float]] = []  # [tempo dos imports filhos] de cada import em andamento
+        self._original = None
+        self._thread: Optional[int] = None
+        self._started = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._original is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.records.clear()
+        self._thread = threading.get_ident()
+        self._original = builtins.__import__
+        self._started = time.perf_counter()
+        builtins.__import__ = self._import
+
+    def stop(self):
+        if not self.running:
+            return
+        builtins.__import__ = self._original
+        self._original = None
+        self.elapsed = time.perf_counter() - self._started
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original
+        if original is None or threading.get_ident() != self._thread:
+            return (original or builtins.__import__)(name, globals, locals, fromlist, level)
+        before = len(sys.modules)
+        children = [0.0]
+        self._stack.append(children)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            if len(sys.modules) > before:  # carregou algum módulo (e não só consultou o cache)
+                if level:
+                    name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+                self.records.append(ImportRecord(name, len(self._stack), elapsed - children[0], elapsed))
+                if self._stack:
+                    self._stack[-1][0] += elapsed
+
+    def to_dict(self, top: int = 15) -> dict:
+        return {
+            'elapsed_s': round(self.elapsed or 0.0, 4),
+            'modules': len(self.records),
+            'top_level': [{'module': r.name, 'cumulative_ms': round(r.cumulative * 1000, 1)}
+                          for r in self.records if r.depth == 0],
+            'slowest': [{'module': r.name, 'self_ms': round(r.self_time * 1000, 1),
+                         'cumulative_ms': round(r.cumulative * 1000, 1)}
+                        for r in sorted(self.records, key=lambda r: r.self_time, reverse=True)[:top]],
+        }
+
+    def report(self, top: int = 15) -> str:
+        data = self.to_dict(top)
+        lines = [f"Inicialização: {data['elapsed_s']:.3f} s em imports ({data['modules']} imports que carregaram módulos)"]
+        lines.append("  Imports do main.py (acumulado):")
+        lines += [f"  {item['cumulative_ms']:>10.1f} ms  {item['module']}" for item in data['top_level']]
+        lines.append("  Módulos mais lentos (próprio / acumulado):")
+        lines += [f"  {item['self_ms']:>10.1f} ms  {item['cumulative_ms']:>10.1f} ms  {item['module']}"
+                  for item in data['slowest']]
+        return '\n'.join(lines)
+
+
+profiler = ImportProfiler()
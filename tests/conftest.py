@@ -0,0 +1,35 @@
+"""
+Fixtures compartilhadas pelos testes: o estado do app isolado numa pasta
+temporária e a RFB local (benchmarks/fake_rfb.py).
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_download import isolate_state  # noqa: E402
+from fake_rfb import FakeRFB  # noqa: E402
+
+MONTH = '2025-04'
+
+
+@pytest.fixture(autouse=True)
+def state(tmp_path):
+    """Settings, catálogo, fila, manifesto e log de eventos de cada teste ficam em tmp_path."""
+    isolate_state(str(tmp_path))
+
+
+@pytest.fixture
+def make_rfb(tmp_path):
+    """Cria a RFB local com os arquivos de layout."""
+
+    def make(layout, base_size: int = 256 * 1024, faults=None) -> FakeRFB:
+        server = FakeRFB(str(tmp_path / 'rfb'), [MONTH], base_size, layout=layout, faults=faults, human_sizes=False)
+        server.build()
+        return server
+
+    return make
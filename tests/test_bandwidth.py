@@ -0,0 +1,49 @@
+"""Token bucket e agenda do limitador de banda (bandwidth.py)."""
+import asyncio
+from datetime import datetime
+
+from bandwidth import BandwidthLimiter, TokenBucket
+
+
+def test_bucket_waits_in_proportion_to_the_debt(monkeypatch):
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr('bandwidth.time.monotonic', lambda: 100.0)
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    bucket = TokenBucket(1000)
+    asyncio.run(bucket.consume(500))
+
+    assert bucket.tokens == -500  # começa vazio: sem rajada inicial
+    assert slept == [0.5]
+
+
+def test_bucket_refills_up_to_one_second_of_traffic():
+    bucket = TokenBucket(1000)
+    bucket._refill(bucket.updated + 10)
+
+    assert bucket.tokens == 1000
+
+
+def test_lower_rate_caps_the_balance():
+    bucket = TokenBucket(1000)
+    bucket.tokens = 800
+    bucket.set_rate(200)
+
+    assert bucket.rate == 200
+    assert bucket.tokens == 200
+
+
+def test_schedule_window_across_midnight():
+    limiter = BandwidthLimiter(limit=None, per_task=None, schedule=[("22:00", "06:00", 5000)])
+
+    assert limiter.enabled
+    assert limiter.current_limit(datetime(2025, 4, 1, 23, 30)) == 5000
+    assert limiter.current_limit(datetime(2025, 4, 1, 5, 59)) == 5000
+    assert limiter.current_limit(datetime(2025, 4, 1, 12, 0)) is None
+
+
+def test_no_limit_disables_the_limiter():
+    assert not BandwidthLimiter(limit=None, per_task=None, schedule=[]).enabled
@@ -0,0 +1,74 @@
+"""Decisões AIMD do controle de downloads simultâneos (concurrency.py)."""
+import pytest
+
+import concurrency
+from concurrency import AdaptiveConcurrency
+
+
+@pytest.fixture
+def controller():
+    control = AdaptiveConcurrency(floor=2, ceiling=10, initial=4)
+    control.on_decision = lambda decision: None  # sem print no terminal
+    return control
+
+
+def end_window(control: AdaptiveConcurrency):
+    """Faz a janela atual ter durado CONCURRENCY_ADJUST_INTERVAL e aplica a decisão."""
+    control._window_start -= concurrency.CONCURRENCY_ADJUST_INTERVAL
+    control._maybe_adjust()
+
+
+def test_errors_above_threshold_halve_the_limit(controller):
+    for _ in range(8):
+        controller.record_request()
+    controller.record_error('timeout')
+    controller.record_error('http_503')
+    end_window(controller)
+
+    assert controller.limit == 2
+    decision = controller.decisions[-1]
+    assert decision['action'] == 'decrease'
+    assert '1 timeouts' in decision['reason'] and '1 erros HTTP' in decision['reason']
+
+
+def test_decrease_stops_at_the_floor(controller):
+    controller.limit = 3
+    controller.record_error('connection')
+    end_window(controller)
+
+    assert controller.limit == 2
+
+
+def test_saturated_slots_increase_by_one(controller):
+    controller.record_request()
+    controller.record_bytes(1024 * 1024)
+    controller._peak_active = controller.limit
+    end_window(controller)
+
+    assert controller.limit == 5
+    assert controller.decisions[-1]['action'] == 'increase'
+
+
+def test_increase_without_more_throughput_is_undone(controller):
+    controller._peak_active = controller.limit
+    controller.record_bytes(10 * 1024 * 1024)
+    end_window(controller)
+    controller.record_bytes(1024 * 1024)
+    end_window(controller)
+
+    assert [d['action'] for d in controller.decisions] == ['increase', 'decrease']
+    assert controller.limit == 4
+
+
+def test_idle_slots_hold_the_limit(controller):
+    controller.record_request()
+    controller.record_bytes(1024)
+    end_window(controller)
+
+    assert controller.limit == 4
+    assert not controller.decisions
+
+
+def test_invalid_bounds_are_rejected():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(floor=5, ceiling=2, initial=3)
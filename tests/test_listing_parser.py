@@ -0,0 +1,42 @@
+"""Escolha do parser de listagem (listing_parser.parse_listing)."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import listing_parser  # noqa: E402
+from listing_parser import parse_autoindex, parse_listing  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+# data brasileira, que a regex do parser rápido não reconhece
+BR_DATES = ('<html><body><pre><a href="../">../</a>\n'
+            '<a href="Cnaes.zip">Cnaes.zip</a>  13/04/2025 10:21  1234\n'
+            '<a href="Paises.zip">Paises.zip</a>  13/04/2025 10:22  5678\n'
+            '</pre></body></html>')
+
+
+def test_fast_parser_reads_apache_fixture():
+    with open(os.path.join(FIXTURES_DIR, 'apache_pre.html'), encoding='utf-8') as file:
+        page = file.read()
+    entries = parse_listing(page)
+    assert entries == parse_autoindex(page)
+    assert any(entry['name'].endswith('.zip') for entry in entries)
+
+
+def test_layout_only_the_fallback_reads():
+    assert all(entry['size'] is None for entry in parse_autoindex(BR_DATES) if entry['name'].endswith('.zip'))
+
+    entries = {entry['name']: entry for entry in parse_listing(BR_DATES)}
+
+    assert entries['Cnaes.zip']['last_modified'] == '2025-04-13 10:21'
+    assert entries['Cnaes.zip']['size'] == 1234
+    assert entries['Paises.zip']['size'] == 5678
+
+
+def test_incomplete_result_is_kept_when_no_parser_reads_the_layout(monkeypatch):
+    page = '<a href="Cnaes.zip">Cnaes.zip</a>'
+    monkeypatch.setattr(listing_parser, 'PARSERS', [parse_autoindex])
+
+    assert parse_listing(page) == [{'name': 'Cnaes.zip', 'last_modified': None, 'size': None, 'exact': False}]
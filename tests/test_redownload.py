@@ -0,0 +1,58 @@
+"""
+Arquivos já completos que voltam para a fila (ZIP corrompido ou --force) são
+baixados de novo do início, contra a RFB local (benchmarks/fake_rfb.py).
+"""
+import os
+import asyncio
+
+import pytest
+
+import settings
+from fake_rfb import FakeRFB, sha256_file
+
+MONTH = '2025-04'
+LAYOUT = [('Cnaes.zip', 1.0)]
+
+
+@pytest.fixture
+def rfb(make_rfb):
+    return make_rfb(LAYOUT)
+
+
+async def download(server: FakeRFB, download_path: str, corrupt: bool = False, force: bool = False):
+    from data_download import DownloadManager
+    from manifest import manifest
+
+    url = await server.start()
+    settings.save_settings(download_path, url)
+    manager = DownloadManager()
+    manager.dedupe = False
+    try:
+        name = LAYOUT[0][0]
+        size = os.path.getsize(server.files[(MONTH, name)])
+        task = manager.add_task(f"{url}{MONTH}/{name}", MONTH, name, size)
+        await manager.start_downloads()
+        assert task.status == 'completed'
+
+        if corrupt:
+            # mesmo tamanho, conteúdo estragado, marcado como corrompido (como faz o verify --zip)
+            with open(task.dest_path, 'r+b') as file:
+                file.seek(size // 2)
+                file.write(b'\0' * 1024)
+            manifest.record(task.dest_path, 'corrupt', error='CRC-32 inválido', checked=True)
+
+        again = manager.add_task(f"{url}{MONTH}/{name}", MONTH, name, size, force=force)
+        assert again.status == 'queued'
+        await manager.start_downloads()
+        return again
+    finally:
+        await manager.close()
+        await server.stop()
+
+
+@pytest.mark.parametrize('corrupt, force', [(True, False), (False, True)])
+def test_complete_file_is_downloaded_again(rfb, tmp_path, corrupt, force):
+    task = asyncio.run(download(rfb, str(tmp_path / 'downloads'), corrupt=corrupt, force=force))
+
+    assert task.status == 'completed'
+    assert sha256_file(task.dest_path) == sha256_file(rfb.files[(MONTH, task.filename)])
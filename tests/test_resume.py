@@ -0,0 +1,137 @@
+"""
+Retomada de downloads interrompidos, contra a RFB local (benchmarks/fake_rfb.py):
+a segunda execução pede só o que falta (Range, resposta 206) e, se o arquivo
+mudou no servidor, o If-Range faz o download recomeçar com a versão nova.
+"""
+import os
+import asyncio
+
+import pytest
+
+import retry
+import settings
+import data_download
+from fake_rfb import Faults, FakeRFB, generate_zip, sha256_file
+
+MONTH = '2025-04'
+NAME = 'Cnaes.zip'
+SIZE = 1024 * 1024
+BANDWIDTH = 2 * 1024 * 1024  # bytes/s: o download leva ~0,5 s e é interrompido no meio
+INTERRUPT_AFTER = 0.2
+
+
+@pytest.fixture
+def rfb(make_rfb):
+    return make_rfb([(NAME, 1.0)], base_size=SIZE, faults=Faults(bandwidth=BANDWIDTH))
+
+
+@pytest.fixture(params=['stream', 'segmented'])
+def mode(request, monkeypatch):
+    monkeypatch.setattr(data_download, 'SEGMENT_MIN_SIZE', 0 if request.param == 'segmented' else 10 ** 12)
+    monkeypatch.setattr(retry, 'RETRY_BASE_DELAY', 0.01)
+    return request.param
+
+
+def new_manager() -> data_download.DownloadManager:
+    manager = data_download.DownloadManager()
+    manager.dedupe = False
+    return manager
+
+
+def change_on_server(server: FakeRFB):
+    """Nova versão do arquivo, com outro conteúdo e outra data."""
+    path = server.files[(MONTH, NAME)]
+    generate_zip(path, SIZE)
+    modified = os.path.getmtime(path) + 60
+    os.utime(path, (modified, modified))
+
+
+async def interrupt_then_resume(server: FakeRFB, download_path: str, between=None) -> data_download.DownloadTask:
+    """Baixa por INTERRUPT_AFTER segundos e retoma com um novo DownloadManager, como após reiniciar o app."""
+    url = await server.start()
+    settings.save_settings(download_path, url)
+    try:
+        manager = new_manager()
+        task = manager.add_task(f"{url}{MONTH}/{NAME}", MONTH, NAME, os.path.getsize(server.files[(MONTH, NAME)]))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(manager.start_downloads(), timeout=INTERRUPT_AFTER)
+        await manager.close()
+        assert 0 < os.path.getsize(task.dest_path)
+        if between:
+            between()
+
+        manager = new_manager()
+        [task] = manager.restore_queue()
+        try:
+            await manager.start_downloads()
+        finally:
+            await manager.close()
+        return task
+    finally:
+        await server.stop()
+
+
+def test_interrupted_download_resumes_with_range(rfb, tmp_path, mode):
+    task = asyncio.run(interrupt_then_resume(rfb, str(tmp_path / 'downloads')))
+
+    assert task.status == 'completed'
+    assert sha256_file(task.dest_path) == sha256_file(rfb.files[(MONTH, NAME)])
+    assert any(start > 0 for name, start in rfb.ranges if name == NAME)  # 206 a partir do que já estava no disco
+    assert not os.path.exists(task.dest_path + settings.SEGMENT_JOURNAL_SUFFIX)
+    assert not os.path.exists(task.dest_path + settings.STREAM_JOURNAL_SUFFIX)
+
+
+def test_partial_is_tied_to_its_version(rfb, tmp_path, mode):
+    """A versão da parte baixada fica no journal: .parts (segmentado) ou .resume (uma conexão)."""
+    download_path = str(tmp_path / 'downloads')
+    suffix = settings.SEGMENT_JOURNAL_SUFFIX if mode == 'segmented' else settings.STREAM_JOURNAL_SUFFIX
+    journals = []
+
+    def check_journal():
+        journals.extend(p for p in os.listdir(os.path.join(download_path, MONTH)) if p.endswith(suffix))
+
+    task = asyncio.run(interrupt_then_resume(rfb, download_path, between=check_journal))
+
+    assert journals == [NAME + suffix]
+    assert task.status == 'completed'
+
+
+def test_changed_file_is_downloaded_again(rfb, tmp_path, mode):
+    before_change = []
+
+    def change():
+        before_change.append(len(rfb.ranges))
+        change_on_server(rfb)
+
+    task = asyncio.run(interrupt_then_resume(rfb, str(tmp_path / 'downloads'), between=change))
+
+    assert task.status == 'completed'
+    assert sha256_file(task.dest_path) == sha256_file(rfb.files[(MONTH, NAME)])
+    # nada da parte antiga é aproveitado: uma conexão recebe 200, e os segmentos recomeçam do início de cada faixa
+    fresh = {seg['start'] for seg in data_download.split_segments(task.file_size, data_download.SEGMENTS_PER_FILE)}
+    resumed = {start for name, start in rfb.ranges[before_change[0]:] if name == NAME}
+    assert resumed == (fresh if mode == 'segmented' else set())
+
+
+def test_change_between_head_and_segments_raises_remote_file_changed(rfb, tmp_path, monkeypatch):
+    """O arquivo muda depois do HEAD: os segmentos recebem 200 (If-Range recusado) e o download recomeça."""
+    monkeypatch.setattr(data_download, 'SEGMENT_MIN_SIZE', 0)
+    monkeypatch.setattr(retry, 'RETRY_BASE_DELAY', 0.01)
+    use_segments = data_download.DownloadManager._use_segments
+    changes = []
+
+    async def change_after_head(self, session, task, headers):
+        segmented = await use_segments(self, session, task, headers)
+        if not changes and os.path.exists(task.dest_path + settings.SEGMENT_JOURNAL_SUFFIX):
+            changes.append(task.filename)
+            change_on_server(rfb)
+        return segmented
+
+    monkeypatch.setattr(data_download.DownloadManager, '_use_segments', change_after_head)
+    retries = data_download.RETRIES.value(cause='changed')
+    task = asyncio.run(interrupt_then_resume(rfb, str(tmp_path / 'downloads')))
+
+    assert changes == [NAME]
+    assert task.status == 'completed'
+    assert sha256_file(task.dest_path) == sha256_file(rfb.files[(MONTH, NAME)])
+    assert data_download.RETRIES.value(cause='changed') == retries + 1
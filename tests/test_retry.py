@@ -0,0 +1,93 @@
+"""Classificação de falhas, Retry-After e circuit breaker (retry.py)."""
+import time
+import asyncio
+from email.utils import formatdate
+
+import aiohttp
+import pytest
+
+import retry
+from retry import (CircuitBreaker, HTTPStatusError, PermanentDownloadError, RemoteFileChanged,
+                   classify_error, error_cause, parse_retry_after)
+
+
+@pytest.mark.parametrize('error, transient', [
+    (HTTPStatusError(503), True),
+    (HTTPStatusError(429), True),
+    (HTTPStatusError(404), False),
+    (PermanentDownloadError("não é ZIP"), False),
+    (asyncio.TimeoutError(), True),
+    (aiohttp.ClientPayloadError("truncado"), True),
+])
+def test_classify_error(error, transient):
+    assert classify_error(error).transient is transient
+
+
+@pytest.mark.parametrize('error, cause', [
+    (HTTPStatusError(503), 'http_503'),
+    (asyncio.TimeoutError(), 'timeout'),
+    (RemoteFileChanged("mudou"), 'changed'),
+    (aiohttp.ClientPayloadError("truncado"), 'payload'),
+    (aiohttp.ServerDisconnectedError(), 'connection'),
+])
+def test_error_cause(error, cause):
+    assert error_cause(error) == cause
+
+
+def test_retry_after_in_seconds_is_capped():
+    assert parse_retry_after("30") == 30
+    assert parse_retry_after(str(retry.RETRY_AFTER_MAX * 10)) == retry.RETRY_AFTER_MAX
+
+
+def test_retry_after_http_date():
+    assert 50 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+
+
+def test_invalid_retry_after_is_ignored():
+    assert parse_retry_after("amanhã") is None
+    assert parse_retry_after(None) is None
+
+
+def test_retry_after_reaches_the_backoff():
+    assert HTTPStatusError(503, "7").retry_after == 7
+    assert retry.backoff_delay(3, retry_after=7) == 7
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker('rfb', threshold=3, cooldown=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.is_closed
+
+    breaker.record_failure(retry_after=42)
+    assert breaker.state == 'open'
+    assert 41 < breaker.open_until - time.monotonic() <= 42
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker('rfb', threshold=1, cooldown=0)
+    breaker.record_failure()
+    asyncio.run(breaker.before_request())
+
+    assert breaker.state == 'half_open'
+    assert breaker._probe_started is not None
+
+
+def test_failed_probe_reopens_with_longer_cooldown():
+    breaker = CircuitBreaker('rfb', threshold=1, cooldown=0.01, max_cooldown=1)
+    breaker.record_failure()
+    asyncio.run(breaker.before_request())
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    assert breaker._cooldown == 0.04  # dobra a cada abertura
+
+
+def test_success_closes_and_resets():
+    breaker = CircuitBreaker('rfb', threshold=1, cooldown=0.01, max_cooldown=1)
+    breaker.record_failure()
+    breaker.record_success()
+
+    assert breaker.is_closed
+    assert breaker.failures == 0
+    assert breaker._cooldown == 0.01
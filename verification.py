@@ -0,0 +1,89 @@
+"""
+Verificação de integridade dos ZIPs baixados.
+
+Valida o diretório central do ZIP e lê todos os membros até o fim, o que faz o
+zipfile conferir o CRC-32 de cada um. A leitura roda num pool de processos,
+para que vários arquivos de GBs sejam verificados em paralelo sem bloquear o
+event loop. O resultado é gravado no índice local (manifest.py), que a árvore
+de arquivos consulta.
+"""
+import os
+import zlib
+import asyncio
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from settings import VERIFY_WORKERS
+from manifest import manifest
+from dedupe import local_fingerprint
+
+VERIFY_READ_SIZE = 4 * 1024 * 1024  # bytes lidos por vez de cada membro
+
+
+def verify_zip(path: str) -> dict:
+    """
+    Executa no processo do pool. Retorna {'status': 'verified'|'corrupt', 'error', 'members', 'fingerprint'}.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            members = zf.infolist()
+            for info in members:
+                with zf.open(info) as member:
+                    # o zipfile compara o CRC-32 ao chegar no fim do membro
+                    while member.read(VERIFY_READ_SIZE):
+                        pass
+        return {'status': 'verified', 'error': None, 'members': len(members), 'fingerprint': local_fingerprint(path)}
+    except (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError) as e:
+        return {'status': 'corrupt', 'error': str(e) or type(e).__name__, 'members': None, 'fingerprint': None}
+
+
+def get_verification(path: str) -> Optional[dict]:
+    """
+    Resultado da verificação registrado no índice, ou None se o arquivo não foi
+    verificado ou mudou (tamanho/mtime) depois da verificação.
+    """
+    entry = manifest.get(path)
+    if not entry or entry['status'] not in ('verified', 'corrupt'):
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return entry
+
+
+def record_verification(path: str, result: dict):
+    manifest.record(path, result['status'], error=result['error'], checked=True, fingerprint=result['fingerprint'])
+
+
+class ZipVerifier:
+    """Pool de processos compartilhado para verificar ZIPs sem bloquear o event loop."""
+
+    def __init__(self, max_workers: int = VERIFY_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def verify(self, path: str, use_cache: bool = True) -> dict:
+        """Verifica o ZIP (reaproveitando um resultado válido do manifest) e registra o resultado."""
+        if use_cache:
+            cached = get_verification(path)
+            if cached:
+                return cached
+        result = await asyncio.get_running_loop().run_in_executor(self._pool(), verify_zip, path)
+        record_verification(path, result)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+zip_verifier = ZipVerifier()